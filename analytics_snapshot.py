@@ -0,0 +1,179 @@
+"""
+Columnar Parquet snapshot of transactions_view for the analytics engines.
+
+export_snapshot() streams the view out of SQLite once into a Parquet dataset partitioned by month
+(snapshots/transactions/month=YYYY-MM/), with the string columns dictionary-encoded. load_transactions()
+memory-maps it and pushes the column projection and the filters down to the scan, so a reader only
+touches the columns it asks for and the month partitions that can match; the result is an Arrow table
+whose dictionary columns become pandas categoricals without materializing a Python object per value.
+Prices are kept in integer cents (price_cents), as in SQLite, so sums over the snapshot are exact and
+match the SQLite aggregations to the cent.
+
+The snapshot records the data version it was exported from; readers should check snapshot_is_current()
+and fall back to SQLite when it is missing or stale (e.g. after an ingest, until the next export).
+
+    python analytics_snapshot.py        # (re)export the snapshot
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+from pyarrow import fs
+
+import schema
+
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sales_analysis.db")
+SNAPSHOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "snapshots", "transactions")
+METADATA_FILE = "_snapshot.json"
+# Bumped whenever SCHEMA changes, so snapshots written by an older version are re-exported
+SNAPSHOT_VERSION = 3
+
+# Rows fetched from SQLite per record batch, and the smallest row group written per month file
+BATCH_ROWS = 100_000
+MIN_ROWS_PER_GROUP = 100_000
+
+SCHEMA = pa.schema([
+    ("invoice_id", pa.dictionary(pa.int32(), pa.string())),
+    ("stock_code", pa.dictionary(pa.int32(), pa.string())),
+    ("description", pa.dictionary(pa.int32(), pa.string())),
+    ("quantity", pa.int64()),
+    ("invoice_date", pa.timestamp("s")),
+    ("price_cents", pa.int64()),
+    ("customer_id", pa.int64()),
+    ("country", pa.dictionary(pa.int32(), pa.string())),
+    ("month", pa.string()),
+])
+PARTITIONING = ds.partitioning(pa.schema([("month", pa.string())]), flavor="hive")
+
+# The base tables directly rather than transactions_view: invoice_ts and price_cents convert to
+# Arrow columns without formatting and re-parsing each date or rounding each price
+EXPORT_SQL = """
+    SELECT i.invoice_id, p.stock_code, p.description, ii.quantity, i.invoice_ts, ii.price_cents,
+           i.customer_id, c.country
+    FROM invoice_items ii
+    JOIN invoices i ON ii.invoice_key = i.invoice_key
+    JOIN products p ON ii.product_key = p.product_key
+    LEFT JOIN countries c ON i.country_key = c.country_key
+"""
+
+def _record_batches(cursor):
+    cursor.execute(EXPORT_SQL)
+    while True:
+        rows = cursor.fetchmany(BATCH_ROWS)
+        if not rows:
+            return
+        columns = list(zip(*rows))
+        dates = pa.array(columns[4], pa.int64()).cast(pa.timestamp("s"))
+        arrays = [pa.array(values, field.type.value_type).dictionary_encode()
+                  if pa.types.is_dictionary(field.type) else pa.array(values, field.type)
+                  for field, values in zip(SCHEMA, columns[:4])]
+        arrays += [dates, pa.array(columns[5], pa.int64()), pa.array(columns[6], pa.int64()),
+                   pa.array(columns[7], pa.string()).dictionary_encode(), pc.strftime(dates, format="%Y-%m")]
+        yield pa.RecordBatch.from_arrays(arrays, schema=SCHEMA)
+
+def export_snapshot(db_path=DB_PATH, path=None):
+    """
+    Writes the whole view to a fresh dataset next to `path`, then swaps it in, so readers never see a
+    partial snapshot. Returns a dict with the rows written, months, seconds and size on disk.
+    """
+    path = path or SNAPSHOT_PATH
+    start = time.perf_counter()
+    # write_dataset pulls the record batches from its own thread
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+    try:
+        # One read transaction: the data version matches the rows exported
+        cursor = conn.cursor()
+        cursor.execute("BEGIN")
+        data_version = schema.get_data_version(conn)
+        building = path + ".building"
+        shutil.rmtree(building, ignore_errors=True)
+        ds.write_dataset(_record_batches(cursor), building, schema=SCHEMA, format="parquet",
+                         partitioning=PARTITIONING, min_rows_per_group=MIN_ROWS_PER_GROUP,
+                         existing_data_behavior="overwrite_or_ignore")
+        conn.rollback()
+    finally:
+        conn.close()
+
+    dataset = ds.dataset(building, format="parquet", partitioning=PARTITIONING)
+    stats = {"snapshot_version": SNAPSHOT_VERSION, "data_version": data_version, "rows": dataset.count_rows(),
+             "months": len(dataset.files), "bytes": sum(os.path.getsize(f) for f in dataset.files)}
+    with open(os.path.join(building, METADATA_FILE), "w") as f:
+        json.dump(stats, f)
+    old = path + ".old"
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.exists(path):
+        os.replace(path, old)
+    os.replace(building, path)
+    shutil.rmtree(old, ignore_errors=True)
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+def snapshot_metadata(path=None):
+    try:
+        with open(os.path.join(path or SNAPSHOT_PATH, METADATA_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def snapshot_is_current(conn, path=None):
+    """True if a snapshot of the current format exists and was exported from the database's current data version."""
+    metadata = snapshot_metadata(path)
+    return (metadata is not None and metadata.get("snapshot_version") == SNAPSHOT_VERSION
+            and metadata["data_version"] == schema.get_data_version(conn))
+
+def open_snapshot(path=None):
+    """The snapshot as a memory-mapped pyarrow dataset."""
+    return ds.dataset(path or SNAPSHOT_PATH, format="parquet", partitioning=PARTITIONING, exclude_invalid_files=True,
+                      filesystem=fs.LocalFileSystem(use_mmap=True))
+
+def _predicate(start, end, filter):
+    predicate = filter
+    for bound, op in ((start, "ge"), (end, "lt")):
+        if bound is None:
+            continue
+        bound = str(bound)[:10]
+        when = pa.scalar(datetime.fromisoformat(bound), pa.timestamp("s"))
+        if op == "ge":
+            condition = (ds.field("month") >= bound[:7]) & (ds.field("invoice_date") >= when)
+        else:
+            condition = (ds.field("month") <= bound[:7]) & (ds.field("invoice_date") < when)
+        predicate = condition if predicate is None else predicate & condition
+    return predicate
+
+def load_transactions(columns=None, start=None, end=None, filter=None, path=None):
+    """
+    Reads `columns` (default: all) as an Arrow table. start/end (dates or 'YYYY-MM-DD' strings, end
+    exclusive) prune month partitions and filter invoice_date; `filter` is an extra pyarrow.dataset
+    expression, e.g. ds.field("country") == "France".
+    """
+    return open_snapshot(path).to_table(columns=columns, filter=_predicate(start, end, filter))
+
+def iter_months(columns=None, start=None, end=None, filter=None, path=None):
+    """
+    Like load_transactions, but yields one table per month partition in date order, so aggregations
+    keyed by day or month can run a month at a time with memory bounded by the largest month.
+    """
+    dataset = open_snapshot(path)
+    predicate = _predicate(start, end, filter)
+    for fragment in sorted(dataset.get_fragments(filter=predicate), key=lambda f: f.path):
+        yield fragment.to_table(schema=dataset.schema, columns=columns, filter=predicate)
+
+def to_pandas(table):
+    """Arrow table -> DataFrame, releasing the Arrow buffers as columns convert (dictionaries -> categoricals)."""
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export transactions_view to a month-partitioned Parquet snapshot.")
+    parser.add_argument("--db-path", default=DB_PATH)
+    parser.add_argument("--path", default=None, help=f"Snapshot directory (default: {SNAPSHOT_PATH})")
+    args = parser.parse_args()
+    stats = export_snapshot(args.db_path, args.path)
+    print(f"Exported {stats['rows']:,} rows in {stats['months']} month files "
+          f"({stats['bytes'] / 1e6:.1f} MB) in {stats['seconds']:.1f}s to {args.path or SNAPSHOT_PATH}")
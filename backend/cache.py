@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+from .database import DB_PATH
+
+# Bounds for the analytics response cache
+CACHE_MAX_ENTRIES = 256
+CACHE_TTL_SECONDS = 300
+
+def database_stamp(db_path=DB_PATH):
+    """
+    Cheap fingerprint of the database files. Any write (rebuild, incremental ingest, checkpoint)
+    changes the size or mtime of the main file or its WAL, which invalidates cached responses
+    even when the write happened in another process (Streamlit, the CLI).
+    """
+    stamp = []
+    for path in (db_path, db_path + "-wal"):
+        try:
+            st = os.stat(path)
+            stamp.append((st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            stamp.append(None)
+    return tuple(stamp)
+
+class ResponseCache:
+    """
+    In-process LRU cache for JSON responses, keyed on route + query params,
+    with a TTL, a size bound and ETag / If-None-Match support.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL_SECONDS, stamp=database_stamp, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._stamp = stamp
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> (expires_at, stamp, body, etag)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key_for(request: Request):
+        return request.url.path + "?" + "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+
+    def lookup(self, request: Request):
+        """
+        Returns the cached Response (200, or 304 if the client's ETag matches), or None on a miss.
+        The database stamp is taken here, before the handler queries, and kept on request.state for
+        store(): a write that lands mid-query then leaves the entry stale-stamped rather than current.
+        """
+        key = self.key_for(request)
+        current = request.state.cache_stamp = self._stamp()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, stamp, body, etag = entry
+                if expires_at <= self._clock() or stamp != current:
+                    del self._entries[key]
+                    entry = None
+                else:
+                    self._entries.move_to_end(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if etag in request.headers.get("if-none-match", ""):
+                self.not_modified += 1
+                return Response(status_code=304, headers=self._headers(etag, "HIT"))
+        return Response(content=body, media_type="application/json", headers=self._headers(etag, "HIT"))
+
+    def store(self, request: Request, payload):
+        """Serialises payload, caches it and returns the Response (304 if the client already has it)."""
+        body = json.dumps(jsonable_encoder(payload), separators=(",", ":")).encode()
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        key = self.key_for(request)
+        stamp = getattr(request.state, "cache_stamp", None)
+        if stamp is None:
+            stamp = self._stamp()
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl, stamp, body, etag)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            if etag in request.headers.get("if-none-match", ""):
+                self.not_modified += 1
+                return Response(status_code=304, headers=self._headers(etag, "MISS"))
+        return Response(content=body, media_type="application/json", headers=self._headers(etag, "MISS"))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "not_modified": self.not_modified,
+                "invalidations": self.invalidations,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+    @staticmethod
+    def _headers(etag, status):
+        # no-cache: browsers may store the response but must revalidate, which yields cheap 304s
+        return {"ETag": etag, "Cache-Control": "no-cache", "X-Cache": status}
+
+response_cache = ResponseCache()
@@ -0,0 +1,33 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+# Threads for CPU-heavy work (model fits) kept off the event loop and out of the default threadpool
+WORKER_THREADS = 2
+
+class RequestCoalescer:
+    """
+    Runs blocking functions in a worker pool, coalescing concurrent identical calls: while a call for a
+    key is in flight, further callers with the same key await the same result instead of starting another.
+    Lives on the event loop thread, so the in-flight table needs no lock.
+    """
+
+    def __init__(self, max_workers=WORKER_THREADS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="coalesce")
+        self._in_flight = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    async def run(self, key, fn, *args):
+        future = self._in_flight.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+            self.executions += 1
+        else:
+            self.coalesced += 1
+        # shield: a client that disconnects must not cancel the result the other callers are waiting for
+        return await asyncio.shield(future)
+
+    def stats(self):
+        return {"in_flight": len(self._in_flight), "executions": self.executions, "coalesced": self.coalesced}
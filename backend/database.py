@@ -1,25 +1,37 @@
-from sqlalchemy import create_engine
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 import os
 
 # Relative path to the database file we already verified
 # ../sales_analysis.db relative to this file inside backend/
 DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sales_analysis.db")
-SQLALCHEMY_DATABASE_URL = f"sqlite:///{DB_PATH}"
 
-# check_same_thread=False is needed for SQLite in multi-threaded environments like FastAPI
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+# Read-only async access for the API's read paths (analytics, search, listings).
+# mode=ro means a missing database is an error instead of a silently created empty file.
+ASYNC_READ_DATABASE_URL = f"sqlite+aiosqlite:///file:{DB_PATH}?mode=ro&uri=true"
+
+# How long a connection waits on a lock (e.g. an ingest's commit) before raising "database is locked"
+BUSY_TIMEOUT_MS = 5000
+
+# Each pooled aiosqlite connection runs its queries on its own thread, so concurrent dashboard
+# requests aggregate in parallel (SQLite releases the GIL) without blocking the event loop.
+# The aggregations are CPU-bound: connections beyond the core count only time-slice the same cores and
+# stretch every query's latency, so the pool has one connection per core and further requests queue
+# for a free one.
+READ_POOL_SIZE = int(os.environ.get("READ_POOL_SIZE", os.cpu_count() or 1))
+
+async_read_engine = create_async_engine(
+    ASYNC_READ_DATABASE_URL, pool_size=READ_POOL_SIZE, max_overflow=0, pool_pre_ping=False
 )
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+@event.listens_for(async_read_engine.sync_engine, "connect")
+def _set_read_only_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA query_only = ON")
+    cursor.close()
 
-Base = declarative_base()
+AsyncReadSession = async_sessionmaker(async_read_engine, expire_on_commit=False, autoflush=False)
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+Base = declarative_base()
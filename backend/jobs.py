@@ -0,0 +1,113 @@
+import itertools
+import json
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+
+# Lines on the job's stdout that carry progress (see create_database.print_progress_json)
+PROGRESS_PREFIX = "PROGRESS "
+
+# Finished jobs kept for GET /system/jobs/{id}
+MAX_FINISHED_JOBS = 50
+
+# How much of the job's output is kept for diagnostics
+LOG_TAIL_LINES = 20
+
+class JobConflict(Exception):
+    """Raised when a job is submitted while another one is still running."""
+
+class JobManager:
+    """
+    Runs long maintenance commands (database rebuilds, ingests) in a background thread,
+    one at a time, and keeps their status and progress for polling.
+    The command runs in a subprocess and reports progress as PROGRESS {json} lines on stdout.
+    """
+
+    def __init__(self, on_success=None):
+        self._on_success = on_success
+        self._jobs = OrderedDict()  # id -> job dict
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._running = None
+
+    def submit(self, kind, command):
+        """Starts command in the background and returns the new job. Raises JobConflict if a job is running."""
+        with self._lock:
+            if self._running is not None:
+                raise JobConflict(f"Job {self._running} is still running")
+            job = {
+                "id": str(next(self._ids)),
+                "kind": kind,
+                "status": "running",
+                "phase": "starting",
+                "rows_processed": 0,
+                "created_at": time.time(),
+                "finished_at": None,
+                "error": None,
+                "log": [],
+            }
+            self._jobs[job["id"]] = job
+            self._running = job["id"]
+            self._prune()
+            snapshot = dict(job)
+        threading.Thread(target=self._run, args=(job["id"], command), daemon=True).start()
+        return snapshot
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def list(self):
+        with self._lock:
+            return [dict(job) for job in reversed(self._jobs.values())]
+
+    def wait(self, job_id, timeout=None):
+        """Blocks until the job has finished (for the CLI and tests). Returns its final state."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or job["status"] != "running":
+                return job
+            if deadline is not None and time.monotonic() > deadline:
+                return job
+            time.sleep(0.05)
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields)
+
+    def _run(self, job_id, command):
+        log, process = [], None
+        try:
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                       text=True, bufsize=1)
+            for line in process.stdout:
+                line = line.rstrip()
+                if line.startswith(PROGRESS_PREFIX):
+                    progress = json.loads(line[len(PROGRESS_PREFIX):])
+                    self._update(job_id, phase=progress["phase"], rows_processed=progress["rows_processed"])
+                else:
+                    log = (log + [line])[-LOG_TAIL_LINES:]
+            returncode = process.wait()
+            if returncode == 0:
+                if self._on_success is not None:
+                    self._on_success()
+                status, error = "succeeded", None
+            else:
+                status, error = "failed", log[-1] if log else f"exit code {returncode}"
+        except Exception as e:
+            status, error = "failed", str(e)
+            # Don't free the slot while the child may still be writing the database
+            if process is not None:
+                process.kill()
+                process.wait()
+        with self._lock:
+            self._jobs[job_id].update(status=status, error=error, log=log, finished_at=time.time())
+            self._running = None
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job["status"] != "running"]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
@@ -1,15 +1,36 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from sqlalchemy import select, text, tuple_
 from typing import List, Optional
 import os
+from contextlib import asynccontextmanager
 from . import models, database
+from .cache import response_cache
+from .coalescing import RequestCoalescer
+from .jobs import JobConflict, JobManager
 from pydantic import BaseModel
 from datetime import datetime
+import asyncio
+import base64
+import json
+
+import create_database
+import db_migrations
+import forecasting_engine
+import product_search
+import query_backend
+import recommender_engine
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Bring an existing database up to the latest schema (indexes, rollup tables) before serving
+    db_migrations.upgrade_database(database.DB_PATH)
+    yield
 
 # Initialize App
-app = FastAPI(title="Sales Analysis API", version="1.0.0")
+app = FastAPI(title="Sales Analysis API", version="1.0.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -19,13 +40,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Dependency
-def get_db():
-    db = database.SessionLocal()
-    try:
+# Read-only async sessions from the pooled aiosqlite engine, for every read path
+async def get_read_db():
+    async with database.AsyncReadSession() as db:
         yield db
-    finally:
-        db.close()
 
 # --- Pydantic Schemas ---
 class ProductSchema(BaseModel):
@@ -46,7 +64,7 @@ class InvoiceItemSchema(BaseModel):
 
 class InvoiceSchema(BaseModel):
     invoice_id: str
-    customer_id: Optional[float]
+    customer_id: Optional[int]
     invoice_date: Optional[datetime]
     country: Optional[str]
     items: List[InvoiceItemSchema] = []
@@ -54,6 +72,10 @@ class InvoiceSchema(BaseModel):
     class Config:
         from_attributes = True
 
+class TransactionPage(BaseModel):
+    items: List[InvoiceSchema]
+    next_cursor: Optional[str] = None
+
 # --- Routes ---
 
 
@@ -72,94 +94,313 @@ async def read_index():
 # Static mount moved to end of file
 
 @app.get("/products", response_model=List[ProductSchema])
-def read_products(skip: int = 0, limit: int = 20, db: Session = Depends(get_db)):
-    products = db.query(models.Product).offset(skip).limit(limit).all()
+async def read_products(skip: int = 0, limit: int = 20, db: AsyncSession = Depends(get_read_db)):
+    products = (await db.scalars(select(models.Product).offset(skip).limit(limit))).all()
     return products
 
 @app.get("/search/products/{query}")
-def search_products(query: str, db: Session = Depends(get_db)):
-    """Search products by description"""
-    products = db.query(models.Product).filter(models.Product.description.contains(query)).limit(20).all()
-    return products
+async def search_products(query: str, limit: int = 20, offset: int = 0, db: AsyncSession = Depends(get_read_db)):
+    """Search products by description or stock code (prefix match per word), best sellers first."""
+    params = product_search.search_params(query, max(1, min(limit, 100)), max(0, offset))
+    if params["match"] is None:
+        return []
+    rows = (await db.execute(text(product_search.SEARCH_SQL), params)).fetchall()
+    return [{"stock_code": row[0], "description": row[1], "units_sold": row[2]} for row in rows]
+
+# Batch-load the items (and their products) of a whole page in one extra query instead of one per invoice
+INVOICE_WITH_ITEMS = selectinload(models.Invoice.items).joinedload(models.InvoiceItem.product)
 
 @app.get("/transactions", response_model=List[InvoiceSchema])
-def read_transactions(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
+async def read_transactions(skip: int = 0, limit: int = 10, db: AsyncSession = Depends(get_read_db)):
     """
     Get transactions with their items. 
-    Note: loading items might be heavy if not optimized, but good for inspection.
+    Offset-based; for deep pages use /transactions/page, whose cost doesn't grow with the offset.
     """
-    invoices = db.query(models.Invoice).offset(skip).limit(limit).all()
-    # Manual join for item descriptions if needed, but SQLAlchemy handles relationships
+    query = select(models.Invoice).options(INVOICE_WITH_ITEMS).offset(skip).limit(limit)
+    invoices = (await db.scalars(query)).all()
     return invoices
 
+def encode_cursor(invoice):
+    key = [invoice.invoice_ts, invoice.invoice_id]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        invoice_ts, invoice_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return int(invoice_ts), str(invoice_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@app.get("/transactions/page", response_model=TransactionPage)
+async def read_transactions_page(cursor: Optional[str] = None, limit: int = 10, db: AsyncSession = Depends(get_read_db)):
+    """
+    Keyset-paginated transactions, ordered by (invoice date, invoice_id).
+    Pass the returned next_cursor to get the following page; deep pages cost the same as the first.
+    """
+    limit = max(1, min(limit, 500))
+    key = (models.Invoice.invoice_ts, models.Invoice.invoice_id)
+    query = select(models.Invoice).options(INVOICE_WITH_ITEMS)
+    if cursor:
+        query = query.where(tuple_(*key) > decode_cursor(cursor))
+    query = query.order_by(*key).limit(limit + 1)
+    invoices = (await db.scalars(query)).all()
+
+    next_cursor = encode_cursor(invoices[limit - 1]) if len(invoices) > limit else None
+    return {"items": invoices[:limit], "next_cursor": next_cursor}
+
+# Served from the rollups maintained at ingest time (see rollups.py)
+REVENUE_BY_COUNTRY_SQL = """
+    SELECT country, SUM(revenue) as total_revenue
+    FROM daily_sales
+    GROUP BY country
+    ORDER BY total_revenue DESC
+"""
+MONTHLY_SALES_SQL = """
+    SELECT month, revenue
+    FROM monthly_sales
+    ORDER BY month
+"""
+
 @app.get("/stats/revenue/by-country")
-def get_revenue_by_country(db: Session = Depends(get_db)):
+async def get_revenue_by_country(request: Request, db: AsyncSession = Depends(get_read_db)):
     """
     Aggregate revenue by country.
     """
-    # Using raw SQL for aggregation as it's often cleaner for analytics
-    result = db.execute(text("""
-        SELECT i.country, SUM(ii.quantity * ii.price) as total_revenue
-        FROM invoice_items ii
-        JOIN invoices i ON ii.invoice_id = i.invoice_id
-        GROUP BY i.country
-        ORDER BY total_revenue DESC
-    """)).fetchall()
+    cached = response_cache.lookup(request)
+    if cached is not None:
+        return cached
+    result = (await db.execute(text(REVENUE_BY_COUNTRY_SQL))).fetchall()
     
-    return [{"country": row[0], "total_revenue": row[1]} for row in result]
+    return response_cache.store(request, [{"country": row[0], "total_revenue": row[1]} for row in result])
 
 # --- Analytics Endpoints ---
 
 @app.get("/analytics/monthly-sales")
-def get_monthly_sales(db: Session = Depends(get_db)):
+async def get_monthly_sales(request: Request, db: AsyncSession = Depends(get_read_db)):
     """Aggregate revenue by month."""
-    result = db.execute(text("""
-        SELECT strftime('%Y-%m', i.invoice_date) as month, SUM(ii.quantity * ii.price) as revenue
-        FROM invoice_items ii
-        JOIN invoices i ON ii.invoice_id = i.invoice_id
-        GROUP BY month
-        ORDER BY month
-    """)).fetchall()
-    return [{"month": row[0], "revenue": row[1]} for row in result]
+    cached = response_cache.lookup(request)
+    if cached is not None:
+        return cached
+    result = (await db.execute(text(MONTHLY_SALES_SQL))).fetchall()
+    return response_cache.store(request, [{"month": row[0], "revenue": row[1]} for row in result])
+
+async def run_analytic_query(db, name, params):
+    """
+    Runs one of query_backend's heavy aggregations. With ANALYTICS_BACKEND=duckdb it runs on a worker
+    thread (DuckDB over the Parquet snapshot, or SQLite if the snapshot is stale); otherwise on the
+    async SQLite session like the other reads.
+    """
+    if query_backend.BACKEND == "duckdb":
+        return await asyncio.to_thread(query_backend.run, name, params, database.DB_PATH)
+    return (await db.execute(text(query_backend.QUERIES[name]["sqlite"]), params)).fetchall()
 
 @app.get("/analytics/top-customers")
-def get_top_customers(limit: int = 10, db: Session = Depends(get_db)):
+async def get_top_customers(request: Request, limit: int = 10, db: AsyncSession = Depends(get_read_db)):
     """Get top customers by total spend."""
-    result = db.execute(text(f"""
-        SELECT i.customer_id, SUM(ii.quantity * ii.price) as total_spend
-        FROM invoice_items ii
-        JOIN invoices i ON ii.invoice_id = i.invoice_id
-        GROUP BY i.customer_id
-        ORDER BY total_spend DESC
-        LIMIT {limit}
-    """)).fetchall()
-    return [{"customer_id": row[0], "total_spend": row[1]} for row in result]
+    cached = response_cache.lookup(request)
+    if cached is not None:
+        return cached
+    result = await run_analytic_query(db, "top_customers", {"limit": limit})
+    return response_cache.store(request, [{"customer_id": row[0], "total_spend": row[1]} for row in result])
+
+@app.get("/analytics/top-products")
+async def get_top_products(request: Request, limit: int = 10, db: AsyncSession = Depends(get_read_db)):
+    """Get top products by revenue."""
+    cached = response_cache.lookup(request)
+    if cached is not None:
+        return cached
+    result = await run_analytic_query(db, "top_products", {"limit": limit})
+    return response_cache.store(request, [dict(zip(query_backend.QUERIES["top_products"]["columns"], row))
+                                          for row in result])
+
+# --- Customer Segments ---
+
+SEGMENT_COLUMNS = ("customer_id", "last_purchase", "recency_days", "frequency", "monetary",
+                   "r_score", "f_score", "m_score", "rfm_score", "segment")
+
+@app.get("/customers/segments")
+async def get_customer_segments(request: Request, segment: Optional[str] = None, limit: int = 50,
+                                db: AsyncSession = Depends(get_read_db)):
+    """
+    RFM segment summary, or with ?segment= that segment's customers by spend.
+    Served from the customer_segments table maintained at ingest time (see rfm_engine.py).
+    """
+    cached = response_cache.lookup(request)
+    if cached is not None:
+        return cached
+    if segment is None:
+        result = (await db.execute(text("""
+            SELECT segment, COUNT(*) as customers, AVG(recency_days), AVG(frequency), AVG(monetary), SUM(monetary)
+            FROM customer_segments
+            GROUP BY segment
+            ORDER BY SUM(monetary) DESC
+        """))).fetchall()
+        return response_cache.store(request, [
+            {"segment": row[0], "customers": row[1], "avg_recency_days": row[2], "avg_frequency": row[3],
+             "avg_monetary": row[4], "total_monetary": row[5]} for row in result])
+    result = (await db.execute(text(f"""
+        SELECT {', '.join(SEGMENT_COLUMNS)}
+        FROM customer_segments
+        WHERE segment = :segment
+        ORDER BY monetary DESC
+        LIMIT :limit
+    """), {"segment": segment, "limit": limit})).fetchall()
+    return response_cache.store(request, [dict(zip(SEGMENT_COLUMNS, row)) for row in result])
+
+@app.get("/customers/{customer_id}/segment")
+async def get_customer_segment(customer_id: int, db: AsyncSession = Depends(get_read_db)):
+    """RFM metrics, scores and segment for one customer."""
+    row = (await db.execute(text(f"""
+        SELECT {', '.join(SEGMENT_COLUMNS)}, snapshot_date
+        FROM customer_segments
+        WHERE customer_id = :customer_id
+    """), {"customer_id": customer_id})).fetchone()
+    if row is None:
+        raise HTTPException(status_code=404, detail=f"No purchases for customer {customer_id}")
+    return dict(zip(SEGMENT_COLUMNS + ("snapshot_date",), row))
+
+CLV_COLUMNS = ("customer_id", "frequency", "recency", "T", "monetary_value",
+               "predicted_purchases", "predicted_monetary", "clv", "data_version")
+
+@app.get("/customers/top-clv")
+async def get_top_clv(request: Request, limit: int = 10, db: AsyncSession = Depends(get_read_db)):
+    """Customers with the highest 6-month CLV, from the customer_clv table written by clv_engine.py."""
+    cached = response_cache.lookup(request)
+    if cached is not None:
+        return cached
+    result = (await db.execute(text(f"""
+        SELECT {', '.join(CLV_COLUMNS)}
+        FROM customer_clv
+        ORDER BY clv DESC
+        LIMIT :limit
+    """), {"limit": limit})).fetchall()
+    return response_cache.store(request, [dict(zip(CLV_COLUMNS, row)) for row in result])
+
+@app.get("/customers/{customer_id}/clv")
+async def get_customer_clv(customer_id: int, db: AsyncSession = Depends(get_read_db)):
+    """Predicted purchases (next 30 days), expected order value and 6-month CLV for one customer."""
+    row = (await db.execute(text(f"""
+        SELECT {', '.join(CLV_COLUMNS)}
+        FROM customer_clv
+        WHERE customer_id = :customer_id
+    """), {"customer_id": customer_id})).fetchone()
+    if row is None:
+        raise HTTPException(status_code=404, detail=f"No CLV for customer {customer_id} (only repeat customers are scored)")
+    return dict(zip(CLV_COLUMNS, row))
+
+# Forecasts are fitted in worker threads; concurrent identical requests share one computation
+forecast_coalescer = RequestCoalescer()
+MAX_FORECAST_DAYS = 365
+FORECAST_INTERVAL_LEVEL = 0.95
+
+def compute_forecast(series, days):
+    frame, model_name = forecasting_engine.forecast_intervals(days, series, FORECAST_INTERVAL_LEVEL)
+    return {
+        "series": series, "days": days, "model": model_name, "interval_level": FORECAST_INTERVAL_LEVEL,
+        "data_version": forecasting_engine.current_data_version(),
+        "forecast": [{"date": day.strftime("%Y-%m-%d"), "forecast": row.forecast, "lower": row.lower, "upper": row.upper}
+                     for day, row in zip(frame.index, frame.itertuples())],
+    }
+
+@app.get("/analytics/forecast")
+async def get_forecast(request: Request, days: int = 30, series: str = "total"):
+    """
+    Daily revenue forecast with prediction intervals for series "total" or "country=<name>".
+    The fit runs in the coalescer's worker pool, so the event loop keeps serving; identical requests
+    arriving while it runs wait for the same result, and the response is cached until the data changes.
+    """
+    cached = response_cache.lookup(request)
+    if cached is not None:
+        return cached
+    days = max(1, min(days, MAX_FORECAST_DAYS))
+    try:
+        payload = await forecast_coalescer.run(("forecast", series, days), compute_forecast, series, days)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return response_cache.store(request, payload)
+
+# --- Recommendations ---
+
+def rules_model():
+    """The persisted rules model; 503 until the first rebuild/ingest job has trained one."""
+    model = recommender_engine.get_rules_model()
+    if model is None:
+        raise HTTPException(status_code=503, detail="Recommendation model not ready")
+    return model
+
+@app.get("/recommendations/{stock_code}")
+def get_recommendations(stock_code: str, k: int = 5):
+    """
+    Top-k products bought together with stock_code, from the persisted association-rule model.
+    The model is trained by the rebuild/ingest job and served from memory (recommender_engine.get_rules_model);
+    requests never mine. Plain def: loading a newly saved model reads a file.
+    """
+    model = rules_model()
+    k = max(1, min(k, recommender_engine.MAX_RULES_PER_PRODUCT))
+    return {"stock_code": stock_code, "description": model.descriptions.get(stock_code),
+            "data_version": model.data_version, "recommendations": model.recommend(stock_code, k)}
+
+class BasketRequest(BaseModel):
+    items: List[str]
+    k: int = 5
+
+@app.post("/recommendations/basket")
+def recommend_for_basket(basket: BasketRequest):
+    """
+    "Complete the cart": ranked suggestions for a cart of stock codes, scored with every rule whose
+    (possibly multi-item) antecedent is in the cart, via the model's antecedent trie.
+    """
+    model = rules_model()
+    k = max(1, min(basket.k, recommender_engine.MAX_RULES_PER_PRODUCT))
+    return {"items": basket.items, "data_version": model.data_version,
+            "recommendations": model.recommend_basket(basket.items, k)}
 
 # --- System Integration ---
 
 import sys
-import subprocess
 
-@app.post("/system/rebuild-database")
-def rebuild_database():
+# Rebuilds and ingests run in the background, one at a time; a finished job invalidates cached responses
+job_manager = JobManager(on_success=response_cache.clear)
+REBUILD_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "create_database.py")
+REBUILD_SOURCE_PATH = create_database.EXCEL_PATH
+
+@app.post("/system/rebuild-database", status_code=202)
+def rebuild_database(incremental: bool = False):
     """
-    WARNING: This triggers the backend script to recreate the database.
-    It will delete and repopulate all data.
+    Starts a database rebuild in the background and returns its job id; poll GET /system/jobs/{id}.
+    A full rebuild loads into a scratch file and only replaces the live database once it is complete,
+    so readers keep seeing the old data until then.
+    With ?incremental=true only invoices that are not in the database yet are appended,
+    and the live database stays readable (WAL) while the ingest runs.
+    Returns 409 while another rebuild is running.
     """
+    command = [sys.executable, REBUILD_SCRIPT, REBUILD_SOURCE_PATH,
+               "--db-path", database.DB_PATH, "--progress-json"]
+    if incremental:
+        command.append("--incremental")
     try:
-        # Assuming create_database.py is in the parent directory
-        script_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "create_database.py")
-        
-        # Run it as a subprocess to ensure clean execution environment
-        result = subprocess.run([sys.executable, script_path], capture_output=True, text=True)
-        
-        if result.returncode == 0:
-            return {"status": "success", "message": "Database rebuilt successfully", "log": result.stdout}
-        else:
-            raise HTTPException(status_code=500, detail=f"Script failed: {result.stderr}")
-            
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        job = job_manager.submit("ingest" if incremental else "rebuild", command)
+    except JobConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"job_id": job["id"], "status": job["status"], "status_url": f"/system/jobs/{job['id']}"}
+
+@app.get("/system/jobs")
+def list_jobs():
+    """Recent rebuild/ingest jobs, newest first."""
+    return job_manager.list()
+
+@app.get("/system/jobs/{job_id}")
+def get_job(job_id: str):
+    """Status of a background job: status, phase, rows processed and, on failure, the error."""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/system/cache-stats")
+def get_cache_stats():
+    """Hit/miss counters of the analytics response cache and the forecast coalescer, for monitoring."""
+    return {**response_cache.stats(), "forecast": forecast_coalescer.stats()}
 
 # Mount Frontend (Static Files) at the end to avoid shadowing API routes
 app.mount("/", StaticFiles(directory=frontend_path), name="static")
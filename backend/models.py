@@ -1,41 +1,71 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, ForeignKey, select
+from sqlalchemy.orm import column_property, relationship
 from .database import Base
 
+import schema
+
+# Mirrors the compact layout in schema.py: integer surrogate keys, a countries dimension,
+# prices in cents and invoice dates in epoch seconds
 class Customer(Base):
     __tablename__ = "customers"
-    
-    # In the existing DB, customer_id is REAL (Float). 
-    # Ideally should be Integer, but we match schema.
-    customer_id = Column(Float, primary_key=True, index=True)
+
+    customer_id = Column(Integer, primary_key=True)
+
+class Country(Base):
+    __tablename__ = "countries"
+
+    country_key = Column(Integer, primary_key=True)
+    country = Column(String, unique=True, nullable=False)
 
 class Product(Base):
     __tablename__ = "products"
-    
-    stock_code = Column(String, primary_key=True, index=True)
+
+    product_key = Column(Integer, primary_key=True)
+    stock_code = Column(String, unique=True, nullable=False)
     description = Column(String)
 
 class Invoice(Base):
     __tablename__ = "invoices"
-    
-    invoice_id = Column(String, primary_key=True, index=True)
-    customer_id = Column(Float, ForeignKey("customers.customer_id"))
-    invoice_date = Column(DateTime)
-    country = Column(String)
-    
+
+    invoice_key = Column(Integer, primary_key=True)
+    invoice_id = Column(String, unique=True, nullable=False)
+    customer_id = Column(Integer, ForeignKey("customers.customer_id"))
+    invoice_ts = Column(Integer, nullable=False)
+    country_key = Column(Integer, ForeignKey("countries.country_key"))
+    # Loaded with the invoice row as a scalar subquery on the (small) countries table
+    country = column_property(
+        select(Country.country).where(Country.country_key == country_key).correlate_except(Country).scalar_subquery())
+
     # Relationships
     customer = relationship("Customer")
     items = relationship("InvoiceItem", back_populates="invoice")
 
+    @property
+    def invoice_date(self):
+        return schema.from_epoch(self.invoice_ts) if self.invoice_ts is not None else None
+
 class InvoiceItem(Base):
     __tablename__ = "invoice_items"
-    
-    id = Column(Integer, primary_key=True, index=True)
-    invoice_id = Column(String, ForeignKey("invoices.invoice_id"))
-    stock_code = Column(String, ForeignKey("products.stock_code"))
-    quantity = Column(Integer)
-    price = Column(Float)
-    
+
+    id = Column(Integer, primary_key=True)
+    invoice_key = Column(Integer, ForeignKey("invoices.invoice_key"), nullable=False)
+    product_key = Column(Integer, ForeignKey("products.product_key"), nullable=False)
+    quantity = Column(Integer, nullable=False)
+    price_cents = Column(Integer, nullable=False)
+
     # Relationships
     invoice = relationship("Invoice", back_populates="items")
     product = relationship("Product")
+
+    @property
+    def price(self):
+        return self.price_cents / 100
+
+    # stock_code and description enrich InvoiceItemSchema; load `product` eagerly to avoid one SELECT per item
+    @property
+    def stock_code(self):
+        return self.product.stock_code if self.product is not None else None
+
+    @property
+    def description(self):
+        return self.product.description if self.product is not None else None
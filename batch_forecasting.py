@@ -0,0 +1,204 @@
+"""
+Batch hierarchical revenue forecasting.
+
+Forecasts every series of the sales hierarchy at once:
+    total -> country -> country x product      and      total -> product -> country x product
+where "product" is each of the top-N stock codes plus an OTHER bucket for the rest of the catalogue,
+so every level adds up exactly to the one above it.
+
+All series come from a single aggregate pass over invoice_items/invoices. Each series' base forecast
+comes from the candidate model with the best rolling-origin backtest (forecast_backtest); by default the
+candidates are the NumPy-vectorized baselines, which fit thousands of series at once, and Holt-Winters
+can be added with --models (fitted in a process pool). The base forecasts are then reconciled (OLS: the
+coherent forecasts closest to the base forecasts, in the least-squares sense) so children sum to parents.
+Results replace the contents of the forecasts table.
+
+    python batch_forecasting.py --horizon 30 --top-products 200
+"""
+import argparse
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from scipy import sparse
+from scipy.sparse.linalg import lsqr
+
+import analytics_snapshot
+import db_migrations
+import forecast_backtest
+import schema
+
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sales_analysis.db")
+
+# Candidate models per series; the Holt-Winters ones cost about a second per series, these fit every series at once
+BATCH_MODELS = ["seasonal_naive", "ses", "seasonal_ses"]
+BACKTEST_HORIZON = 14
+OTHER_PRODUCTS = "OTHER"
+
+def load_bottom_series(conn, top_products):
+    """
+    One pass over the line items: daily revenue per (country, product), where product is one of the
+    top_products stock codes by revenue or OTHER_PRODUCTS.
+    Returns (values [n_bottom x n_days], [(country, product)], days).
+    """
+    lines = read_lines(conn)
+    top = lines.groupby("stock_code")["revenue"].sum().nlargest(top_products).index
+    lines["product"] = lines["stock_code"].where(lines["stock_code"].isin(top), OTHER_PRODUCTS)
+
+    days = pd.date_range(lines["day"].min(), lines["day"].max(), freq="D")
+    day_index = (pd.to_datetime(lines["day"]) - days[0]).dt.days.to_numpy()
+    rows, keys = pd.factorize(pd.MultiIndex.from_arrays([lines["country"], lines["product"]]))
+    values = np.zeros((len(keys), len(days)))
+    np.add.at(values, (rows, day_index), lines["revenue"].to_numpy())
+    return values, list(keys), days
+
+def read_lines(conn):
+    """
+    Daily revenue per (day, country, stock_code). Aggregated in Arrow from the Parquet snapshot
+    (analytics_snapshot) when it is current, reading only the five columns needed, else in SQLite.
+    """
+    if not analytics_snapshot.snapshot_is_current(conn):
+        return pd.read_sql("""
+            SELECT date(d.day * 86400, 'unixepoch') AS day,
+                   COALESCE(c.country, 'Unspecified') AS country,
+                   p.stock_code,
+                   d.revenue
+            FROM (
+                SELECT i.invoice_ts / 86400 AS day, i.country_key, ii.product_key,
+                       SUM(ii.quantity * ii.price_cents) / 100.0 AS revenue
+                FROM invoice_items ii
+                JOIN invoices i ON ii.invoice_key = i.invoice_key
+                GROUP BY day, i.country_key, ii.product_key
+            ) d
+            JOIN products p ON p.product_key = d.product_key
+            LEFT JOIN countries c ON c.country_key = d.country_key
+        """, conn)
+    # A day never spans two month partitions, so each month is aggregated on its own (bounded memory),
+    # in integer cents like the SQLite query
+    months = []
+    for table in analytics_snapshot.iter_months(["invoice_date", "country", "stock_code", "quantity", "price_cents"]):
+        months.append(pa.table({
+            "day": table["invoice_date"].cast(pa.date32()),
+            "country": table["country"],
+            "stock_code": table["stock_code"],
+            "revenue": pc.multiply(table["quantity"], table["price_cents"]),
+        }).group_by(["day", "country", "stock_code"]).aggregate([("revenue", "sum")]))
+    if not months:
+        return pd.DataFrame(columns=["day", "country", "stock_code", "revenue"])
+    lines = pa.concat_tables(months)
+    # Plain Arrow strings become Arrow-backed pandas str columns, without a Python object per value
+    return pa.table({
+        "day": lines["day"],
+        "country": pc.fill_null(lines["country"].cast(pa.string()), "Unspecified"),
+        "stock_code": lines["stock_code"].cast(pa.string()),
+        "revenue": pc.divide(lines["revenue_sum"].cast(pa.float64()), 100.0),
+    }).to_pandas(date_as_object=False)
+
+def build_hierarchy(bottom_keys):
+    """
+    The summing matrix S (all series x bottom series) and the series metadata, in the order
+    total, countries, products, country x product. Every series is S @ bottom.
+    """
+    countries = sorted({country for country, _ in bottom_keys})
+    products = sorted({product for _, product in bottom_keys})
+    series = [("total", "total")]
+    series += [(f"country={c}", "country") for c in countries]
+    series += [(f"product={p}", "product") for p in products]
+    series += [(f"country={c}|product={p}", "country_product") for c, p in bottom_keys]
+
+    row_of = {name: i for i, (name, _) in enumerate(series)}
+    rows, cols = [], []
+    for j, (country, product) in enumerate(bottom_keys):
+        for name in ("total", f"country={country}", f"product={product}", f"country={country}|product={product}"):
+            rows.append(row_of[name])
+            cols.append(j)
+    summing = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(len(series), len(bottom_keys)))
+    return summing, series
+
+def fit_base_forecasts(series_values, horizon, workers=None, models=BATCH_MODELS):
+    """
+    Base forecasts for every row of series_values, each from the model with the lowest backtest sMAPE
+    on that series (the first model when the history is too short to backtest).
+    Returns (forecasts, selected model per series).
+    """
+    try:
+        _, scores = forecast_backtest.backtest(series_values, models, horizon=BACKTEST_HORIZON, workers=workers)
+        selected = forecast_backtest.select_models(scores)
+    except ValueError:
+        selected = np.full(len(series_values), models[0])
+    return forecast_backtest.forecast_selected(series_values, horizon, selected, workers), selected
+
+def reconcile(summing, base, method="ols"):
+    """
+    Makes the base forecasts coherent: returns S @ b where b are the bottom-level forecasts.
+    "ols" picks b minimising ||S b - base|| for each horizon step (uses every level's forecast),
+    "bottom_up" just sums the bottom-level base forecasts.
+    """
+    n_bottom = summing.shape[1]
+    if method == "bottom_up":
+        bottom = base[-n_bottom:]
+    elif method == "ols":
+        bottom = np.column_stack([lsqr(summing, base[:, t], atol=1e-10, btol=1e-10)[0] for t in range(base.shape[1])])
+    else:
+        raise ValueError(f"Unknown reconciliation method {method!r}")
+    return summing @ bottom
+
+def write_forecasts(conn, series, days, reconciled, base, data_version):
+    with conn:
+        conn.execute("DELETE FROM forecasts")
+        conn.executemany(
+            "INSERT INTO forecasts (series, level, day, forecast, base_forecast, data_version) VALUES (?, ?, ?, ?, ?, ?)",
+            ((name, level, day, float(reconciled[i, t]), float(base[i, t]), data_version)
+             for i, (name, level) in enumerate(series)
+             for t, day in enumerate(days)),
+        )
+
+def run_batch(db_path=DB_PATH, horizon=30, top_products=200, workers=None, method="ols", models=BATCH_MODELS):
+    """Forecasts the whole hierarchy and writes it to the forecasts table. Returns run statistics."""
+    start = time.perf_counter()
+    conn = sqlite3.connect(db_path)
+    try:
+        db_migrations.apply_migrations(conn)  # forecasts table
+        bottom, bottom_keys, days = load_bottom_series(conn, top_products)
+        summing, series = build_hierarchy(bottom_keys)
+        series_values = summing @ bottom
+        loaded = time.perf_counter()
+
+        base, selected = fit_base_forecasts(series_values, horizon, workers, models)
+        fitted = time.perf_counter()
+
+        reconciled = reconcile(summing, base, method)
+        future = [d.strftime("%Y-%m-%d") for d in pd.date_range(days[-1] + pd.Timedelta(days=1), periods=horizon)]
+        write_forecasts(conn, series, future, reconciled, base, schema.get_data_version(conn))
+    finally:
+        conn.close()
+
+    elapsed = time.perf_counter() - start
+    stats = {
+        "series": len(series), "bottom_series": len(bottom_keys), "horizon": horizon,
+        "load_seconds": loaded - start, "fit_seconds": fitted - loaded, "total_seconds": elapsed,
+        "series_per_sec": len(series) / (fitted - loaded) if fitted > loaded else 0.0,
+        "models": {name: int(n) for name, n in zip(*np.unique(selected, return_counts=True))},
+    }
+    print(f"[{datetime.now():%H:%M:%S}] Forecast {stats['series']:,} series ({stats['bottom_series']:,} bottom) "
+          f"x {horizon} days in {elapsed:.1f}s: load {stats['load_seconds']:.1f}s, "
+          f"fit {stats['fit_seconds']:.1f}s ({stats['series_per_sec']:,.1f} series/sec).")
+    print(f"Models selected: {stats['models']}")
+    return stats
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Forecast revenue per country, product and country x product.")
+    parser.add_argument("--db-path", default=DB_PATH)
+    parser.add_argument("--horizon", type=int, default=30, help="Days to forecast")
+    parser.add_argument("--top-products", type=int, default=200, help="Stock codes forecast individually")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--reconcile", choices=["ols", "bottom_up"], default="ols")
+    parser.add_argument("--models", nargs="+", choices=forecast_backtest.CANDIDATES, default=BATCH_MODELS,
+                        help="Candidate models, selected per series by backtest")
+    args = parser.parse_args()
+    run_batch(args.db_path, args.horizon, args.top_products, args.workers, args.reconcile, args.models)
@@ -0,0 +1,74 @@
+"""
+Basket matrix benchmark: the old dense pivot (groupby().unstack().fillna(0) + per-cell encoding)
+vs. the sparse CSR build in recommender_engine.build_basket_matrix, at several catalogue sizes.
+
+Runs against an existing database:
+    python benchmarks/bench_basket_matrix.py --db sales_analysis.db --skus 200 2000 all
+
+Peak memory is measured with tracemalloc (covers NumPy/pandas buffers); "matrix MB" is the size of
+the finished basket. The dense path is skipped above --dense-limit SKUs.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import recommender_engine
+
+def dense_basket(conn, max_products):
+    """The previous get_transaction_matrix, keyed on stock_code."""
+    top = pd.read_sql("SELECT stock_code FROM transactions_view GROUP BY stock_code ORDER BY count(*) DESC LIMIT ?",
+                      conn, params=(max_products,))["stock_code"].tolist()
+    df = pd.read_sql("""
+        SELECT invoice_id, stock_code, quantity
+        FROM transactions_view
+        WHERE quantity > 0
+    """, conn)
+    df = df[df["stock_code"].isin(top)]
+    basket = (df.groupby(["invoice_id", "stock_code"])["quantity"]
+              .sum().unstack().reset_index().fillna(0)
+              .set_index("invoice_id"))
+    basket = basket.map(lambda x: 1 if x >= 1 else 0)
+    return basket, basket.memory_usage(deep=False).sum()
+
+def sparse_basket(conn, max_products):
+    matrix, invoice_ids, stock_codes = recommender_engine.build_basket_matrix(conn, max_products)
+    return matrix, matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+
+def measure(fn, conn, max_products):
+    tracemalloc.start()
+    start = time.perf_counter()
+    basket, size = fn(conn, max_products)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return basket.shape, elapsed, peak / 2**20, size / 2**20
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db", default=recommender_engine.DB_PATH)
+    parser.add_argument("--skus", nargs="+", default=["200", "2000", "all"])
+    parser.add_argument("--dense-limit", type=int, default=2000)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    n_skus = conn.execute("SELECT COUNT(DISTINCT product_key) FROM invoice_items").fetchone()[0]
+    print(f"{'SKUs':>6} {'path':<7}{'shape':>16}{'seconds':>10}{'peak MB':>10}{'matrix MB':>11}")
+    for skus in args.skus:
+        max_products = n_skus if skus == "all" else int(skus)
+        for name, fn in (("dense", dense_basket), ("sparse", sparse_basket)):
+            if name == "dense" and max_products > args.dense_limit:
+                print(f"{max_products:>6} {name:<7}{'skipped':>16}")
+                continue
+            shape, elapsed, peak, size = measure(fn, conn, max_products)
+            print(f"{max_products:>6} {name:<7}{str(shape):>16}{elapsed:>10.2f}{peak:>10.1f}{size:>11.1f}")
+    conn.close()
+
+if __name__ == "__main__":
+    main()
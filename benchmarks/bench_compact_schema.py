@@ -0,0 +1,161 @@
+"""
+Compact schema benchmark: file size and query latency of the original layout (text keys, REAL prices,
+text dates) vs. the compact one (integer keys, cents, epoch dates, countries dimension).
+
+Builds a synthetic database in the original layout with its covering indexes, converts a copy with
+schema.convert_legacy_layout(), VACUUMs both and runs each aggregation in its form for either layout
+(best of --repeat runs):
+    python benchmarks/bench_compact_schema.py --line-items 2000000
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import schema
+from bench_rfm import build_database
+
+# Migration 1 as it was for the original layout
+LEGACY_INDEXES_SQL = [
+    "CREATE INDEX idx_invoice_items_invoice ON invoice_items (invoice_id, quantity, price)",
+    "CREATE INDEX idx_invoice_items_stock_code ON invoice_items (stock_code, quantity, price)",
+    "CREATE INDEX idx_invoices_date ON invoices (invoice_date, invoice_id)",
+    "CREATE INDEX idx_invoices_country ON invoices (country, invoice_id)",
+    "CREATE INDEX idx_invoices_customer ON invoices (customer_id, invoice_id)",
+]
+
+# (original layout, compact layout): the rollup, RFM and top-customer aggregations before and after
+QUERIES = {
+    "daily_sales": ("""
+        SELECT DATE(i.invoice_date), COALESCE(i.country, 'Unspecified'), SUM(ii.quantity * ii.price),
+               SUM(ii.quantity), COUNT(*), COUNT(DISTINCT i.invoice_id), COUNT(DISTINCT i.customer_id)
+        FROM invoices i
+        JOIN invoice_items ii ON i.invoice_id = ii.invoice_id
+        GROUP BY 1, 2
+    """, """
+        SELECT date(d.day * 86400, 'unixepoch'), COALESCE(c.country, 'Unspecified'),
+               d.revenue, d.units, d.line_items, d.invoices, d.customers
+        FROM (
+            SELECT i.invoice_ts / 86400 as day, i.country_key, SUM(ii.quantity * ii.price_cents) / 100.0 as revenue,
+                   SUM(ii.quantity) as units, COUNT(*) as line_items, COUNT(DISTINCT i.invoice_key) as invoices,
+                   COUNT(DISTINCT i.customer_id) as customers
+            FROM invoices i
+            JOIN invoice_items ii ON i.invoice_key = ii.invoice_key
+            GROUP BY 1, 2
+        ) d
+        LEFT JOIN countries c ON c.country_key = d.country_key
+    """),
+    "monthly_sales": ("""
+        SELECT strftime('%Y-%m', i.invoice_date), SUM(ii.quantity * ii.price), SUM(ii.quantity),
+               COUNT(*), COUNT(DISTINCT i.invoice_id), COUNT(DISTINCT i.customer_id)
+        FROM invoices i
+        JOIN invoice_items ii ON i.invoice_id = ii.invoice_id
+        GROUP BY 1
+    """, """
+        SELECT strftime('%Y-%m', i.invoice_ts, 'unixepoch'), SUM(ii.quantity * ii.price_cents) / 100.0,
+               SUM(ii.quantity), COUNT(*), COUNT(DISTINCT i.invoice_key), COUNT(DISTINCT i.customer_id)
+        FROM invoices i
+        JOIN invoice_items ii ON i.invoice_key = ii.invoice_key
+        GROUP BY 1
+    """),
+    "top_customers": ("""
+        SELECT i.customer_id, SUM(ii.quantity * ii.price) as total_spend
+        FROM invoice_items ii
+        JOIN invoices i ON ii.invoice_id = i.invoice_id
+        GROUP BY i.customer_id
+        ORDER BY total_spend DESC, i.customer_id
+        LIMIT 10
+    """, """
+        SELECT i.customer_id, SUM(ii.quantity * ii.price_cents) / 100.0 as total_spend
+        FROM invoice_items ii
+        JOIN invoices i ON ii.invoice_key = i.invoice_key
+        GROUP BY i.customer_id
+        ORDER BY total_spend DESC, i.customer_id
+        LIMIT 10
+    """),
+    "rfm_aggregate": ("""
+        SELECT i.customer_id, MAX(i.invoice_date), COUNT(DISTINCT i.invoice_id), SUM(ii.quantity * ii.price)
+        FROM invoices i
+        JOIN invoice_items ii ON ii.invoice_id = i.invoice_id
+        WHERE i.customer_id IS NOT NULL
+        GROUP BY i.customer_id
+    """, """
+        SELECT i.customer_id, datetime(MAX(i.invoice_ts), 'unixepoch'), COUNT(DISTINCT i.invoice_key),
+               SUM(ii.quantity * ii.price_cents) / 100.0
+        FROM invoices i
+        JOIN invoice_items ii ON ii.invoice_key = i.invoice_key
+        WHERE i.customer_id IS NOT NULL
+        GROUP BY i.customer_id
+    """),
+    "product_sales": ("""
+        SELECT stock_code, SUM(quantity), SUM(quantity * price)
+        FROM invoice_items
+        GROUP BY stock_code
+    """, """
+        SELECT p.stock_code, t.units, t.revenue
+        FROM (
+            SELECT product_key, SUM(quantity) as units, SUM(quantity * price_cents) / 100.0 as revenue
+            FROM invoice_items
+            GROUP BY product_key
+        ) t
+        JOIN products p ON p.product_key = t.product_key
+    """),
+}
+
+def best_time(conn, sql, repeat):
+    conn.execute(sql).fetchall()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn.execute(sql).fetchall()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--line-items", type=int, default=2_000_000)
+    parser.add_argument("--customers", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        legacy_path, compact_path = os.path.join(tmp_dir, "legacy.db"), os.path.join(tmp_dir, "compact.db")
+        conn = build_database(legacy_path, args.line_items, args.customers, legacy=True)
+        for statement in LEGACY_INDEXES_SQL + ["ANALYZE"]:
+            conn.execute(statement)
+        conn.commit()
+        conn.close()
+        shutil.copy(legacy_path, compact_path)
+
+        conn = sqlite3.connect(compact_path)
+        start = time.perf_counter()
+        with conn:
+            schema.convert_legacy_layout(conn.cursor())
+            conn.execute("ANALYZE")
+        print(f"Converted {args.line_items:,} line items in {time.perf_counter() - start:.1f}s")
+        conn.close()
+
+        connections = {}
+        for name, path in (("legacy", legacy_path), ("compact", compact_path)):
+            conn = sqlite3.connect(path)
+            conn.execute("VACUUM")
+            connections[name] = conn
+        sizes = {name: os.path.getsize(path) / 2**20 for name, path in (("legacy", legacy_path), ("compact", compact_path))}
+        print(f"database size: legacy {sizes['legacy']:.1f} MB, compact {sizes['compact']:.1f} MB "
+              f"({1 - sizes['compact'] / sizes['legacy']:.0%} smaller)")
+
+        print(f"{'query':<16}{'legacy s':>10}{'compact s':>11}{'speedup':>10}")
+        for name, (legacy_sql, compact_sql) in QUERIES.items():
+            legacy_s = best_time(connections["legacy"], legacy_sql, args.repeat)
+            compact_s = best_time(connections["compact"], compact_sql, args.repeat)
+            print(f"{name:<16}{legacy_s:>10.2f}{compact_s:>11.2f}{legacy_s / compact_s:>9.1f}x")
+        for conn in connections.values():
+            conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Intent router benchmark: accuracy on the labeled questions in chat_questions.json and routing throughput.
+
+The router is built from the fixture's entities plus a synthetic catalogue, to show that routing cost does
+not grow with the number of product names in the entity trie:
+    python benchmarks/bench_intent_router.py --skus 100000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from intent_router import IntentRouter
+
+FIXTURE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "chat_questions.json")
+WORDS = ("white hanging heart light holder metal lantern cream cupid coat hanger knitted union flag hot water "
+         "bottle glass star frosted jumbo bag pink polkadot vintage lunch box cake cases regency teacup saucer "
+         "alarm clock bakelike red retrospot strawberry ceramic trinket doormat christmas paper chain kit").split()
+
+def load_fixture(path=FIXTURE_PATH):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def build_router(entities, extra_skus=0, extra_customers=0):
+    random.seed(42)
+    products = [tuple(p) for p in entities["products"]]
+    products += [(f"X{i}", " ".join(random.choices(WORDS, k=4)).upper()) for i in range(extra_skus)]
+    customers = entities["customers"] + list(range(20000, 20000 + extra_customers))
+    return IntentRouter(entities["countries"], products, customers, date.fromisoformat(entities["latest_date"]))
+
+def accuracy(router, questions):
+    """(fraction of questions routed to the labeled intent and slots, [misrouted questions])."""
+    wrong = []
+    for q in questions:
+        routed = router.route(q["question"])
+        got = (routed["intent"], routed["slots"]) if routed else (None, {})
+        if got != (q["intent"], q["slots"]):
+            wrong.append((q["question"], got))
+    return 1 - len(wrong) / len(questions), wrong
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--skus", type=int, default=10000, help="Synthetic product names added to the trie")
+    parser.add_argument("--customers", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=200, help="Passes over the fixture questions")
+    args = parser.parse_args()
+
+    fixture = load_fixture()
+    start = time.perf_counter()
+    router = build_router(fixture["entities"], args.skus, args.customers)
+    build_seconds = time.perf_counter() - start
+
+    score, wrong = accuracy(router, fixture["questions"])
+    questions = [q["question"] for q in fixture["questions"]]
+    start = time.perf_counter()
+    for _ in range(args.rounds):
+        for question in questions:
+            router.route(question)
+    elapsed = time.perf_counter() - start
+    n = args.rounds * len(questions)
+
+    print(f"Router over {len(fixture['entities']['products']) + args.skus:,} products, "
+          f"{len(fixture['entities']['customers']) + args.customers:,} customers: built in {build_seconds * 1000:.0f} ms")
+    print(f"Accuracy: {score:.1%} of {len(questions)} labeled questions")
+    for question, got in wrong:
+        print(f"  misrouted: {question!r} -> {got}")
+    print(f"Throughput: {n / elapsed:,.0f} questions/sec ({elapsed / n * 1e6:.1f} us/question)")
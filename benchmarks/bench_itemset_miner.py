@@ -0,0 +1,64 @@
+"""
+Frequent itemset benchmark: mlxtend apriori vs. itemset_miner (Eclat over bitsets) on the basket matrix
+of an existing database, at several support thresholds:
+    python benchmarks/bench_itemset_miner.py --db sales_analysis.db --supports 0.05 0.02 0.01 0.005
+
+Apriori gets the sparse-backed DataFrame and runs without a time limit; pass --skip-apriori-below to
+leave it out at thresholds where it takes too long. Apriori materializes a dense invoices x candidates
+matrix per level, so at low thresholds it runs out of memory (reported as OOM).
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+from mlxtend.frequent_patterns import apriori
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import itemset_miner
+import recommender_engine
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / 2**20
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db", default=recommender_engine.DB_PATH)
+    parser.add_argument("--supports", nargs="+", type=float, default=[0.05, 0.02, 0.01, 0.005])
+    parser.add_argument("--skip-apriori-below", type=float, default=0.0)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    matrix, invoice_ids, stock_codes = recommender_engine.build_basket_matrix(conn)
+    conn.close()
+    basket = pd.DataFrame.sparse.from_spmatrix(matrix, index=invoice_ids, columns=stock_codes)
+    print(f"Basket: {matrix.shape[0]:,} invoices x {matrix.shape[1]:,} SKUs, {matrix.nnz:,} line items")
+    print(f"{'support':>8}{'itemsets':>10}{'apriori s':>11}{'MB':>8}{'eclat s':>10}{'MB':>8}{'speedup':>9}")
+    for min_support in args.supports:
+        eclat, eclat_s, eclat_mb = measure(
+            lambda: itemset_miner.frequent_itemsets(matrix, min_support, columns=stock_codes))
+        if min_support < args.skip_apriori_below:
+            print(f"{min_support:>8}{len(eclat):>10,}{'skipped':>11}{'':>8}{eclat_s:>10.2f}{eclat_mb:>8.1f}")
+            continue
+        try:
+            found, apriori_s, apriori_mb = measure(lambda: apriori(basket, min_support=min_support, use_colnames=True))
+        except MemoryError:
+            tracemalloc.stop()
+            print(f"{min_support:>8}{len(eclat):>10,}{'OOM':>11}{'':>8}{eclat_s:>10.2f}{eclat_mb:>8.1f}")
+            continue
+        assert len(found) == len(eclat), (len(found), len(eclat))
+        print(f"{min_support:>8}{len(eclat):>10,}{apriori_s:>11.2f}{apriori_mb:>8.1f}"
+              f"{eclat_s:>10.2f}{eclat_mb:>8.1f}{apriori_s / eclat_s:>8.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Product search benchmark: the old `description LIKE '%q%'` scan vs. the FTS5 index (product_search.py).
+
+Builds a synthetic catalogue in a temporary database (no sales data needed):
+    python benchmarks/bench_product_search.py --skus 100000
+
+Note the old query stops at the first 20 matches in table order and does no ranking, so it is only
+fast for very common words; rare words and misses scan the whole table. The FTS5 query returns the
+20 best sellers among all matches.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import product_search
+import rollups
+
+WORDS = ("white hanging heart light holder metal lantern cream cupid coat hanger knitted union flag hot water "
+         "bottle glass star frosted jumbo bag pink polkadot vintage lunch box cake cases regency teacup saucer "
+         "alarm clock bakelike red retrospot strawberry ceramic trinket doormat christmas paper chain kit").split()
+QUERIES = ["heart", "white hang", "jumbo bag pink", "vint", "alarm clock", "trinket box", "doormat", "xmas"]
+SYLLABLES = ["ba", "ko", "ri", "mu", "te", "la", "zo", "pi", "ne", "su", "da", "fe", "go", "hu", "ji"]
+
+LIKE_SQL = "SELECT stock_code, description FROM products WHERE description LIKE ? LIMIT 20"
+
+def build_catalogue(path, n_skus):
+    random.seed(42)
+    # Zipf-like vocabulary: the real words above are the most frequent, plus a long tail of rarer ones
+    vocabulary = list(WORDS) + [a + b + c for a in SYLLABLES for b in SYLLABLES for c in SYLLABLES]
+    weights = [1.0 / (rank + 1) for rank in range(len(vocabulary))]
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE products (product_key INTEGER PRIMARY KEY, stock_code TEXT UNIQUE, description TEXT)")
+    conn.execute("CREATE TABLE invoice_items (product_key INTEGER, quantity INTEGER, price_cents INTEGER)")
+    conn.executemany("INSERT INTO products VALUES (?, ?, ?)", (
+        (i + 1, f"{10000 + i}", " ".join(random.choices(vocabulary, weights, k=4)).upper()) for i in range(n_skus)))
+    conn.executemany("INSERT INTO invoice_items VALUES (?, ?, 100)", (
+        (1 + random.randrange(n_skus), random.randint(1, 24)) for _ in range(n_skus * 3)))
+    cursor = conn.cursor()
+    rollups.create_product_sales_table(cursor)
+    product_search.create_search_index(cursor)
+    conn.commit()
+    return conn
+
+def time_query(fn, repeat):
+    fn()  # warm up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--skus", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        conn = build_catalogue(os.path.join(tmp_dir, "bench.db"), args.skus)
+        print(f"{args.skus:,} SKUs")
+        print(f"{'query':<16}{'LIKE ms':>10}{'FTS5 ms':>10}{'speedup':>10}")
+        for query in QUERIES:
+            like_ms = time_query(lambda: conn.execute(LIKE_SQL, (f"%{query}%",)).fetchall(), args.repeat)
+            fts_ms = time_query(lambda: product_search.search_products(conn, query), args.repeat)
+            print(f"{query:<16}{like_ms:>10.2f}{fts_ms:>10.2f}{like_ms / fts_ms:>9.1f}x")
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Analytic query backend benchmark: latency of each query in query_backend.QUERIES on SQLite vs. DuckDB
+over the Parquet snapshot (best of --repeat runs, after one warm-up run each).
+
+Builds a synthetic database and snapshot in a temporary directory:
+    python benchmarks/bench_query_backend.py --line-items 10000000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analytics_snapshot
+import query_backend
+import rollups
+from bench_rfm import build_database
+
+def best_time(name, db_path, backend, repeat):
+    query_backend.run(name, {"limit": 10}, db_path, backend)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        query_backend.run(name, {"limit": 10}, db_path, backend)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--line-items", type=int, default=10_000_000)
+    parser.add_argument("--customers", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "bench.db")
+        start = time.perf_counter()
+        conn = build_database(db_path, args.line_items, args.customers)
+        with conn:
+            # SQLite serves top products from this rollup
+            rollups.create_product_sales_table(conn.cursor())
+        conn.close()
+        print(f"Built {args.line_items:,} line items in {time.perf_counter() - start:.1f}s")
+        analytics_snapshot.SNAPSHOT_PATH = os.path.join(tmp_dir, "snapshot")
+        stats = analytics_snapshot.export_snapshot(db_path)
+        print(f"Exported the snapshot ({stats['bytes'] / 1e6:.1f} MB) in {stats['seconds']:.1f}s; "
+              f"{os.cpu_count()} CPU(s)")
+
+        print(f"{'query':<16}{'sqlite s':>10}{'duckdb s':>10}{'speedup':>10}")
+        for name in query_backend.QUERIES:
+            sqlite_s = best_time(name, db_path, "sqlite", args.repeat)
+            duckdb_s = best_time(name, db_path, "duckdb", args.repeat)
+            print(f"{name:<16}{sqlite_s:>10.2f}{duckdb_s:>10.3f}{sqlite_s / duckdb_s:>9.0f}x")
+
+if __name__ == "__main__":
+    main()
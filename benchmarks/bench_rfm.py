@@ -0,0 +1,119 @@
+"""
+RFM benchmark: the notebook's per-customer lambdas vs. rfm_engine's SQL aggregation and vectorized scoring,
+plus an incremental refresh after a small drop of new invoices.
+
+Builds a synthetic database in a temporary directory:
+    python benchmarks/bench_rfm.py --line-items 2000000 --customers 50000
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import create_database
+import db_migrations
+import rfm_engine
+import schema
+
+ITEMS_PER_INVOICE = 20
+DAYS = 730
+
+def build_database(path, n_items, n_customers, seed=42, legacy=False):
+    """Synthetic sales tables in the current layout, or with legacy=True the same rows in the pre-7 layout."""
+    rng = np.random.default_rng(seed)
+    n_invoices = n_items // ITEMS_PER_INVOICE
+    conn = sqlite3.connect(path)
+    seconds = np.sort(rng.integers(0, DAYS * 86400, n_invoices)) + schema.to_epoch("2010-01-01")
+    # Skewed customer activity: a few customers place a third of the invoices, the rest are spread evenly
+    heavy = rng.random(n_invoices) < 0.3
+    customers = 12346 + np.where(heavy, rng.zipf(1.5, n_invoices) % n_customers, rng.integers(0, n_customers, n_invoices))
+    invoice_ids = [str(500000 + i) for i in range(n_invoices)]
+    invoice_keys = np.arange(n_items) // ITEMS_PER_INVOICE
+    products = rng.integers(0, 2000, n_items)
+    quantities = rng.integers(1, 24, n_items).tolist()
+    cents = rng.integers(40, 1500, n_items)
+    with conn:
+        if legacy:
+            for statement in schema.LEGACY_TABLES_SQL:
+                conn.execute(statement)
+            dates = pd.to_datetime(seconds, unit="s").strftime("%Y-%m-%d %H:%M:%S")
+            conn.executemany("INSERT INTO customers VALUES (?)", ((float(c),) for c in np.unique(customers)))
+            conn.executemany("INSERT INTO products VALUES (?, ?)", ((str(20000 + p), f"PRODUCT {p}") for p in range(2000)))
+            conn.executemany("INSERT INTO invoices VALUES (?, ?, ?, 'United Kingdom')",
+                             zip(invoice_ids, customers.astype(float).tolist(), dates))
+            conn.executemany("INSERT INTO invoice_items (invoice_id, stock_code, quantity, price) VALUES (?, ?, ?, ?)",
+                             zip((invoice_ids[k] for k in invoice_keys), (20000 + products).astype(str), quantities,
+                                 (cents / 100).tolist()))
+            return conn
+        create_database.create_tables(conn)
+        conn.executemany("INSERT INTO customers VALUES (?)", ((c,) for c in np.unique(customers).tolist()))
+        conn.executemany("INSERT INTO countries (country) VALUES (?)", (("United Kingdom",), ("France",)))
+        conn.executemany("INSERT INTO products VALUES (?, ?, ?)",
+                         ((p + 1, str(20000 + p), f"PRODUCT {p}") for p in range(2000)))
+        conn.executemany("INSERT INTO invoices VALUES (?, ?, ?, ?, 1)",
+                         zip(range(1, n_invoices + 1), invoice_ids, customers.tolist(), seconds.tolist()))
+        conn.executemany("INSERT INTO invoice_items (invoice_key, product_key, quantity, price_cents) VALUES (?, ?, ?, ?)",
+                         zip((invoice_keys + 1).tolist(), (products + 1).tolist(), quantities, cents.tolist()))
+    return conn
+
+def notebook_rfm(conn):
+    df = pd.read_sql("SELECT * FROM transactions_view", conn, parse_dates=["invoice_date"])
+    df["TotalPrice"] = df["quantity"] * df["price"]
+    snapshot_date = df["invoice_date"].max() + pd.Timedelta(days=1)
+    return df.groupby("customer_id").agg({
+        "invoice_date": lambda x: (snapshot_date - x.max()).days,
+        "invoice_id": "nunique",
+        "TotalPrice": "sum",
+    })
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--line-items", type=int, default=2_000_000)
+    parser.add_argument("--customers", type=int, default=50_000)
+    parser.add_argument("--skip-notebook", action="store_true", help="Skip the slow per-customer lambda baseline")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        start = time.perf_counter()
+        conn = build_database(os.path.join(tmp_dir, "bench.db"), args.line_items, args.customers)
+        with conn:
+            db_migrations.apply_migrations(conn)
+        print(f"Built {args.line_items:,} line items in {time.perf_counter() - start:.1f}s")
+
+        if not args.skip_notebook:
+            start = time.perf_counter()
+            rfm = notebook_rfm(conn)
+            print(f"notebook lambdas : {time.perf_counter() - start:6.2f}s ({len(rfm):,} customers)")
+
+        start = time.perf_counter()
+        with conn:
+            n = rfm_engine.refresh_segments(conn)
+        print(f"rfm_engine full  : {time.perf_counter() - start:6.2f}s ({n:,} customers)")
+
+        # A one-day drop of new invoices for a handful of customers
+        last = conn.execute("SELECT MAX(invoice_ts) FROM invoices").fetchone()[0]
+        since = schema.from_epoch(last + 86400).strftime("%Y-%m-%d %H:%M:%S")
+        with conn:
+            for i in range(200):
+                conn.execute("INSERT OR IGNORE INTO customers VALUES (?)", (12346 + i * 7,))
+                conn.execute("INSERT INTO invoices (invoice_id, customer_id, invoice_ts, country_key) VALUES (?, ?, ?, 2)",
+                             (f"9{i:06d}", 12346 + i * 7, last + 86400))
+                conn.execute("""
+                    INSERT INTO invoice_items (invoice_key, product_key, quantity, price_cents)
+                    VALUES ((SELECT invoice_key FROM invoices WHERE invoice_id = ?), 2, 3, 250)
+                """, (f"9{i:06d}",))
+        start = time.perf_counter()
+        with conn:
+            n = rfm_engine.refresh_segments(conn, since=since)
+        print(f"rfm_engine incr. : {time.perf_counter() - start:6.2f}s (200 new invoices, {n:,} customers rescored)")
+        conn.close()
+
+if __name__ == "__main__":
+    main()
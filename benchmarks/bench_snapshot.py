@@ -0,0 +1,78 @@
+"""
+Parquet snapshot benchmark: load time and peak memory of the recommender's basket matrix and the batch
+forecaster's daily series, read through pd.read_sql (SQLite) vs. the month-partitioned Parquet snapshot
+(analytics_snapshot.py). Each measurement runs in a fresh process; peak RSS is read from /proc (Linux).
+
+Builds a synthetic database and snapshot in a temporary directory:
+    python benchmarks/bench_snapshot.py --line-items 2000000
+"""
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analytics_snapshot
+import batch_forecasting
+import db_migrations
+import recommender_engine
+from bench_rfm import build_database
+
+def _status_mb(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024
+
+def _reset_peak_rss():
+    # Linux: writing 5 to clear_refs resets VmHWM (peak RSS) to the current RSS
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+
+def measure(task, db_path, snapshot_path):
+    """Runs one load in this (fresh) process: (seconds, peak RSS growth in MB)."""
+    analytics_snapshot.SNAPSHOT_PATH = snapshot_path
+    conn = sqlite3.connect(db_path)
+    baseline = _status_mb("VmRSS")
+    _reset_peak_rss()
+    start = time.perf_counter()
+    if task == "recommender":
+        recommender_engine.build_basket_matrix(conn)
+    else:
+        batch_forecasting.load_bottom_series(conn, top_products=200)
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return elapsed, _status_mb("VmHWM") - baseline
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--line-items", type=int, default=2_000_000)
+    parser.add_argument("--customers", type=int, default=50_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "bench.db")
+        conn = build_database(db_path, args.line_items, args.customers)
+        with conn:
+            db_migrations.apply_migrations(conn)
+        conn.close()
+        snapshot_path = os.path.join(tmp_dir, "snapshot")
+        stats = analytics_snapshot.export_snapshot(db_path, snapshot_path)
+        print(f"{args.line_items:,} line items; snapshot {stats['bytes'] / 1e6:.1f} MB in {stats['months']} months "
+              f"(database {os.path.getsize(db_path) / 1e6:.1f} MB), exported in {stats['seconds']:.1f}s")
+
+        print(f"{'engine':<14}{'source':<10}{'seconds':>10}{'peak MB':>10}")
+        spawn = multiprocessing.get_context("spawn")
+        for task in ("recommender", "forecaster"):
+            for source, path in (("sqlite", os.path.join(tmp_dir, "missing")), ("parquet", snapshot_path)):
+                with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as pool:
+                    seconds, peak = pool.submit(measure, task, db_path, path).result()
+                print(f"{task:<14}{source:<10}{seconds:>10.2f}{peak:>10.0f}")
+
+if __name__ == "__main__":
+    main()
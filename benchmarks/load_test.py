@@ -0,0 +1,72 @@
+"""
+Concurrent load test for the FastAPI backend: N clients replay a dashboard-like request mix
+and report per-endpoint and overall p50/p99 latency.
+
+Start the API first (uvicorn backend.main:app), then:
+    python benchmarks/load_test.py --url http://127.0.0.1:8000 --clients 50 --requests 20
+
+--bust-cache adds a unique query parameter to every request, so the analytics response cache
+is bypassed and the database access path itself is measured.
+"""
+import argparse
+import asyncio
+import itertools
+import statistics
+import time
+
+import httpx
+
+ENDPOINTS = [
+    "/stats/revenue/by-country",
+    "/analytics/monthly-sales",
+    "/analytics/top-customers?limit=10",
+    "/search/products/heart",
+    "/transactions/page?limit=20",
+]
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+async def run_client(client, client_id, n_requests, bust_cache, latencies, errors):
+    counter = itertools.count()
+    for i in range(n_requests):
+        path = ENDPOINTS[(client_id + i) % len(ENDPOINTS)]
+        if bust_cache:
+            path += ("&" if "?" in path else "?") + f"_lt={client_id}-{next(counter)}"
+        start = time.perf_counter()
+        try:
+            response = await client.get(path)
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            errors.append(f"{path}: {type(e).__name__} {e}")
+            continue
+        latencies.setdefault(path.split("?")[0], []).append((time.perf_counter() - start) * 1000)
+
+async def main(url, clients, n_requests, bust_cache):
+    latencies, errors = {}, []
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=url, timeout=60, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(run_client(client, c, n_requests, bust_cache, latencies, errors)
+                               for c in range(clients)))
+        elapsed = time.perf_counter() - start
+
+    all_latencies = [ms for values in latencies.values() for ms in values]
+    print(f"{clients} clients x {n_requests} requests in {elapsed:.1f}s "
+          f"({len(all_latencies) / elapsed:.0f} req/s, {len(errors)} errors)")
+    print(f"{'endpoint':<32}{'p50 ms':>10}{'p99 ms':>10}")
+    for path, values in sorted(latencies.items()):
+        print(f"{path:<32}{statistics.median(values):>10.1f}{percentile(values, 99):>10.1f}")
+    print(f"{'overall':<32}{statistics.median(all_latencies):>10.1f}{percentile(all_latencies, 99):>10.1f}")
+    for error in errors[:5]:
+        print("error:", error)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent latency test for the Sales Analysis API.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=20, help="Requests per client")
+    parser.add_argument("--bust-cache", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(main(args.url, args.clients, args.requests, args.bust_cache))
@@ -1,117 +1,208 @@
 import pandas as pd
 import sqlite3
-import re
 import os
+import threading
+from collections import OrderedDict
+
+import schema
+from intent_router import IntentRouter
 
 DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sales_analysis.db")
 
-class DataChatAgent:
-    def __init__(self):
-        self.conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+# One parameterized statement per intent, so sqlite3's statement cache reuses the compiled plan for every
+# question with that intent. Optional filters are bound as parameters too (:country NULL = every country,
+# :start/:end default to all time). Revenue comes from the rollup tables maintained at ingest time (rollups.py).
+DAILY_FILTER = "day >= :start AND day < :end AND (:country IS NULL OR country = :country)"
+INVOICE_FILTER = """i.invoice_ts >= :start_ts AND i.invoice_ts < :end_ts
+    AND (:country IS NULL OR i.country_key = (SELECT country_key FROM countries WHERE country = :country))"""
 
-    def ask(self, question):
-        """
-        Translates natural language to SQL and returns the result df.
-        """
-        question = question.lower().strip()
-        sql = None
-        interpretation = ""
-        
-        # --- Simple Rule-Based NLP ---
-        
-        # 1. Sales by Country (Global Breakdown)
-        if ("by country" in question) or ("breakdown" in question and "country" in question):
-            sql = """
-                SELECT country, SUM(ii.quantity * ii.price) as revenue
-                FROM invoice_items ii
-                JOIN invoices i ON ii.invoice_id = i.invoice_id
-                GROUP BY country
-                ORDER BY revenue DESC
-            """
-            interpretation = "Aggregating revenue by country."
+QUERY_TEMPLATES = {
+    "revenue_by_country": f"""
+        SELECT country, SUM(revenue) as revenue
+        FROM daily_sales
+        WHERE {DAILY_FILTER}
+        GROUP BY country
+        ORDER BY revenue DESC
+    """,
+    "revenue_by_month": f"""
+        SELECT substr(day, 1, 7) as month, SUM(revenue) as revenue
+        FROM daily_sales
+        WHERE {DAILY_FILTER}
+        GROUP BY month
+        ORDER BY month
+    """,
+    "revenue_by_day": f"""
+        SELECT day, SUM(revenue) as revenue
+        FROM daily_sales
+        WHERE {DAILY_FILTER}
+        GROUP BY day
+        ORDER BY day
+    """,
+    "revenue_by_year": f"""
+        SELECT substr(day, 1, 4) as year, SUM(revenue) as revenue
+        FROM daily_sales
+        WHERE {DAILY_FILTER}
+        GROUP BY year
+        ORDER BY year
+    """,
+    "total_revenue": f"SELECT SUM(revenue) as Total_Revenue FROM daily_sales WHERE {DAILY_FILTER}",
+    "top_customers": f"""
+        SELECT i.customer_id, SUM(ii.quantity * ii.price_cents) / 100.0 as total_spend
+        FROM invoice_items ii
+        JOIN invoices i ON ii.invoice_key = i.invoice_key
+        WHERE {INVOICE_FILTER}
+        GROUP BY i.customer_id
+        ORDER BY total_spend DESC
+        LIMIT :limit
+    """,
+    # All-time best sellers come straight from the product_sales rollup
+    "top_products_all_time": """
+        SELECT p.description, ps.units as units_sold
+        FROM product_sales ps
+        JOIN products p ON p.stock_code = ps.stock_code
+        ORDER BY ps.units DESC
+        LIMIT :limit
+    """,
+    "top_products": f"""
+        SELECT p.description, SUM(ii.quantity) as units_sold
+        FROM invoice_items ii
+        JOIN invoices i ON ii.invoice_key = i.invoice_key
+        JOIN products p ON p.product_key = ii.product_key
+        WHERE {INVOICE_FILTER}
+        GROUP BY ii.product_key
+        ORDER BY units_sold DESC
+        LIMIT :limit
+    """,
+    "product_sales": f"""
+        SELECT p.stock_code, p.description, SUM(ii.quantity) as units_sold,
+               SUM(ii.quantity * ii.price_cents) / 100.0 as revenue
+        FROM products p
+        JOIN invoice_items ii ON ii.product_key = p.product_key
+        JOIN invoices i ON ii.invoice_key = i.invoice_key
+        WHERE p.stock_code = :stock_code AND {INVOICE_FILTER}
+        GROUP BY p.product_key
+    """,
+    "customer_spend": f"""
+        SELECT i.customer_id, COUNT(DISTINCT i.invoice_key) as invoices,
+               SUM(ii.quantity * ii.price_cents) / 100.0 as total_spend
+        FROM invoices i
+        JOIN invoice_items ii ON ii.invoice_key = i.invoice_key
+        WHERE i.customer_id = :customer_id AND {INVOICE_FILTER}
+        GROUP BY i.customer_id
+    """,
+}
+
+RESULT_CACHE_SIZE = 128
+
+def query_for(routed):
+    """(template name, parameters) for a routed question. Parameters are canonical, so they key the result cache."""
+    intent, slots = routed["intent"], routed["slots"]
+    if intent == "top_products" and "country" not in slots and "start" not in slots:
+        intent = "top_products_all_time"
+    start, end = slots.get("start", "0001-01-01"), slots.get("end", "9999-12-31")
+    params = {
+        "start": start, "end": end, "start_ts": schema.to_epoch(start), "end_ts": schema.to_epoch(end),
+        "country": slots.get("country"), "limit": slots.get("limit"),
+        "stock_code": slots.get("product"), "customer_id": slots.get("customer_id"),
+    }
+    return intent, params
 
-        # 2. Sales IN a specific Country (Filter)
-        elif (" in " in question) and ("sales" in question or "revenue" in question):
-            # Regex to find the word after "in"
-            # We look for "in [Word] [Optional Word]"
-            country_match = re.search(r" in ([a-zA-Z]+(?:\s[a-zA-Z]+)?)", question)
-            if country_match:
-                raw_country = country_match.group(1).strip()
-                # Handle "the uk", "the us" case
-                if raw_country in ["uk", "united kingdom"]: search_term = "United Kingdom"
-                elif raw_country in ["us", "usa", "united states"]: search_term = "USA"
-                elif raw_country == "france": search_term = "France"
-                elif raw_country == "germany": search_term = "Germany"
-                elif raw_country == "australia": search_term = "Australia"
-                else: search_term = raw_country.title()
-                
-                sql = f"""
-                    SELECT SUM(ii.quantity * ii.price) as Revenue_in_{search_term.replace(' ', '_')}
-                    FROM invoice_items ii
-                    JOIN invoices i ON ii.invoice_id = i.invoice_id
-                    WHERE i.country LIKE '%{search_term}%'
-                """
-                interpretation = f"Calculating revenue for {search_term}."
-            else:
-                # Fallback if we see "in" but can't parse country, default to Total
-                sql = "SELECT SUM(quantity * price) as Total_Revenue FROM invoice_items"
-                interpretation = "Could not detect country, showing Total Revenue."
+class DataChatAgent:
+    """
+    Answers questions from one shared read-only connection. Results are cached per
+    (intent, params, data version), so repeated or equivalent questions skip the database
+    until new data is ingested. Use get_agent() to share one agent per database.
+    """
 
-        # 3. Total Revenue (Broad match)
-        elif "revenue" in question or "sales" in question or "how much" in question:
-            sql = "SELECT SUM(quantity * price) as Total_Revenue FROM invoice_items"
-            interpretation = "Calculating total global revenue."
+    def __init__(self, db_path=None, cache_size=RESULT_CACHE_SIZE):
+        self.db_path = db_path or DB_PATH
+        self.cache_size = cache_size
+        self._conn = None
+        self._lock = threading.Lock()
+        self._results = OrderedDict()  # (intent, params, data version) -> DataFrame
+        self._router = (None, None)  # (data version, IntentRouter over that version's entities)
+        self.hits = 0
+        self.misses = 0
 
-        # 4. Top Customers
-        elif "customer" in question:
-            limit = 5
-            match = re.search(r"(\d+)", question)
-            if match:
-                limit = match.group(1)
-            sql = f"""
-                SELECT i.customer_id, SUM(ii.quantity * ii.price) as total_spend
-                FROM invoice_items ii
-                JOIN invoices i ON ii.invoice_id = i.invoice_id
-                GROUP BY i.customer_id
-                ORDER BY total_spend DESC
-                LIMIT {limit}
-            """
-            interpretation = f"Listing top {limit} customers."
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False,
+                                         cached_statements=len(QUERY_TEMPLATES) * 4)
+        return self._conn
 
-        # 5. Top Products
-        elif "product" in question or "item" in question or "best selling" in question:
-            sql = """
-                SELECT description, SUM(quantity) as units_sold
-                FROM invoice_items
-                GROUP BY description
-                ORDER BY units_sold DESC
-                LIMIT 10
-            """
-            interpretation = "Identifying top 10 best-selling products."
+    def router(self, conn, data_version):
+        """The intent router, rebuilt from the database's countries, products and customers when the data changes."""
+        if self._router[0] != data_version:
+            self._router = (data_version, IntentRouter.from_connection(conn))
+        return self._router[1]
 
-        # --- Execution ---
-        if sql:
-            try:
-                df = pd.read_sql(sql, self.conn)
-                return {
-                    "answer": f"Found it! {interpretation}",
-                    "dataframe": df,
-                    "sql": sql,
-                    "interpretation": interpretation
-                }
-            except Exception as e:
-                return {
-                    "answer": f"I tried to run SQL but failed: {e}",
-                    "dataframe": None
-                }
-        else:
+    def ask(self, question):
+        """
+        Translates natural language to SQL and returns the result df.
+        """
+        try:
+            with self._lock:
+                conn = self._connection()
+                data_version = schema.get_data_version(conn)
+                routed = self.router(conn, data_version).route(question)
+                if routed is None:
+                    return {
+                        "answer": f"I didn't understand '{question.lower().strip()}'. Try: 'Total Revenue', 'Sales in France', 'Top 5 Customers'.",
+                        "dataframe": None
+                    }
+                template, params = query_for(routed)
+                interpretation = routed["interpretation"]
+                sql = QUERY_TEMPLATES[template]
+                key = (template, tuple(params.values()), data_version)
+                df = self._results.get(key)
+                cached = df is not None
+                if cached:
+                    self._results.move_to_end(key)
+                    self.hits += 1
+                else:
+                    df = pd.read_sql(sql, conn, params=params)
+                    self._results[key] = df
+                    while len(self._results) > self.cache_size:
+                        self._results.popitem(last=False)
+                    self.misses += 1
+        except Exception as e:
             return {
-                "answer": f"I didn't understand '{question}'. Try: 'Total Revenue', 'Sales in France', 'Top 5 Customers'.",
+                "answer": f"I tried to run SQL but failed: {e}",
                 "dataframe": None
             }
+        found = not df.empty and df.notna().any().any()
+        return {
+            "answer": f"Found it! {interpretation}" if found else f"No matching sales. {interpretation}",
+            "dataframe": df.copy(),
+            "sql": sql,
+            "params": params,
+            "intent": routed["intent"],
+            "slots": routed["slots"],
+            "interpretation": interpretation,
+            "cached": cached,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+_agents = {}
+_agents_lock = threading.Lock()
+
+def get_agent(db_path=None):
+    """The shared DataChatAgent for db_path (default DB_PATH), created on first use."""
+    db_path = db_path or DB_PATH
+    with _agents_lock:
+        if db_path not in _agents:
+            _agents[db_path] = DataChatAgent(db_path)
+        return _agents[db_path]
 
 if __name__ == "__main__":
-    agent = DataChatAgent()
+    agent = get_agent()
     print("Test 1:", agent.ask("What is total revenue?"))
     print("Test 2:", agent.ask("Show top 3 customers"))
     print("Test 3:", agent.ask("Sales in United Kingdom"))
+    print("Test 4:", agent.ask("revenue in the uk")["cached"])
+    print("Test 5:", agent.ask("Top 3 products in France last year"))
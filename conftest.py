@@ -0,0 +1,90 @@
+import csv
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+# Make the top-level modules (create_database, engines, backend) importable from the tests
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import create_database
+
+HEADER = ["Invoice", "StockCode", "Description", "Quantity", "InvoiceDate", "Price", "Customer ID", "Country"]
+
+PRODUCTS = [
+    ("85123A", "WHITE HANGING HEART T-LIGHT HOLDER"),
+    ("71053", "WHITE METAL LANTERN"),
+    ("84406B", "CREAM CUPID HEARTS COAT HANGER"),
+    ("84029G", "KNITTED UNION FLAG HOT WATER BOTTLE"),
+    ("22423", "REGENCY CAKESTAND 3 TIER"),
+    ("21232", "STRAWBERRY CERAMIC TRINKET BOX"),
+    ("20725", "LUNCH BAG RED RETROSPOT"),
+    ("22386", "JUMBO BAG PINK POLKADOT"),
+]
+COUNTRIES = ["United Kingdom", "United Kingdom", "France", "Germany", "EIRE"]
+
+def sample_rows(n_invoices=120, start=datetime(2010, 1, 4, 9, 0)):
+    """
+    Deterministic Online Retail II-style rows: two product groups that are bought together,
+    a steady weekly rhythm and a sprinkling of rows the cleaning rules must reject.
+    """
+    rows = []
+    for k in range(n_invoices):
+        invoice = str(500000 + k)
+        customer = 12346 + (k % 17)
+        country = COUNTRIES[customer % len(COUNTRIES)]
+        when = start + timedelta(days=k // 2, hours=k % 5)
+        basket = PRODUCTS[:3] if k % 2 == 0 else PRODUCTS[3:6]
+        if k % 3 == 0:
+            basket = basket + [PRODUCTS[6 + k % 2]]
+        for j, (code, desc) in enumerate(basket):
+            rows.append([invoice, code, desc, 1 + (k + j) % 6, when.strftime("%Y-%m-%d %H:%M:%S"),
+                         1.25 + j, customer, country])
+    # Rows the loader must drop
+    rows.append(["C500001", "85123A", PRODUCTS[0][1], -2, "2010-01-04 12:00:00", 2.55, 12346, "United Kingdom"])
+    rows.append(["599998", "71053", PRODUCTS[1][1], 3, "2010-01-05 12:00:00", 3.39, "", "United Kingdom"])
+    rows.append(["599999", "71053", PRODUCTS[1][1], 0, "2010-01-05 12:00:00", 3.39, 12350, "France"])
+    return rows
+
+def write_csv(path, rows):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADER)
+        writer.writerows(rows)
+    return str(path)
+
+@pytest.fixture
+def sample_csv(tmp_path):
+    return write_csv(tmp_path / "online_retail_sample.csv", sample_rows())
+
+@pytest.fixture
+def sample_db(tmp_path, sample_csv):
+    db_path = str(tmp_path / "sales_analysis.db")
+    create_database.build_database(db_path, sample_csv, chunk_size=50)
+    return db_path
+
+@pytest.fixture
+def api_client(sample_db):
+    """TestClient for backend.main with every request served from the sample database."""
+    from fastapi.testclient import TestClient
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from backend import main
+
+    read_engine = create_async_engine(f"sqlite+aiosqlite:///file:{sample_db}?mode=ro&uri=true")
+    TestingReadSession = async_sessionmaker(read_engine, expire_on_commit=False)
+
+    async def override_get_read_db():
+        async with TestingReadSession() as db:
+            yield db
+
+    main.app.dependency_overrides[main.get_read_db] = override_get_read_db
+    main.response_cache.clear()
+    client = TestClient(main.app)
+    client.db_engine = read_engine.sync_engine
+    try:
+        yield client
+    finally:
+        main.app.dependency_overrides.clear()
+        main.response_cache.clear()
+        read_engine.sync_engine.dispose()
@@ -1,11 +1,52 @@
-import pandas as pd
+import argparse
+import csv
+import json
 import sqlite3
 import os
+import time
+from datetime import datetime
+from itertools import islice
+
+import db_migrations
+import itemset_miner
+import product_search
+import recommender_engine
+import rfm_engine
+import rollups
+import schema
 
 # Configuration
 EXCEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "online_retail_II.xlsx")
 DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sales_analysis.db")
 
+# Rows read, cleaned and inserted per batch. Bounds peak memory independently of the file size.
+CHUNK_SIZE = 20_000
+
+# Source columns, in the order the loader works with them
+SOURCE_COLUMNS = ["Invoice", "StockCode", "Description", "Quantity", "InvoiceDate", "Price", "Customer ID", "Country"]
+
+# The database is rebuilt from scratch, so durability during the load is traded for speed
+BULK_LOAD_PRAGMAS = (
+    "PRAGMA journal_mode = MEMORY",
+    "PRAGMA synchronous = OFF",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -65536",  # 64MB page cache, the upper bound on loader memory besides one chunk
+)
+
+# Incremental ingests write into the live database: WAL keeps it readable while the load runs
+INCREMENTAL_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -65536",
+)
+
+# SQLite's default limit on host parameters per statement
+MAX_SQL_PARAMS = 900
+
+# Marks the --progress-json lines on stdout
+PROGRESS_PREFIX = "PROGRESS "
+
 def create_connection(db_file):
     """create a database connection to the SQLite database specified by db_file"""
     conn = None
@@ -25,126 +66,357 @@ def create_tables(conn):
         # Enable foreign keys
         cursor.execute("PRAGMA foreign_keys = ON;")
 
-        # Customers Table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS customers (
-                customer_id REAL PRIMARY KEY
-            );
-        """)
-
-        # Products Table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS products (
-                stock_code TEXT PRIMARY KEY,
-                description TEXT
-            );
-        """)
+        # Sales tables in the compact layout and transactions_view (see schema.py)
+        schema.create_tables(cursor)
 
-        # Invoices Table
+        # Ingest bookkeeping: the newest invoice_date loaded from each source file
         cursor.execute("""
-            CREATE TABLE IF NOT EXISTS invoices (
-                invoice_id TEXT PRIMARY KEY,
-                customer_id REAL,
-                invoice_date TIMESTAMP,
-                country TEXT,
-                FOREIGN KEY (customer_id) REFERENCES customers (customer_id)
+            CREATE TABLE IF NOT EXISTS ingest_state (
+                source_file TEXT PRIMARY KEY,
+                high_water_mark TIMESTAMP,
+                rows_loaded INTEGER,
+                updated_at TIMESTAMP
             );
         """)
 
-        # Invoice Items Table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS invoice_items (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                invoice_id TEXT,
-                stock_code TEXT,
-                quantity INTEGER,
-                price REAL,
-                FOREIGN KEY (invoice_id) REFERENCES invoices (invoice_id),
-                FOREIGN KEY (stock_code) REFERENCES products (stock_code)
-            );
-        """)
-        
-        # Create a View for easier querying (replicates the flat file structure)
-        cursor.execute("""
-            CREATE VIEW IF NOT EXISTS transactions_view AS
-            SELECT 
-                i.invoice_id,
-                ii.stock_code,
-                p.description,
-                ii.quantity,
-                i.invoice_date,
-                ii.price,
-                i.customer_id,
-                i.country
-            FROM invoice_items ii
-            JOIN invoices i ON ii.invoice_id = i.invoice_id
-            JOIN products p ON ii.stock_code = p.stock_code;
-        """)
-
         print("Tables and Views created successfully.")
     except sqlite3.Error as e:
         print(f"Error creating tables: {e}")
 
-def load_data_to_db(conn, excel_path):
-    print(f"Loading data from {excel_path}...")
+def _column_positions(header):
+    header = [str(h).strip() if h is not None else "" for h in header]
+    missing = [col for col in SOURCE_COLUMNS if col not in header]
+    if missing:
+        raise ValueError(f"Source file is missing columns: {', '.join(missing)}")
+    return [header.index(col) for col in SOURCE_COLUMNS]
+
+def iter_source_rows(source_path):
+    """
+    Streams raw rows from the source file as tuples ordered like SOURCE_COLUMNS.
+    Excel files are read with openpyxl in read-only mode and CSV files with the csv module,
+    so only the current row is ever materialised.
+    """
+    if source_path.lower().endswith(".csv"):
+        with open(source_path, newline="", encoding="utf-8-sig") as f:
+            reader = csv.reader(f)
+            positions = _column_positions(next(reader))
+            for row in reader:
+                yield tuple(row[p] for p in positions)
+    else:
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(source_path, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            positions = _column_positions(next(rows))
+            for row in rows:
+                yield tuple(row[p] for p in positions)
+        finally:
+            workbook.close()
+
+def iter_chunks(rows, chunk_size):
+    """Groups an iterator of rows into lists of at most chunk_size rows."""
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+def _parse_date(value):
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    value = str(value).strip()
     try:
-        # Load data
-        df = pd.read_excel(excel_path)
-        
-        # Data Cleaning as per notebook
-        print("Cleaning data...")
-        df = df.dropna(subset=["Customer ID"])
-        df = df[~df['Invoice'].astype(str).str.startswith('C')] # Remove cancelled
-        df = df[(df['Quantity'] > 0) & (df['Price'] > 0)]
-        
-        # 1. Populate Customers
-        print("Populating Customers...")
-        customers = df[['Customer ID']].drop_duplicates()
-        customers.columns = ['customer_id']
-        customers.to_sql('customers', conn, if_exists='append', index=False, method='multi', chunksize=500)
-        
-        # 2. Populate Products
-        # Note: Descriptions might vary for the same StockCode; taking the first one found or most frequent is a choice.
-        # Here we drop duplicates on StockCode to have a unique list.
-        print("Populating Products...")
-        products = df[['StockCode', 'Description']].drop_duplicates(subset=['StockCode'])
-        products.columns = ['stock_code', 'description']
-        # Convert StockCode to string to ensure consistency (sometimes pandas infers weird types)
-        products['stock_code'] = products['stock_code'].astype(str)
-        products.to_sql('products', conn, if_exists='append', index=False, method='multi', chunksize=500)
-
-        # 3. Populate Invoices
-        print("Populating Invoices...")
-        invoices = df[['Invoice', 'Customer ID', 'InvoiceDate', 'Country']].drop_duplicates(subset=['Invoice'])
-        invoices.columns = ['invoice_id', 'customer_id', 'invoice_date', 'country']
-        invoices['invoice_id'] = invoices['invoice_id'].astype(str)
-        invoices.to_sql('invoices', conn, if_exists='append', index=False, method='multi', chunksize=500)
-        
-        # 4. Populate Invoice Items
-        print("Populating Invoice Items...")
-        items = df[['Invoice', 'StockCode', 'Quantity', 'Price']]
-        items.columns = ['invoice_id', 'stock_code', 'quantity', 'price']
-        items['invoice_id'] = items['invoice_id'].astype(str)
-        items['stock_code'] = items['stock_code'].astype(str)
-        items.to_sql('invoice_items', conn, if_exists='append', index=False, method='multi', chunksize=500)
-        
-        print("Data insertion complete.")
-        
+        return datetime.fromisoformat(value).strftime("%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        # The UCI CSV export uses US-style "12/1/2009 7:45"
+        return datetime.strptime(value, "%m/%d/%Y %H:%M").strftime("%Y-%m-%d %H:%M:%S")
+
+def _normalise_code(value):
+    # Excel hands back numeric stock codes/invoices as int or float
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+def clean_chunk(chunk):
+    """
+    Applies the notebook's cleaning rules to a chunk of raw rows:
+    drops rows without a Customer ID, cancelled ('C') invoices and non-positive quantity/price.
+    Prices are rounded to whole cents, so prices under half a cent count as non-positive.
+    Returns (clean_rows, rejected_count); clean rows are
+    (invoice_id, stock_code, description, quantity, invoice_date, price_cents, customer_id, country).
+    """
+    clean = []
+    rejected = 0
+    for invoice, stock_code, description, quantity, invoice_date, price, customer_id, country in chunk:
+        try:
+            if customer_id is None or customer_id == "":
+                raise ValueError("missing customer")
+            invoice = _normalise_code(invoice)
+            if invoice.startswith("C"):
+                raise ValueError("cancelled invoice")
+            quantity = int(float(quantity))
+            price = float(price)
+            if quantity <= 0 or price <= 0 or schema.to_cents(price) <= 0:
+                raise ValueError("non-positive quantity or price")
+            clean.append((
+                invoice,
+                _normalise_code(stock_code),
+                description,
+                quantity,
+                _parse_date(invoice_date),
+                schema.to_cents(price),
+                int(float(customer_id)),
+                country,
+            ))
+        except (TypeError, ValueError):
+            rejected += 1
+    return clean, rejected
+
+def insert_chunk(cursor, rows):
+    """
+    Bulk-inserts one cleaned chunk. The first description/header seen for a key wins, as before.
+    Line items get their invoice and product keys from the unique indexes on invoice_id and stock_code.
+    """
+    cursor.executemany(
+        "INSERT OR IGNORE INTO customers (customer_id) VALUES (?)",
+        {(r[6],) for r in rows},
+    )
+    cursor.executemany(
+        "INSERT OR IGNORE INTO countries (country) VALUES (?)",
+        {(r[7],) for r in rows if r[7] is not None},
+    )
+    cursor.executemany(
+        "INSERT OR IGNORE INTO products (stock_code, description) VALUES (?, ?)",
+        [(r[1], r[2]) for r in rows],
+    )
+    headers = {}
+    for r in rows:
+        headers.setdefault(r[0], r)
+    cursor.executemany("""
+        INSERT OR IGNORE INTO invoices (invoice_id, customer_id, invoice_ts, country_key)
+        VALUES (?, ?, ?, (SELECT country_key FROM countries WHERE country = ?))
+    """, [(r[0], r[6], schema.to_epoch(r[4]), r[7]) for r in headers.values()])
+    cursor.executemany("""
+        INSERT INTO invoice_items (invoice_key, product_key, quantity, price_cents)
+        VALUES ((SELECT invoice_key FROM invoices WHERE invoice_id = ?),
+                (SELECT product_key FROM products WHERE stock_code = ?), ?, ?)
+    """, [(r[0], r[1], r[3], r[5]) for r in rows])
+
+def get_high_water_mark(conn, source_path):
+    """Returns the newest invoice_date already ingested from this source file (or None)."""
+    row = conn.execute(
+        "SELECT high_water_mark FROM ingest_state WHERE source_file = ?",
+        (os.path.basename(source_path),),
+    ).fetchone()
+    return row[0] if row else None
+
+def _existing_invoices(cursor, invoice_ids):
+    existing = set()
+    invoice_ids = list(invoice_ids)
+    for i in range(0, len(invoice_ids), MAX_SQL_PARAMS):
+        batch = invoice_ids[i:i + MAX_SQL_PARAMS]
+        placeholders = ",".join("?" * len(batch))
+        existing.update(r[0] for r in cursor.execute(
+            f"SELECT invoice_id FROM invoices WHERE invoice_id IN ({placeholders})", batch))
+    return existing
+
+def filter_new_rows(cursor, rows, high_water_mark, new_invoices):
+    """
+    Incremental mode: keeps only rows belonging to invoices that are not in the database yet.
+    Rows older than the source's high-water mark are dropped without touching the database;
+    invoices are treated as atomic, so a known invoice_id never gets extra line items.
+    new_invoices collects the invoice ids created by this run (their lines may span chunks).
+    """
+    if high_water_mark is not None:
+        rows = [r for r in rows if r[4] >= high_water_mark]
+    candidates = {r[0] for r in rows} - new_invoices
+    new_invoices.update(candidates - _existing_invoices(cursor, candidates))
+    return [r for r in rows if r[0] in new_invoices]
+
+def record_ingest(cursor, source_path, high_water_mark, rows_loaded):
+    cursor.execute("""
+        INSERT INTO ingest_state (source_file, high_water_mark, rows_loaded, updated_at)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(source_file) DO UPDATE SET
+            high_water_mark = MAX(COALESCE(ingest_state.high_water_mark, ''), COALESCE(excluded.high_water_mark, '')),
+            rows_loaded = ingest_state.rows_loaded + excluded.rows_loaded,
+            updated_at = excluded.updated_at
+    """, (os.path.basename(source_path), high_water_mark, rows_loaded,
+          datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+
+def _report(progress, phase, rows_processed=0):
+    if progress is not None:
+        progress(phase, rows_processed)
+
+def load_data_to_db(conn, source_path, chunk_size=CHUNK_SIZE, incremental=False, progress=None):
+    """
+    Streams the source file into the database in bounded chunks.
+    Everything is written inside a single transaction, so a failed load leaves the database untouched.
+    With incremental=True only invoices that are not in the database yet are added (see filter_new_rows),
+    so the cost scales with the size of the delta rather than the history.
+    progress, if given, is called as progress(phase, rows_processed) after every chunk.
+    Returns a dict with the row counts, elapsed time and rows/sec.
+    """
+    mode = "Incrementally loading" if incremental else "Loading"
+    print(f"{mode} data from {source_path} (chunks of {chunk_size:,} rows)...")
+    for pragma in (INCREMENTAL_PRAGMAS if incremental else BULK_LOAD_PRAGMAS):
+        conn.execute(pragma)
+
+    start = time.perf_counter()
+    processed = loaded = rejected = 0
+    first_invoice_date = None
+    high_water_mark = get_high_water_mark(conn, source_path) if incremental else None
+    new_high_water_mark = high_water_mark
+    new_invoices = set()
+    try:
+        with conn:
+            cursor = conn.cursor()
+            for chunk in iter_chunks(iter_source_rows(source_path), chunk_size):
+                rows, chunk_rejected = clean_chunk(chunk)
+                if incremental:
+                    rows = filter_new_rows(cursor, rows, high_water_mark, new_invoices)
+                insert_chunk(cursor, rows)
+                if rows:
+                    chunk_min = min(r[4] for r in rows)
+                    chunk_max = max(r[4] for r in rows)
+                    first_invoice_date = min(first_invoice_date or chunk_min, chunk_min)
+                    new_high_water_mark = max(new_high_water_mark or chunk_max, chunk_max)
+                processed += len(chunk)
+                loaded += len(rows)
+                rejected += chunk_rejected
+                print(f"  ...{processed:,} rows processed")
+                _report(progress, "loading", processed)
+            record_ingest(cursor, source_path, new_high_water_mark, loaded)
     except Exception as e:
         print(f"Error loading data: {e}")
+        raise
+
+    elapsed = time.perf_counter() - start
+    rate = processed / elapsed if elapsed > 0 else 0.0
+    print(f"Data insertion complete: {loaded:,} rows loaded, {rejected:,} rejected "
+          f"in {elapsed:.1f}s ({rate:,.0f} rows/sec).")
+    return {"rows_processed": processed, "rows_loaded": loaded, "rows_rejected": rejected,
+            "seconds": elapsed, "rows_per_sec": rate, "first_invoice_date": first_invoice_date}
 
-def main():
-    if os.path.exists(DB_PATH):
-        print(f"Database already exists at {DB_PATH}. Deleting for fresh start...")
-        os.remove(DB_PATH)
+def build_database(db_path, source_path=EXCEL_PATH, chunk_size=CHUNK_SIZE, incremental=False, progress=None):
+    """Builds (or, with incremental=True, appends to) the database at db_path and applies the migrations."""
+    if incremental and not os.path.exists(db_path):
+        print(f"No database at {db_path} yet. Falling back to a full build...")
+        incremental = False
+    if not incremental and os.path.exists(db_path):
+        print(f"Database already exists at {db_path}. Deleting for fresh start...")
+        for path in (db_path, db_path + "-wal", db_path + "-shm"):
+            if os.path.exists(path):
+                os.remove(path)
 
-    conn = create_connection(DB_PATH)
+    conn = create_connection(db_path)
     if conn is not None:
-        create_tables(conn)
-        load_data_to_db(conn, EXCEL_PATH)
-        conn.close()
+        try:
+            _report(progress, "loading")
+            create_tables(conn)
+            if incremental:
+                # New rows are written in the current layout: bring an older database up to it first
+                db_migrations.apply_migrations(conn)
+            stats = load_data_to_db(conn, source_path, chunk_size, incremental=incremental, progress=progress)
+            # Indexes and rollups are cheaper to build once after a bulk load than to maintain during it
+            _report(progress, "indexing", stats["rows_processed"])
+            db_migrations.apply_migrations(conn)
+            if incremental and stats["rows_loaded"]:
+                with conn:
+                    rollups.refresh_rollups(conn, since=stats["first_invoice_date"])
+                    product_search.rebuild_search_index(conn)
+                    rfm_engine.refresh_segments(conn, since=stats["first_invoice_date"])
+            conn.execute("PRAGMA optimize")
+            # Leave the database in WAL mode so later incremental ingests don't block readers
+            conn.execute("PRAGMA journal_mode = WAL")
+            return stats
+        finally:
+            conn.close()
     else:
         print("Error! cannot create the database connection.")
 
+def publish_database(build_path, db_path):
+    """
+    Replaces the contents of db_path with the finished database at build_path, then removes build_path.
+    The live database is overwritten through SQLite's online backup API in a single write transaction
+    rather than by renaming files: readers keep their current snapshot until it commits and never see
+    a missing or half-written file, and connections that are already open stay valid.
+    """
+    if not os.path.exists(db_path):
+        os.replace(build_path, db_path)
+        return
+    source = sqlite3.connect(build_path)
+    target = sqlite3.connect(db_path, timeout=30)
+    try:
+        target.execute("PRAGMA journal_mode = WAL")
+        source.backup(target)
+        target.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        source.close()
+        target.close()
+    for path in (build_path, build_path + "-wal", build_path + "-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+
+def rebuild_database(db_path, source_path=EXCEL_PATH, chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Full rebuild that never touches the live database until the new one is complete.
+    The data is loaded into a scratch file next to db_path and published with publish_database.
+    """
+    build_path = db_path + ".building"
+    try:
+        stats = build_database(build_path, source_path, chunk_size, progress=progress)
+        if stats is None:
+            raise RuntimeError(f"Could not build the database at {build_path}")
+        _report(progress, "publishing", stats["rows_processed"])
+        publish_database(build_path, db_path)
+    finally:
+        for path in (build_path, build_path + "-wal", build_path + "-shm"):
+            if os.path.exists(path):
+                os.remove(path)
+    train_recommendations(db_path, progress, stats["rows_processed"])
+    _report(progress, "done", stats["rows_processed"])
+    return stats
+
+def train_recommendations(db_path, progress=None, rows_processed=0):
+    """
+    Retrains the shared rules model after a load, so the API and Streamlit only ever serve a saved one.
+    The model describes recommender_engine.DB_PATH; builds of other files leave it alone.
+    """
+    if os.path.abspath(db_path) != os.path.abspath(recommender_engine.DB_PATH):
+        return
+    _report(progress, "training", rows_processed)
+    try:
+        recommender_engine.refresh_rules_model()
+    except itemset_miner.MiningBudgetExceeded as e:
+        # The data is loaded either way; the previous model keeps being served
+        print(f"Warning: Rules model not retrained: {e}")
+
+def print_progress_json(phase, rows_processed):
+    """Progress callback for the CLI: one machine-readable line per update, read by backend.jobs."""
+    print(PROGRESS_PREFIX + json.dumps({"phase": phase, "rows_processed": rows_processed}), flush=True)
+
+def main(source_path=EXCEL_PATH, chunk_size=CHUNK_SIZE, incremental=False, db_path=DB_PATH, progress=None):
+    if incremental:
+        stats = build_database(db_path, source_path, chunk_size, incremental=True, progress=progress)
+        if stats is None:
+            raise RuntimeError(f"Could not open the database at {db_path}")
+        train_recommendations(db_path, progress, stats["rows_processed"])
+        _report(progress, "done", stats["rows_processed"])
+    else:
+        rebuild_database(db_path, source_path, chunk_size, progress=progress)
+
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description="Build sales_analysis.db from the Online Retail II export.")
+    parser.add_argument("source", nargs="?", default=EXCEL_PATH, help="Path to the .xlsx or .csv export")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Rows per insert batch")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Append only new invoices to the existing database instead of rebuilding it")
+    parser.add_argument("--db-path", default=DB_PATH, help="Database to build (default: sales_analysis.db)")
+    parser.add_argument("--progress-json", action="store_true",
+                        help="Emit machine-readable progress lines for the background job runner")
+    args = parser.parse_args()
+    main(args.source, args.chunk_size, incremental=args.incremental, db_path=args.db_path,
+         progress=print_progress_json if args.progress_json else None)
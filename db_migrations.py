@@ -0,0 +1,145 @@
+import argparse
+import sqlite3
+import os
+
+import product_search
+import rfm_engine
+import rollups
+import schema
+
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sales_analysis.db")
+
+def compact_schema(cursor):
+    """Converts a database of the original layout (schema.convert_legacy_layout); a no-op on newer ones."""
+    if not schema.convert_legacy_layout(cursor):
+        return
+    # The search index's triggers were attached to the old products table
+    if cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'products_fts'").fetchone():
+        product_search.create_search_index(cursor)
+
+# The version that introduced the compact layout; older databases are converted before other migrations run
+COMPACT_SCHEMA_VERSION = 7
+
+# Versioned schema migrations, applied in order on top of create_database.create_tables.
+# The applied version is stored in SQLite's PRAGMA user_version, so a migration runs exactly once per DB.
+# Each step is either a SQL statement or a callable taking a cursor.
+MIGRATIONS = [
+    (1, "Covering indexes for the analytics joins", [
+        schema.create_indexes,
+        # Planner statistics, without them SQLite still drives the joins from a scan of invoice_items
+        "ANALYZE",
+    ]),
+    (2, "Daily and monthly revenue rollups", [
+        rollups.create_rollup_tables,
+    ]),
+    (3, "Full-text product search index ranked by sales volume", [
+        rollups.create_product_sales_table,
+        product_search.create_search_index,
+    ]),
+    (4, "Forecasts table for batch hierarchical forecasting", [
+        # One row per series and forecast day, replaced by every batch_forecasting.py run.
+        # series is 'total', 'country=<c>', 'product=<code>' or 'country=<c>|product=<code>'
+        """
+        CREATE TABLE IF NOT EXISTS forecasts (
+            series TEXT NOT NULL,
+            level TEXT NOT NULL,
+            day TEXT NOT NULL,
+            forecast REAL NOT NULL,
+            base_forecast REAL NOT NULL,
+            data_version TEXT,
+            PRIMARY KEY (series, day)
+        ) WITHOUT ROWID
+        """,
+    ]),
+    (5, "RFM customer segments", [
+        rfm_engine.create_segments_table,
+    ]),
+    (6, "Customer lifetime value table for batch CLV scoring", [
+        # One row per repeat customer, replaced by every clv_engine.py run
+        """
+        CREATE TABLE IF NOT EXISTS customer_clv (
+            customer_id INTEGER PRIMARY KEY,
+            frequency INTEGER NOT NULL,
+            recency REAL NOT NULL,
+            T REAL NOT NULL,
+            monetary_value REAL NOT NULL,
+            predicted_purchases REAL NOT NULL,
+            predicted_monetary REAL NOT NULL,
+            clv REAL NOT NULL,
+            data_version TEXT
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_customer_clv_clv ON customer_clv (clv)",
+    ]),
+    (7, "Compact sales tables: integer keys, cents, epoch dates, countries dimension", [
+        compact_schema,
+        "ANALYZE",
+    ]),
+]
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def _run_steps(conn, steps, version=None):
+    """Runs migration steps in one transaction, together with the bump to `version` if given."""
+    cursor = conn.cursor()
+    cursor.execute("BEGIN")
+    try:
+        for step in steps:
+            if callable(step):
+                step(cursor)
+            else:
+                cursor.execute(step)
+        if version is not None:
+            cursor.execute(f"PRAGMA user_version = {int(version)}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+def apply_migrations(conn):
+    """
+    Brings an existing database up to the latest schema version without a rebuild.
+    Each migration runs in its own transaction together with the version bump.
+    Returns the list of versions that were applied.
+    """
+    current = get_schema_version(conn)
+    if current < COMPACT_SCHEMA_VERSION and schema.is_legacy_layout(conn):
+        # Every migration runs today's code, which reads the compact tables: convert those first
+        print("Converting the sales tables to the compact layout...")
+        _run_steps(conn, [compact_schema])
+    applied = []
+    for version, description, steps in MIGRATIONS:
+        if version <= current:
+            continue
+        print(f"Applying migration {version}: {description}...")
+        _run_steps(conn, steps, version)
+        applied.append(version)
+    return applied
+
+def upgrade_database(db_path=DB_PATH):
+    """Applies pending migrations to the database at db_path, if it exists."""
+    if not os.path.exists(db_path):
+        return []
+    conn = sqlite3.connect(db_path)
+    try:
+        # WAL lets the API's readers and the ingest writer work concurrently; create_database.py leaves
+        # the database in WAL, this only matters for databases built before that
+        conn.execute("PRAGMA journal_mode = WAL")
+        return apply_migrations(conn)
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply pending schema migrations to an existing database.")
+    parser.add_argument("db_path", nargs="?", default=DB_PATH)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db_path):
+        raise SystemExit(f"Database not found at {args.db_path}. Run create_database.py first.")
+    conn = sqlite3.connect(args.db_path)
+    try:
+        applied = apply_migrations(conn)
+        print(f"Schema at version {get_schema_version(conn)} ({len(applied)} migration(s) applied).")
+    finally:
+        conn.close()
@@ -0,0 +1,244 @@
+"""
+Rolling-origin backtesting and model selection for daily revenue series.
+
+Every candidate model takes a matrix of series (one per row) and a horizon and returns a matrix of
+forecasts. The cheap baselines (seasonal naive, simple and seasonal exponential smoothing) are
+vectorized with NumPy across all series and their whole parameter grid at once, so they scale to
+thousands of series; the Holt-Winters variants fit statsmodels one series at a time and run in a
+process pool.
+
+    python forecast_backtest.py                      # total revenue series
+    python forecast_backtest.py --hierarchy --top-products 50
+"""
+import argparse
+import os
+import sqlite3
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from statsmodels.tsa.holtwinters import ExponentialSmoothing
+
+warnings.filterwarnings("ignore")
+
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sales_analysis.db")
+
+SEASONAL_PERIOD = 7
+
+# Smoothing parameter grids searched (per series, in one vectorized pass) by the exponential smoothing baselines
+ALPHAS = np.linspace(0.05, 0.95, 19)
+SEASONAL_ALPHAS = np.linspace(0.05, 0.95, 10)
+SEASONAL_GAMMAS = np.array([0.01, 0.05, 0.1, 0.2, 0.3])
+
+HOLT_WINTERS_CONFIGS = {
+    "hw_additive": {"trend": "add", "damped_trend": False, "seasonal": "add", "seasonal_periods": SEASONAL_PERIOD},
+    "hw_damped": {"trend": "add", "damped_trend": True, "seasonal": "add", "seasonal_periods": SEASONAL_PERIOD},
+    "hw_trend": {"trend": "add", "damped_trend": False, "seasonal": None, "seasonal_periods": None},
+}
+
+# Series per process pool task for the models that fit one series at a time
+CHUNK_SIZE = 64
+
+def seasonal_naive(Y, horizon):
+    """Repeats the last week."""
+    Y = np.asarray(Y, dtype=float)
+    last_season = Y[:, -SEASONAL_PERIOD:]
+    reps = -(-horizon // SEASONAL_PERIOD)
+    return np.tile(last_season, reps)[:, :horizon]
+
+def ses(Y, horizon, alphas=ALPHAS):
+    """
+    Simple exponential smoothing with alpha picked per series from the grid by in-sample SSE.
+    The recursion runs once over time on a (series x alphas) array.
+    """
+    Y = np.asarray(Y, dtype=float)
+    level = np.repeat(Y[:, :1], len(alphas), axis=1)
+    sse = np.zeros_like(level)
+    for t in range(1, Y.shape[1]):
+        error = Y[:, t:t + 1] - level
+        sse += error ** 2
+        level += alphas * error
+    final = level[np.arange(len(Y)), sse.argmin(axis=1)]
+    return np.repeat(final[:, None], horizon, axis=1)
+
+def seasonal_ses(Y, horizon, alphas=SEASONAL_ALPHAS, gammas=SEASONAL_GAMMAS):
+    """
+    Exponential smoothing with an additive weekly season and no trend (Holt-Winters without beta),
+    with (alpha, gamma) picked per series from the grid by in-sample SSE, vectorized like ses().
+    """
+    Y = np.asarray(Y, dtype=float)
+    m = SEASONAL_PERIOD
+    n, T = Y.shape
+    if T < 2 * m:
+        return seasonal_naive(Y, horizon)
+    grid_alpha, grid_gamma = (g.ravel() for g in np.meshgrid(alphas, gammas))
+    level = np.repeat(Y[:, :m].mean(axis=1, keepdims=True), len(grid_alpha), axis=1)
+    season = np.repeat((Y[:, :m] - level[:, :1])[:, None, :], len(grid_alpha), axis=1)  # series x grid x m
+    sse = np.zeros_like(level)
+    for t in range(m, T):
+        s = season[:, :, t % m]
+        error = Y[:, t:t + 1] - (level + s)
+        sse += error ** 2
+        level += grid_alpha * error
+        season[:, :, t % m] = s + grid_gamma * error
+    best = sse.argmin(axis=1)
+    rows = np.arange(n)
+    steps = (T + np.arange(horizon)) % m
+    return level[rows, best][:, None] + season[rows, best][:, steps]
+
+def holt_winters(Y, horizon, config):
+    """statsmodels Holt-Winters, one series at a time; series it cannot fit fall back to seasonal naive."""
+    Y = np.asarray(Y, dtype=float)
+    forecasts = seasonal_naive(Y, horizon)
+    for i, y in enumerate(Y):
+        try:
+            fit = ExponentialSmoothing(y, trend=config["trend"], damped_trend=config["damped_trend"],
+                                       seasonal=config["seasonal"], seasonal_periods=config["seasonal_periods"]).fit()
+            forecast = fit.forecast(horizon)
+        except Exception:
+            continue
+        if np.all(np.isfinite(forecast)):
+            forecasts[i] = forecast
+    return forecasts
+
+# Candidate models, cheapest first (ties in selection go to the cheaper model)
+CANDIDATES = ["seasonal_naive", "ses", "seasonal_ses", *HOLT_WINTERS_CONFIGS]
+VECTORIZED = {"seasonal_naive", "ses", "seasonal_ses"}
+
+def run_model(name, Y, horizon):
+    """Forecasts every row of Y with the named candidate."""
+    if name == "seasonal_naive":
+        return seasonal_naive(Y, horizon)
+    if name == "ses":
+        return ses(Y, horizon)
+    if name == "seasonal_ses":
+        return seasonal_ses(Y, horizon)
+    if name in HOLT_WINTERS_CONFIGS:
+        return holt_winters(Y, horizon, HOLT_WINTERS_CONFIGS[name])
+    raise ValueError(f"Unknown model {name!r}; choose from {CANDIDATES}")
+
+def _timed_run(name, Y, horizon):
+    start = time.perf_counter()
+    forecast = run_model(name, Y, horizon)
+    return forecast, time.perf_counter() - start
+
+def run_models(tasks, workers=1):
+    """
+    Runs [(name, Y, horizon)] and returns [(forecast, seconds)] in order. Vectorized models run in-process;
+    the others are split into chunks of series and fitted in a process pool (unless workers == 1).
+    """
+    results = [None] * len(tasks)
+    pooled = []
+    for i, (name, Y, horizon) in enumerate(tasks):
+        if name in VECTORIZED or workers == 1:
+            results[i] = _timed_run(name, Y, horizon)
+        else:
+            pooled.extend((i, start, (name, Y[start:start + CHUNK_SIZE], horizon))
+                          for start in range(0, len(Y), CHUNK_SIZE))
+    if pooled:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [(i, pool.submit(_timed_run, *task)) for i, _, task in pooled]
+            parts = {}
+            for i, future in futures:
+                parts.setdefault(i, []).append(future.result())
+        for i, chunks in parts.items():
+            results[i] = (np.vstack([f for f, _ in chunks]), sum(s for _, s in chunks))
+    return results
+
+def mape(actual, forecast):
+    """Mean absolute percentage error per series (%), over the points where the actual is non-zero."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ape = np.where(actual != 0, np.abs(forecast - actual) / np.abs(actual), np.nan)
+    return np.nanmean(ape, axis=1) * 100 if ape.size else np.array([])
+
+def smape(actual, forecast):
+    """Symmetric MAPE per series (%, 0-200); points where both are zero count as perfect."""
+    denominator = np.abs(actual) + np.abs(forecast)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ape = np.where(denominator > 0, 2 * np.abs(forecast - actual) / denominator, 0.0)
+    return ape.mean(axis=1) * 100
+
+def backtest(Y, models=CANDIDATES, horizon=14, folds=4, step=7, workers=1):
+    """
+    Rolling-origin evaluation: each model is fitted on the history up to `folds` origins `step` days
+    apart and scored on the following `horizon` days.
+    Returns (summary, scores): summary has per model the mean MAPE, sMAPE and fit seconds per origin;
+    scores is series x models with each series' mean sMAPE, for select_models.
+    """
+    Y = np.atleast_2d(np.asarray(Y, dtype=float))
+    T = Y.shape[1]
+    origins = [T - horizon - k * step for k in reversed(range(folds))]
+    origins = [o for o in origins if o >= 2 * SEASONAL_PERIOD]
+    if not origins:
+        raise ValueError(f"Need at least {2 * SEASONAL_PERIOD + horizon} days of history to backtest")
+
+    tasks = [(name, Y[:, :origin], horizon) for name in models for origin in origins]
+    results = iter(run_models(tasks, workers))
+    summary, scores = [], {}
+    for name in models:
+        mapes, smapes, seconds = [], [], 0.0
+        for origin in origins:
+            forecast, elapsed = next(results)
+            actual = Y[:, origin:origin + horizon]
+            mapes.append(mape(actual, forecast))
+            smapes.append(smape(actual, forecast))
+            seconds += elapsed
+        series_smape = np.mean(smapes, axis=0)
+        scores[name] = series_smape
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            summary.append({"model": name, "mape": float(np.nanmean(mapes)), "smape": float(series_smape.mean()),
+                            "fit_seconds": seconds / len(origins)})
+    return pd.DataFrame(summary).set_index("model"), pd.DataFrame(scores)
+
+def select_models(scores):
+    """Best model per series by backtest sMAPE (ties go to the earlier, cheaper model)."""
+    return scores.idxmin(axis=1).to_numpy()
+
+def forecast_selected(Y, horizon, selected, workers=1):
+    """Forecasts each row of Y with its selected model, grouping rows that share a model."""
+    Y = np.asarray(Y, dtype=float)
+    forecasts = np.empty((len(Y), horizon))
+    names = list(dict.fromkeys(selected))
+    rows = {name: np.flatnonzero(selected == name) for name in names}
+    results = run_models([(name, Y[rows[name]], horizon) for name in names], workers)
+    for name, (forecast, _) in zip(names, results):
+        forecasts[rows[name]] = forecast
+    return forecasts
+
+def load_total_series(db_path=DB_PATH):
+    conn = sqlite3.connect(db_path)
+    try:
+        df = pd.read_sql("SELECT day, SUM(revenue) AS revenue FROM daily_sales GROUP BY day ORDER BY day", conn)
+    finally:
+        conn.close()
+    series = df.set_index(pd.to_datetime(df["day"]))["revenue"].resample("D").sum()
+    return series.to_numpy()[None, :]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backtest the forecast candidates and report accuracy per model.")
+    parser.add_argument("--db-path", default=DB_PATH)
+    parser.add_argument("--hierarchy", action="store_true",
+                        help="Backtest every series of the batch_forecasting hierarchy instead of the total")
+    parser.add_argument("--top-products", type=int, default=50)
+    parser.add_argument("--models", nargs="+", default=CANDIDATES, choices=CANDIDATES)
+    parser.add_argument("--horizon", type=int, default=14)
+    parser.add_argument("--folds", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.hierarchy:
+        import batch_forecasting
+        conn = sqlite3.connect(args.db_path)
+        bottom, keys, _ = batch_forecasting.load_bottom_series(conn, args.top_products)
+        conn.close()
+        summing, _ = batch_forecasting.build_hierarchy(keys)
+        Y = summing @ bottom
+    else:
+        Y = load_total_series(args.db_path)
+    summary, scores = backtest(Y, args.models, args.horizon, args.folds, workers=args.workers)
+    summary["wins"] = pd.Series(select_models(scores)).value_counts().reindex(summary.index).fillna(0).astype(int)
+    print(f"{len(Y):,} series, {Y.shape[1]:,} days, {args.folds} origins, horizon {args.horizon}")
+    print(summary.round(3).to_string())
@@ -1,29 +1,64 @@
+import json
+import re
 import pandas as pd
 import numpy as np
 import sqlite3
 import os
+import threading
+from collections import OrderedDict
+from scipy import stats
 from statsmodels.tsa.holtwinters import ExponentialSmoothing
 import warnings
 
+import forecast_backtest
+import schema
+
 # Suppress statsmodels warnings for cleaner logs
 warnings.filterwarnings("ignore")
 
 DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sales_analysis.db")
 
-def get_sales_data():
-    """Fetches daily revenue data from the database."""
+# Fitted parameters are kept next to the rules model, one file per series and model config
+FORECAST_MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+
+# Models the backtest chooses from (forecast_backtest): Holt-Winters variants with a 7-day seasonality, since
+# retail is weekly, and the cheap baselines. DEFAULT_MODEL is used when the history is too short to backtest.
+FORECAST_CANDIDATES = forecast_backtest.CANDIDATES
+DEFAULT_MODEL = "hw_additive"
+BACKTEST_HORIZON = 14
+
+# Sample paths simulated from a Holt-Winters fit for its prediction intervals
+INTERVAL_SIMULATIONS = 1000
+
+# In-memory cache of fitted models: (db, series, data version) -> (history, results, model name)
+FIT_CACHE_SIZE = 8
+_fit_cache = OrderedDict()
+# _fit_lock guards the cache and the lock table only; fits take their series' own lock, so different
+# series fit in parallel while concurrent requests for the same one wait for a single fit
+_fit_lock = threading.Lock()
+_series_locks = {}  # (db, series) -> threading.Lock
+
+def _series_lock(series_name):
+    with _fit_lock:
+        return _series_locks.setdefault((DB_PATH, series_name), threading.Lock())
+
+# Daily totals come from the daily_sales rollup maintained at ingest time; {where} filters one country
+SALES_DATA_SQL = """
+    SELECT 
+        day as date, 
+        SUM(revenue) as revenue
+    FROM daily_sales
+    {where}
+    GROUP BY day
+    ORDER BY day
+"""
+
+def get_sales_data(country=None):
+    """Fetches daily revenue data from the database, for every country or just one."""
     conn = sqlite3.connect(DB_PATH)
     try:
-        query = """
-            SELECT 
-                DATE(i.invoice_date) as date, 
-                SUM(ii.quantity * ii.price) as revenue
-            FROM invoices i
-            JOIN invoice_items ii ON i.invoice_id = ii.invoice_id
-            GROUP BY date
-            ORDER BY date
-        """
-        df = pd.read_sql(query, conn)
+        query = SALES_DATA_SQL.format(where="WHERE country = ?" if country is not None else "")
+        df = pd.read_sql(query, conn, params=(country,) if country is not None else None)
         df['date'] = pd.to_datetime(df['date'])
         df = df.set_index('date')
         # Resample to Daily frequency to ensure continuous timeline (fill missing days with 0)
@@ -32,30 +67,235 @@ def get_sales_data():
     finally:
         conn.close()
 
-def generate_forecast(days=30):
+# --- Fitted model cache ---
+
+def current_data_version():
+    """Data version of the database at DB_PATH (schema.get_data_version)."""
+    conn = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True)
+    try:
+        return schema.get_data_version(conn)
+    finally:
+        conn.close()
+
+def config_key(config):
+    return "_".join(f"{name}-{value}" for name, value in sorted(config.items()))
+
+def series_country(series):
+    """Series names follow batch_forecasting: "total" or "country=<name>". Returns the country, or None for the total."""
+    if series == "total":
+        return None
+    if series.startswith("country=") and len(series) > len("country="):
+        return series[len("country="):]
+    raise ValueError(f"Unknown series {series!r}: use 'total' or 'country=<name>'")
+
+def series_slug(series):
+    return re.sub(r"[^A-Za-z0-9_-]+", "_", series).strip("_")
+
+def model_cache_path(series, config):
+    return os.path.join(FORECAST_MODEL_DIR, f"forecast_{series_slug(series)}_{config_key(config)}.json")
+
+def selection_path(series):
+    return os.path.join(FORECAST_MODEL_DIR, f"forecast_{series_slug(series)}_selection.json")
+
+class BaselineModel:
+    """A fitted-model stand-in for the backtest baselines (seasonal naive, SES), which are cheap to refit."""
+
+    def __init__(self, series, name):
+        self.series = series
+        self.name = name
+
+    def forecast(self, days):
+        return pd.Series(forecast_backtest.run_model(self.name, self.series.values[None, :], days)[0])
+
+    def forecast_std(self, days):
+        """
+        Forecast standard deviation per step, as for a seasonal naive forecast: the spread of the
+        week-on-week differences, growing with the number of whole weeks ahead.
+        """
+        period = forecast_backtest.SEASONAL_PERIOD
+        values = self.series.values
+        sigma = np.sqrt(np.mean((values[period:] - values[:-period]) ** 2))
+        return sigma * np.sqrt(np.arange(days) // period + 1)
+
+def build_model(series, config, params=None):
+    """ExponentialSmoothing for config; with params, the initial states are fixed to the fitted ones."""
+    if params is None:
+        return ExponentialSmoothing(series, trend=config["trend"], damped_trend=config["damped_trend"],
+                                    seasonal=config["seasonal"], seasonal_periods=config["seasonal_periods"])
+    return ExponentialSmoothing(series, trend=config["trend"], damped_trend=config["damped_trend"],
+                                seasonal=config["seasonal"], seasonal_periods=config["seasonal_periods"],
+                                initialization_method="known",
+                                initial_level=params["initial_level"], initial_trend=params["initial_trend"],
+                                initial_seasonal=params["initial_seasons"])
+
+def start_params(params, config):
+    """Previous fitted parameters in the order fit(start_params=...) expects."""
+    values = [params["smoothing_level"]]
+    if config["trend"]:
+        values.append(params["smoothing_trend"])
+    if config["seasonal"]:
+        values.append(params["smoothing_seasonal"])
+    values.append(params["initial_level"])
+    if config["trend"]:
+        values.append(params["initial_trend"])
+    if config["damped_trend"]:
+        values.append(params["damping_trend"])
+    if config["seasonal"]:
+        values.extend(params["initial_seasons"])
+    return values
+
+def fitted_params(results, config):
+    """The JSON-serializable parameters of a fit."""
+    p = results.params
+    params = {"smoothing_level": float(p["smoothing_level"]), "initial_level": float(p["initial_level"])}
+    if config["trend"]:
+        params.update(smoothing_trend=float(p["smoothing_trend"]), initial_trend=float(p["initial_trend"]))
+    else:
+        params.update(smoothing_trend=None, initial_trend=None)
+    params["damping_trend"] = float(p["damping_trend"]) if config["damped_trend"] else None
+    if config["seasonal"]:
+        params.update(smoothing_seasonal=float(p["smoothing_seasonal"]),
+                      initial_seasons=[float(v) for v in p["initial_seasons"]])
+    else:
+        params.update(smoothing_seasonal=None, initial_seasons=None)
+    return params
+
+def fit_model(series, config, saved=None, data_version=None):
     """
-    Generates a revenue forecast for the next 'days' days.
-    Returns: DataFrame with columns [Revenue, Forecast]
+    Fits config to series, reusing a saved fit where possible:
+      same data version      -> rebuild the fit from the saved parameters, no optimization;
+      same start, more days  -> warm start: optimize from the saved parameters, skipping the brute-force grid;
+      otherwise              -> full fit.
+    Returns (results, params, how).
     """
-    df = get_sales_data()
-    
-    # Validation: Need enough data points
-    if len(df) < 14:
-        raise ValueError("Not enough data to forecast. Need at least 14 days of history.")
+    same_start = saved is not None and saved["first_date"] == str(series.index[0].date())
+    if same_start and saved["data_version"] == data_version and saved["n_obs"] == len(series):
+        params = saved["params"]
+        results = build_model(series, config, params).fit(
+            smoothing_level=params["smoothing_level"], smoothing_trend=params["smoothing_trend"],
+            smoothing_seasonal=params["smoothing_seasonal"], damping_trend=params.get("damping_trend"),
+            optimized=False)
+        return results, params, "loaded"
+    if same_start and saved["n_obs"] <= len(series):
+        results = build_model(series, config).fit(start_params=start_params(saved["params"], config), use_brute=False)
+        return results, fitted_params(results, config), "warm"
+    results = build_model(series, config).fit()
+    return results, fitted_params(results, config), "full"
 
-    # 1. Train Model (Holt-Winters Exponential Smoothing)
-    # 'additive' trend/seasonal usually works best for general sales unless they grow exponentially
-    # We use a 7-day seasonality since retail is weekly.
+def select_model(series_name, series, data_version):
+    """
+    The candidate with the lowest backtest sMAPE on this series (forecast_backtest.backtest), re-selected
+    when the data version changes and kept in models/forecast_<series>_selection.json meanwhile.
+    """
+    path = selection_path(series_name)
+    saved = _read_json(path)
+    if saved is not None and saved["data_version"] == data_version and saved["model"] in FORECAST_CANDIDATES:
+        return saved["model"]
     try:
-        model = ExponentialSmoothing(
-            df['revenue'],
-            trend='add',
-            seasonal='add',
-            seasonal_periods=7
-        ).fit()
-    except:
-        # Fallback for simpler data
-        model = ExponentialSmoothing(df['revenue'], trend='add').fit()
+        summary, scores = forecast_backtest.backtest(series.values, FORECAST_CANDIDATES, horizon=BACKTEST_HORIZON)
+    except ValueError as e:
+        print(f"Model selection skipped ({e}); using {DEFAULT_MODEL}")
+        return DEFAULT_MODEL
+    name = forecast_backtest.select_models(scores)[0]
+    print(f"Forecast model selected by backtest: {name} (sMAPE {summary.loc[name, 'smape']:.1f}%)")
+    _write_json(path, {"data_version": data_version, "model": name,
+                       "backtest": summary.round(4).reset_index().to_dict(orient="records")})
+    return name
+
+def get_fitted_model(series_name="total"):
+    """
+    The fitted forecast model for the current data: (history df, fitted results, model name).
+    The model is chosen by backtest (select_model). Holt-Winters fits are cached in memory per data version,
+    and on disk (models/forecast_*.json) so restarts and new data refit from the previous parameters
+    instead of from scratch. The fit does not depend on the horizon.
+    """
+    data_version = current_data_version()
+    key = (DB_PATH, series_name, data_version)
+    with _fit_lock:
+        if key in _fit_cache:
+            _fit_cache.move_to_end(key)
+            return _fit_cache[key]
+
+    with _series_lock(series_name):
+        # Another request may have fitted this series while we waited
+        with _fit_lock:
+            if key in _fit_cache:
+                _fit_cache.move_to_end(key)
+                return _fit_cache[key]
+
+        df = get_sales_data(series_country(series_name))
+        # Validation: Need enough data points
+        if len(df) < 14:
+            raise ValueError("Not enough data to forecast. Need at least 14 days of history.")
+
+        # 1. Train the selected model; a Holt-Winters fit that fails falls back to the seasonal naive baseline
+        name = select_model(series_name, df['revenue'], data_version)
+        results = None
+        if name in forecast_backtest.HOLT_WINTERS_CONFIGS:
+            config = forecast_backtest.HOLT_WINTERS_CONFIGS[name]
+            path = model_cache_path(series_name, config)
+            try:
+                results, params, how = fit_model(df['revenue'], config, _read_json(path), data_version)
+            except (ValueError, np.linalg.LinAlgError) as e:
+                print(f"Forecast model {name} failed to fit ({e}); falling back to seasonal_naive")
+                name = "seasonal_naive"
+            else:
+                print(f"Forecast model {name}: {how} fit on {len(df)} days")
+                if how != "loaded":
+                    _write_json(path, {"data_version": data_version, "first_date": str(df.index[0].date()),
+                                       "n_obs": len(df), "params": params})
+        if results is None:
+            results = BaselineModel(df['revenue'], name)
+
+        with _fit_lock:
+            _fit_cache[key] = (df, results, name)
+            while len(_fit_cache) > FIT_CACHE_SIZE:
+                _fit_cache.popitem(last=False)
+        return df, results, name
+
+def _read_json(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def forecast_intervals(days=30, series_name="total", level=0.95):
+    """
+    Forecast for the next 'days' days with a 'level' prediction interval.
+    Holt-Winters intervals are quantiles of paths simulated from the fit; the baselines use a normal
+    interval (BaselineModel.forecast_std). Revenue cannot go negative, so lower bounds are clipped at 0.
+    Returns: (DataFrame indexed by date with columns [forecast, lower, upper], model name)
+    """
+    df, model, name = get_fitted_model(series_name)
+    forecast = np.asarray(model.forecast(days), dtype=float)
+    if isinstance(model, BaselineModel):
+        half_width = stats.norm.ppf(0.5 + level / 2) * model.forecast_std(days)
+        lower, upper = forecast - half_width, forecast + half_width
+    else:
+        # Seeded normal errors at the residual scale, so identical requests get identical intervals
+        sigma = np.sqrt(np.mean(np.asarray(model.resid) ** 2))
+        errors = np.random.default_rng(0).normal(0.0, sigma, (days, INTERVAL_SIMULATIONS))
+        paths = np.asarray(model.simulate(days, repetitions=INTERVAL_SIMULATIONS, error="add", random_errors=errors))
+        lower, upper = np.quantile(paths.reshape(days, -1), [(1 - level) / 2, (1 + level) / 2], axis=1)
+    future_dates = pd.date_range(start=df.index[-1] + pd.Timedelta(days=1), periods=days)
+    frame = pd.DataFrame({"forecast": forecast, "lower": np.maximum(lower, 0), "upper": upper}, index=future_dates)
+    return frame, name
+
+def generate_forecast(days=30, series_name="total"):
+    """
+    Generates a revenue forecast for the next 'days' days.
+    The fitted model is cached (get_fitted_model), so changing 'days' only re-runs the forecast.
+    Returns: DataFrame with columns [Revenue, Forecast]
+    """
+    df, model, _ = get_fitted_model(series_name)
 
     # 2. Predict
     forecast = model.forecast(days)
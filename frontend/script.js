@@ -93,6 +93,52 @@ async function fetchTopCustomers() {
     }
 }
 
+async function fetchForecast() {
+    try {
+        const response = await fetch(`${API_URL}/analytics/forecast?days=30`);
+        const data = await response.json();
+
+        const labels = data.forecast.map(d => d.date);
+        const ctx = document.getElementById('forecastChart').getContext('2d');
+        new Chart(ctx, {
+            type: 'line',
+            data: {
+                labels: labels,
+                datasets: [{
+                    label: 'Lower',
+                    data: data.forecast.map(d => d.lower),
+                    borderColor: 'transparent',
+                    pointRadius: 0,
+                    fill: false
+                }, {
+                    label: `${Math.round(data.interval_level * 100)}% interval`,
+                    data: data.forecast.map(d => d.upper),
+                    borderColor: 'transparent',
+                    backgroundColor: 'rgba(56, 189, 248, 0.15)',
+                    pointRadius: 0,
+                    fill: '-1'
+                }, {
+                    label: `Forecast (${data.model})`,
+                    data: data.forecast.map(d => d.forecast),
+                    borderColor: '#38bdf8',
+                    tension: 0.3,
+                    fill: false
+                }]
+            },
+            options: {
+                responsive: true,
+                plugins: { legend: { labels: { filter: item => item.text !== 'Lower' } } },
+                scales: {
+                    y: { grid: { color: 'rgba(255,255,255,0.05)' } },
+                    x: { grid: { display: false } }
+                }
+            }
+        });
+    } catch (e) {
+        console.error("Error fetching forecast:", e);
+    }
+}
+
 async function fetchTransactions() {
     try {
         const response = await fetch(`${API_URL}/transactions?limit=5`);
@@ -120,7 +166,7 @@ async function fetchTransactions() {
 // --- Admin ---
 
 document.getElementById('rebuildBtn').addEventListener('click', async () => {
-    if (!confirm("Are you sure? This will delete the current database and rebuild it from Excel. It may take a minute.")) return;
+    if (!confirm("Are you sure? This will rebuild the database from Excel. It may take a minute; the dashboard keeps serving the current data meanwhile.")) return;
 
     const btn = document.getElementById('rebuildBtn');
     const spinner = document.getElementById('spinner');
@@ -135,11 +181,24 @@ document.getElementById('rebuildBtn').addEventListener('click', async () => {
         const response = await fetch(`${API_URL}/system/rebuild-database`, { method: 'POST' });
         const res = await response.json();
 
-        if (response.ok) {
-            alert("Database rebuilt successfully! Result: " + res.status);
+        if (!response.ok) {
+            alert("Error: " + res.detail);
+            return;
+        }
+
+        // The rebuild runs in the background: poll the job until it finishes
+        let job;
+        do {
+            await new Promise(resolve => setTimeout(resolve, 1000));
+            job = await (await fetch(`${API_URL}${res.status_url}`)).json();
+            text.textContent = `Rebuilding (${job.phase}, ${job.rows_processed.toLocaleString()} rows)...`;
+        } while (job.status === 'running');
+
+        if (job.status === 'succeeded') {
+            alert("Database rebuilt successfully!");
             window.location.reload(); // Refresh data
         } else {
-            alert("Error: " + res.detail);
+            alert("Rebuild failed: " + job.error);
         }
     } catch (e) {
         alert("Network Error: " + e.message);
@@ -157,6 +216,7 @@ document.getElementById('rebuildBtn').addEventListener('click', async () => {
         fetchRevenueStats(),
         fetchMonthlySales(),
         fetchTopCustomers(),
+        fetchForecast(),
         fetchTransactions()
     ]);
 })();
@@ -0,0 +1,277 @@
+"""
+Compiled intent router for the chat engine.
+
+Questions are matched in a single pass per matcher:
+  - one compiled regex of concept keywords (revenue, customer, product, ...);
+  - one compiled regex of slot patterns (date ranges, top-N, grouping dimension, customer ids);
+  - a token trie of entity names (countries and their aliases, product descriptions and stock codes),
+    matched longest-first, so the cost does not grow with the size of the catalogue.
+The entity dictionaries are loaded from the database once per data version (IntentRouter.from_connection).
+Intents are data (INTENTS): the first entry whose conditions hold wins.
+"""
+import re
+from datetime import date, timedelta
+
+MAX_LIMIT = 100
+DEFAULT_LIMITS = {"top_customers": 5, "top_products": 10}
+
+# Spellings that name the same country as the database does
+COUNTRY_ALIASES = {
+    "uk": "United Kingdom", "u.k.": "United Kingdom", "britain": "United Kingdom",
+    "great britain": "United Kingdom", "england": "United Kingdom",
+    "usa": "USA", "u.s.": "USA", "u.s.a.": "USA", "united states": "USA", "america": "USA",
+    "ireland": "EIRE",
+}
+
+CONCEPTS = {
+    "revenue": r"revenue|sales|sold|turnover|income|takings|earn(?:ed|ings)?",
+    "how_much": r"how much|total",
+    "customer": r"customers?|clients?|buyers?|shoppers?",
+    "product": r"products?|items?|skus?",
+    "best_selling": r"best[ -]?sell(?:ing|ers?)|top[ -]?sell(?:ing|ers?)|most popular",
+    "breakdown": r"breakdown|split|broken down",
+}
+
+DIMENSIONS = {
+    "country": "country", "countries": "country", "month": "month", "months": "month", "monthly": "month",
+    "day": "day", "days": "day", "daily": "day", "year": "year", "years": "year", "yearly": "year",
+    "annual": "year", "product": "product", "products": "product", "item": "product", "items": "product",
+    "customer": "customer", "customers": "customer",
+}
+
+# Ordered intent table: the first entry whose group_by / slots / concepts conditions all hold wins
+INTENTS = [
+    {"intent": "customer_spend", "slots": ["customer_id"]},
+    {"intent": "product_sales", "slots": ["product"]},
+    {"intent": "top_customers", "group_by": "customer"},
+    {"intent": "top_products", "group_by": "product"},
+    {"intent": "revenue_by_country", "group_by": "country"},
+    {"intent": "revenue_by_month", "group_by": "month"},
+    {"intent": "revenue_by_day", "group_by": "day"},
+    {"intent": "revenue_by_year", "group_by": "year"},
+    {"intent": "top_customers", "concepts": ["customer"]},
+    {"intent": "top_products", "concepts": ["product", "best_selling"]},
+    {"intent": "total_revenue", "concepts": ["revenue", "how_much"]},
+]
+
+_MONTH = (r"jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?"
+          r"|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?")
+MONTHS = ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"]
+
+CONCEPT_PATTERN = re.compile("|".join(rf"(?P<{name}>\b(?:{pattern})\b)" for name, pattern in CONCEPTS.items()))
+
+# Slot patterns in priority order (earlier alternatives win where they overlap)
+SLOT_PATTERN = re.compile("|".join([
+    r"(?P<between>\b(?:between|from)\s+(?P<between_start>\d{4}-\d{2}-\d{2})\s+(?:and|to|until)\s+(?P<between_end>\d{4}-\d{2}-\d{2})\b)",
+    r"(?P<customer>\bcustomer\s*(?:id\s*)?(?:#|no\.?\s*)?(?P<customer_id>\d{4,6})\b)",
+    rf"(?P<month_year>\b(?P<my_month>{_MONTH})\b\.?\s+(?P<my_year>(?:19|20)\d{{2}})\b)",
+    r"(?P<last_n>\b(?:last|past|previous)\s+(?P<last_n_count>\d{1,3})\s+(?P<last_n_unit>day|week|month|year)s?\b)",
+    r"(?P<relative>\b(?P<relative_which>last|this|previous|past|current)\s+(?P<relative_unit>day|week|month|year)\b)",
+    r"(?P<year>\b(?:in\s+|during\s+)?(?P<year_value>(?:19|20)\d{2})\b)",
+    rf"(?P<month>\b(?:in|during)\s+(?P<month_name>{_MONTH})\b(?!\.?\s+(?:19|20)\d{{2}}))",
+    r"(?P<top>\b(?:top|best|first|largest|biggest|highest)\s+(?P<top_n>\d{1,4})\b|\b(?P<n_top>\d{1,4})\s+(?:top|best|biggest|largest|highest|most)\b)",
+    r"(?P<group>\b(?:by|per|each|every|across)\s+(?P<group_dim>countr(?:y|ies)|months?|days?|years?|products?|items?|customers?)\b"
+    r"|\b(?P<group_adj>monthly|daily|yearly|annual)\b)",
+    r"(?P<number>\b(?P<number_value>\d{1,6})\b)",
+]))
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+def add_months(day, months):
+    """First day of the month `months` after day's month."""
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+def months_before(day, months):
+    """The same day of the month `months` earlier, clamped to that month's length."""
+    first = add_months(day, -months)
+    last_day = (add_months(first, 1) - timedelta(days=1)).day
+    return first.replace(day=min(day.day, last_day))
+
+class EntityTrie:
+    """Token trie of entity phrases; scan() finds the longest known phrase at each position."""
+
+    def __init__(self):
+        self.root = {}
+
+    def add(self, phrase, entity):
+        tokens = tokenize(phrase)
+        if not tokens:
+            return
+        node = self.root
+        for token in tokens:
+            node = node.setdefault(token, {})
+        node.setdefault(None, entity)  # the first entity added for a phrase wins
+
+    def scan(self, tokens):
+        """[(entity, start, end)] over the token list, longest match first, non-overlapping."""
+        found = []
+        i = 0
+        while i < len(tokens):
+            node, match = self.root, None
+            for j in range(i, len(tokens)):
+                node = node.get(tokens[j])
+                if node is None:
+                    break
+                if None in node:
+                    match = (node[None], i, j + 1)
+            if match:
+                found.append(match)
+                i = match[2]
+            else:
+                i += 1
+        return found
+
+class IntentRouter:
+    """
+    Routes a question to {"intent", "slots", "interpretation"}, or None when no intent matches.
+    Slots: country, product (stock code), product_name, customer_id, start/end (ISO dates, end exclusive),
+    period (the matched date text), limit and group_by.
+    """
+
+    def __init__(self, countries=(), products=(), customers=(), latest_date=None):
+        self.latest_date = latest_date or date.today()
+        self.customers = {int(c) for c in customers}
+        self.entities = EntityTrie()
+        for country in countries:
+            self.entities.add(country, ("country", country))
+        known = set(countries)
+        for alias, country in COUNTRY_ALIASES.items():
+            if not known or country in known:
+                self.entities.add(alias, ("country", country))
+        self.product_names = {}
+        for stock_code, description in products:
+            self.product_names[stock_code] = description or stock_code
+            self.entities.add(stock_code, ("product", stock_code))
+            if description:
+                self.entities.add(description, ("product", stock_code))
+
+    @classmethod
+    def from_connection(cls, conn):
+        """Loads the entity dictionaries (countries, products, customers, latest invoice date) from the database."""
+        countries = [row[0] for row in conn.execute("SELECT country FROM countries")]
+        products = conn.execute("SELECT stock_code, description FROM products").fetchall()
+        customers = [row[0] for row in conn.execute("SELECT customer_id FROM customers")]
+        latest = conn.execute("SELECT datetime(MAX(invoice_ts), 'unixepoch') FROM invoices").fetchone()[0]
+        return cls(countries, products, customers, date.fromisoformat(latest[:10]) if latest else None)
+
+    def route(self, question):
+        text = question.lower().strip()
+        concepts = {m.lastgroup for m in CONCEPT_PATTERN.finditer(text)}
+        slots, spans = self._match_slots(text)
+
+        # Entities are only looked for outside the spans the slot patterns consumed
+        masked = "".join(" " if any(s <= i < e for s, e in spans) else ch for i, ch in enumerate(text))
+        for (kind, value), _, _ in self.entities.scan(tokenize(masked)):
+            if kind not in slots:
+                slots[kind] = value
+                if kind == "product":
+                    slots["product_name"] = self.product_names[value]
+
+        intent = self._match_intent(concepts, slots)
+        if intent is None:
+            return None
+        if intent in DEFAULT_LIMITS:
+            slots["limit"] = max(1, min(slots.get("limit", slots.get("number", DEFAULT_LIMITS[intent])), MAX_LIMIT))
+        else:
+            slots.pop("limit", None)
+        slots.pop("number", None)
+        return {"intent": intent, "slots": slots, "interpretation": describe(intent, slots)}
+
+    def _match_intent(self, concepts, slots):
+        for spec in INTENTS:
+            if "group_by" in spec and slots.get("group_by") != spec["group_by"]:
+                continue
+            if any(slot not in slots for slot in spec.get("slots", ())):
+                continue
+            if "concepts" in spec and not concepts.intersection(spec["concepts"]):
+                continue
+            return spec["intent"]
+        # A bare country ("france?") or a breakdown without a dimension still asks about revenue
+        if "country" in slots or "breakdown" in concepts:
+            return "revenue_by_country" if "breakdown" in concepts and "country" not in slots else "total_revenue"
+        return None
+
+    def _match_slots(self, text):
+        slots, spans = {}, []
+        for match in SLOT_PATTERN.finditer(text):
+            kind = match.lastgroup  # the outermost group of the alternative that matched
+            if kind == "number":
+                # A bare known customer id ("what did 12346 spend"); stock codes are left to the entity trie
+                value = match.group("number_value")
+                if int(value) in self.customers and value not in self.product_names and "customer_id" not in slots:
+                    slots["customer_id"] = int(value)
+                    spans.append(match.span())
+                elif len(value) <= 3 and "number" not in slots:
+                    slots["number"] = int(value)
+                continue
+            if kind == "customer":
+                slots["customer_id"] = int(match.group("customer_id"))
+            elif kind == "top":
+                slots.setdefault("limit", int(match.group("top_n") or match.group("n_top")))
+            elif kind == "group":
+                word = match.group("group_dim") or match.group("group_adj")
+                slots.setdefault("group_by", DIMENSIONS[word])
+            elif "start" not in slots:
+                start, end = self._date_range(kind, match)
+                slots.update(start=start.isoformat(), end=end.isoformat(), period=match.group(kind).strip())
+            spans.append(match.span())
+        return slots, spans
+
+    def _date_range(self, kind, match):
+        """(start, end exclusive) for a date slot, relative to the latest invoice date where needed."""
+        latest = self.latest_date
+        tomorrow = latest + timedelta(days=1)
+        if kind == "between":
+            return (date.fromisoformat(match.group("between_start")),
+                    date.fromisoformat(match.group("between_end")) + timedelta(days=1))
+        if kind == "month_year":
+            start = date(int(match.group("my_year")), MONTHS.index(match.group("my_month")[:3]) + 1, 1)
+            return start, add_months(start, 1)
+        if kind == "month":
+            month = MONTHS.index(match.group("month_name")[:3]) + 1
+            start = date(latest.year if month <= latest.month else latest.year - 1, month, 1)
+            return start, add_months(start, 1)
+        if kind == "year":
+            year = int(match.group("year_value"))
+            return date(year, 1, 1), date(year + 1, 1, 1)
+        if kind == "last_n":
+            n, unit = int(match.group("last_n_count")), match.group("last_n_unit")
+            if unit in ("day", "week"):
+                return tomorrow - timedelta(days=n * (7 if unit == "week" else 1)), tomorrow
+            return months_before(latest, n * (12 if unit == "year" else 1)) + timedelta(days=1), tomorrow
+        # relative: this/current = the period to date, last/previous/past = the previous whole period
+        unit = match.group("relative_unit")
+        current = match.group("relative_which") in ("this", "current")
+        if unit == "day":
+            return (latest, tomorrow) if current else (latest - timedelta(days=1), latest)
+        if unit == "week":
+            monday = latest - timedelta(days=latest.weekday())
+            return (monday, tomorrow) if current else (monday - timedelta(days=7), monday)
+        if unit == "month":
+            first = latest.replace(day=1)
+            return (first, tomorrow) if current else (add_months(first, -1), first)
+        first = date(latest.year, 1, 1)
+        return (first, tomorrow) if current else (date(latest.year - 1, 1, 1), first)
+
+def describe(intent, slots):
+    """Human-readable interpretation of a routed question."""
+    text = {
+        "customer_spend": f"Calculating spend for customer {slots.get('customer_id')}",
+        "product_sales": f"Calculating sales of {slots.get('product_name')}",
+        "top_customers": f"Listing top {slots.get('limit')} customers",
+        "top_products": f"Identifying top {slots.get('limit')} best-selling products",
+        "revenue_by_country": "Aggregating revenue by country",
+        "revenue_by_month": "Aggregating revenue by month",
+        "revenue_by_day": "Aggregating revenue by day",
+        "revenue_by_year": "Aggregating revenue by year",
+        "total_revenue": "Calculating total revenue" if "country" in slots else "Calculating total global revenue",
+    }[intent]
+    if "country" in slots:
+        text += f" for {slots['country']}" if intent == "total_revenue" else f" in {slots['country']}"
+    if "start" in slots:
+        text += f" ({slots['start']} to {date.fromisoformat(slots['end']) - timedelta(days=1)})"
+    return text + "."
@@ -0,0 +1,119 @@
+"""
+Frequent itemset mining (vertical Eclat) and association rules over a sparse basket matrix.
+
+Each item's column is held as a bitset of the invoices that contain it (a Python int, so AND and
+popcount run in C over the whole column at once). Itemsets are grown depth-first by intersecting
+bitsets, so only one branch of candidates is alive at a time instead of a whole Apriori level.
+"""
+import time
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+class MiningBudgetExceeded(Exception):
+    """Raised when mining runs past its time budget or finds more itemsets than allowed."""
+
+def column_bitsets(matrix, columns):
+    """Returns {column index: bitset of the rows set in that column} for the given columns of a sparse matrix."""
+    csc = sparse.csc_matrix(matrix)
+    n_rows = csc.shape[0]
+    bitsets = {}
+    for j in columns:
+        bits = np.zeros(n_rows, dtype=bool)
+        bits[csc.indices[csc.indptr[j]:csc.indptr[j + 1]]] = True
+        bitsets[j] = int.from_bytes(np.packbits(bits, bitorder="little").tobytes(), "little")
+    return bitsets
+
+def frequent_itemsets(matrix, min_support, columns=None, max_len=None, max_seconds=None, max_itemsets=None):
+    """
+    Mines the itemsets whose support (share of rows containing all their items) is >= min_support.
+    matrix is a (sparse) boolean rows x items matrix; columns labels its columns (default: their index).
+    max_len caps the itemset size. max_seconds and max_itemsets bound the run time and result size
+    and raise MiningBudgetExceeded when exceeded.
+    Returns a DataFrame with `support` and `itemsets` (frozensets of labels), like mlxtend's apriori.
+    """
+    if not 0.0 < min_support <= 1.0:
+        raise ValueError(f"min_support must be in (0, 1], got {min_support}")
+    n_rows = matrix.shape[0]
+    labels = list(columns) if columns is not None else list(range(matrix.shape[1]))
+    if n_rows == 0:
+        return pd.DataFrame({"support": [], "itemsets": []})
+    min_count = int(np.ceil(min_support * n_rows - 1e-9))
+    deadline = None if max_seconds is None else time.perf_counter() + max_seconds
+
+    csc = sparse.csc_matrix(matrix).astype(bool)
+    counts = np.asarray(csc.sum(axis=0)).ravel()
+    frequent = [j for j in np.argsort(counts, kind="stable") if counts[j] >= min_count]
+    bitsets = column_bitsets(csc, frequent)
+    # Supports of all pairs of frequent items from one sparse co-occurrence product, so the first
+    # level of the search only intersects the bitsets of pairs that are known to be frequent
+    frequent_columns = csc[:, frequent].astype(np.int32)
+    pair_counts = (frequent_columns.T @ frequent_columns).tocsr()
+
+    found = []  # (tuple of column indices, count)
+
+    def check_deadline():
+        if deadline is not None and time.perf_counter() > deadline:
+            raise MiningBudgetExceeded(f"Mining exceeded {max_seconds}s after {len(found):,} itemsets")
+
+    def record(itemset, count):
+        found.append((itemset, count))
+        if max_itemsets is not None and len(found) > max_itemsets:
+            raise MiningBudgetExceeded(f"More than {max_itemsets:,} frequent itemsets at min_support={min_support}")
+        check_deadline()
+
+    def extend(prefix, candidates):
+        # candidates: [(column, bitset of prefix + column)], all frequent, in ascending order of item support
+        for i, (item, bits) in enumerate(candidates):
+            itemset = prefix + (item,)
+            record(itemset, bits.bit_count())
+            if max_len is not None and len(itemset) >= max_len:
+                continue
+            children = []
+            for other, other_bits in candidates[i + 1:]:
+                # Also checked here: at a low support this loop can run long without finding anything frequent
+                check_deadline()
+                joint = bits & other_bits
+                if joint.bit_count() >= min_count:
+                    children.append((other, joint))
+            if children:
+                extend(itemset, children)
+
+    for i, j in enumerate(frequent):
+        record((j,), int(counts[j]))
+        if max_len is not None and max_len < 2:
+            continue
+        row = slice(pair_counts.indptr[i], pair_counts.indptr[i + 1])
+        partners = sorted(k for k, count in zip(pair_counts.indices[row], pair_counts.data[row])
+                          if k > i and count >= min_count)
+        if partners:
+            check_deadline()
+            extend((j,), [(frequent[k], bitsets[j] & bitsets[frequent[k]]) for k in partners])
+
+    found.sort(key=lambda entry: (len(entry[0]), -entry[1]))
+    return pd.DataFrame({
+        "support": [count / n_rows for _, count in found],
+        "itemsets": [frozenset(labels[j] for j in itemset) for itemset, _ in found],
+    })
+
+def association_rules(itemsets, min_lift=1.0):
+    """
+    Derives every rule A -> C (A, C non-empty, A + C a frequent itemset) with lift >= min_lift.
+    Every subset of a frequent itemset is frequent too, so all supports come from the itemsets frame.
+    Returns antecedents, consequents (frozensets), support, confidence and lift.
+    """
+    support_of = dict(zip(itemsets["itemsets"], itemsets["support"]))
+    rules = []
+    for itemset, support in support_of.items():
+        if len(itemset) < 2:
+            continue
+        for size in range(1, len(itemset)):
+            for antecedent in map(frozenset, combinations(itemset, size)):
+                consequent = itemset - antecedent
+                confidence = support / support_of[antecedent]
+                lift = confidence / support_of[consequent]
+                if lift >= min_lift:
+                    rules.append((antecedent, consequent, support, confidence, lift))
+    return pd.DataFrame(rules, columns=["antecedents", "consequents", "support", "confidence", "lift"])
@@ -0,0 +1,92 @@
+import re
+import sqlite3
+import os
+
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sales_analysis.db")
+
+# Full-text product search: an FTS5 index over stock codes and descriptions with prefix indexes.
+# Rows are inserted in best-seller order (rowid 1 = most units sold, from the product_sales rollup), so
+# "ORDER BY rowid LIMIT n" returns the top sellers among the matches without reading every match.
+# Triggers keep the index in sync with `products`; new products are searchable at once (appended last)
+# and rebuild_search_index() re-ranks everything after an ingest.
+
+SEARCH_INDEX_SQL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+        stock_code,
+        description,
+        units_sold UNINDEXED,
+        prefix = '2 3 4'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts (stock_code, description, units_sold) VALUES (new.stock_code, new.description, 0);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+        DELETE FROM products_fts WHERE stock_code = old.stock_code;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE ON products BEGIN
+        DELETE FROM products_fts WHERE stock_code = old.stock_code;
+        INSERT INTO products_fts (stock_code, description, units_sold) VALUES (new.stock_code, new.description, 0);
+    END
+    """,
+]
+
+# Named parameters work with both sqlite3 and SQLAlchemy's text()
+SEARCH_SQL = """
+    SELECT stock_code, description, units_sold
+    FROM products_fts
+    WHERE products_fts MATCH :match
+    ORDER BY rowid
+    LIMIT :limit OFFSET :offset
+"""
+
+def rebuild_search_index(conn):
+    """(Re)fills the index in best-seller order. Runs inside the caller's transaction."""
+    conn.execute("DELETE FROM products_fts")
+    conn.execute("""
+        INSERT INTO products_fts (rowid, stock_code, description, units_sold)
+        SELECT ROW_NUMBER() OVER (ORDER BY COALESCE(ps.units, 0) DESC, p.stock_code),
+               p.stock_code, p.description, COALESCE(ps.units, 0)
+        FROM products p
+        LEFT JOIN product_sales ps ON ps.stock_code = p.stock_code
+    """)
+
+def create_search_index(cursor):
+    for statement in SEARCH_INDEX_SQL:
+        cursor.execute(statement)
+    rebuild_search_index(cursor)
+
+def build_match_query(text):
+    """
+    Turns free text into an FTS5 query: every word must match as a prefix.
+    'white heart' -> '"white"* AND "heart"*'. Returns None if there is nothing to search for.
+    """
+    tokens = re.findall(r"\w+", text.lower())
+    if not tokens:
+        return None
+    return " AND ".join(f'"{token}"*' for token in tokens)
+
+def search_params(text, limit=20, offset=0):
+    return {"match": build_match_query(text), "limit": limit, "offset": offset}
+
+def search_products(conn, text, limit=20, offset=0):
+    """Returns [{stock_code, description, units_sold}] for products matching every word of `text`."""
+    params = search_params(text, limit, offset)
+    if params["match"] is None:
+        return []
+    rows = conn.execute(SEARCH_SQL, params).fetchall()
+    return [{"stock_code": r[0], "description": r[1], "units_sold": r[2]} for r in rows]
+
+if __name__ == "__main__":
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        for result in search_products(conn, "white heart", limit=5):
+            print(result)
+    finally:
+        conn.close()
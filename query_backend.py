@@ -0,0 +1,120 @@
+"""
+Pluggable backend for the heavy analytic aggregations over every line item (top customers, top
+products). Each query in QUERIES has a SQLite and a DuckDB version returning the same columns and rows;
+run() executes it on the backend selected by ANALYTICS_BACKEND:
+
+    sqlite  (default) SQLite, single-threaded and row-at-a-time over invoice_items (top products read
+            the product_sales rollup)
+    duckdb  an embedded DuckDB scanning the Parquet snapshot (analytics_snapshot.py): vectorized,
+            multi-threaded, and reading only the columns a query uses
+
+DuckDB is only used while the snapshot is current; when it is missing or stale (after an ingest, until
+the next export) or duckdb is not installed, queries fall back to SQLite, so results never lag the
+database. OLTP-style lookups (single invoices, customers, search) always stay on SQLite.
+
+    ANALYTICS_BACKEND=duckdb python query_backend.py top_customers --limit 5
+"""
+import argparse
+import os
+import sqlite3
+import time
+
+try:
+    import duckdb
+except ImportError:  # optional: without it every query runs on SQLite
+    duckdb = None
+
+import analytics_snapshot
+
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sales_analysis.db")
+BACKENDS = ("sqlite", "duckdb")
+BACKEND = os.environ.get("ANALYTICS_BACKEND", "sqlite").lower()
+
+# Both versions take the same named parameters (:name in SQLite, $name in DuckDB), sum integer cents
+# and order ties the same way, so totals are exact and a LIMIT cuts at the same row on either backend
+QUERIES = {
+    "top_customers": {
+        "columns": ("customer_id", "total_spend"),
+        "sqlite": """
+            SELECT i.customer_id, SUM(ii.quantity * ii.price_cents) / 100.0 as total_spend
+            FROM invoice_items ii
+            JOIN invoices i ON ii.invoice_key = i.invoice_key
+            GROUP BY i.customer_id
+            ORDER BY total_spend DESC, i.customer_id
+            LIMIT :limit
+        """,
+        "duckdb": """
+            SELECT customer_id, SUM(quantity * price_cents) / 100.0 as total_spend
+            FROM transactions
+            GROUP BY customer_id
+            ORDER BY total_spend DESC, customer_id
+            LIMIT $limit
+        """,
+    },
+    "top_products": {
+        "columns": ("stock_code", "description", "revenue"),
+        # The product_sales rollup holds the same per-product cent totals, so SQLite doesn't scan invoice_items
+        "sqlite": """
+            SELECT ps.stock_code, p.description, ps.revenue
+            FROM product_sales ps
+            JOIN products p ON p.stock_code = ps.stock_code
+            ORDER BY ps.revenue DESC, ps.stock_code
+            LIMIT :limit
+        """,
+        "duckdb": """
+            SELECT stock_code, ANY_VALUE(description) as description,
+                   SUM(quantity * price_cents) / 100.0 as revenue
+            FROM transactions
+            GROUP BY stock_code
+            ORDER BY revenue DESC, stock_code
+            LIMIT $limit
+        """,
+    },
+}
+
+def resolve_backend(conn, backend=None, snapshot_path=None):
+    """The backend a query will actually run on: `backend` (default BACKEND), or sqlite if DuckDB can't serve it."""
+    backend = backend or BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown analytics backend {backend!r}; expected one of {BACKENDS}")
+    if backend == "duckdb" and (duckdb is None or not analytics_snapshot.snapshot_is_current(conn, snapshot_path)):
+        return "sqlite"
+    return backend
+
+def _run_duckdb(sql, params, snapshot_path=None):
+    # A fresh in-memory database per query: connecting is cheap, and the snapshot is re-read from disk
+    # each time, so a new export is picked up without any invalidation
+    glob = os.path.join(snapshot_path or analytics_snapshot.SNAPSHOT_PATH, "*", "*.parquet").replace("'", "''")
+    with duckdb.connect() as conn:
+        conn.execute(f"CREATE VIEW transactions AS SELECT * FROM read_parquet('{glob}')")
+        return conn.execute(sql, params).fetchall()
+
+def run(name, params=None, db_path=DB_PATH, backend=None, snapshot_path=None):
+    """Runs QUERIES[name] with `params` on the configured backend; returns a list of row tuples."""
+    query = QUERIES[name]
+    params = params or {}
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        if resolve_backend(conn, backend, snapshot_path) == "duckdb":
+            return _run_duckdb(query["duckdb"], params, snapshot_path)
+        return conn.execute(query["sqlite"], params).fetchall()
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run one of the analytic queries on the configured backend.")
+    parser.add_argument("query", choices=sorted(QUERIES))
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--db-path", default=DB_PATH)
+    parser.add_argument("--backend", choices=BACKENDS, default=None, help=f"default: ANALYTICS_BACKEND ({BACKEND})")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db_path)
+    backend = resolve_backend(conn, args.backend)
+    conn.close()
+    start = time.perf_counter()
+    rows = run(args.query, {"limit": args.limit}, args.db_path, backend)
+    print(" | ".join(QUERIES[args.query]["columns"]))
+    for row in rows:
+        print(" | ".join(str(value) for value in row))
+    print(f"{len(rows)} rows from {backend} in {time.perf_counter() - start:.3f}s")
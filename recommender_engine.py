@@ -1,103 +1,448 @@
+import argparse
+import json
+import numpy as np
 import pandas as pd
+import re
 import sqlite3
 import os
-from mlxtend.frequent_patterns import apriori, association_rules
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+import pyarrow.dataset as ds
+from scipy import sparse
 import warnings
 
+import analytics_snapshot
+import itemset_miner
+import schema
+
 warnings.filterwarnings("ignore")
 
 DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sales_analysis.db")
 
-def get_transaction_matrix():
+# Upper bound on frequent-itemset mining per run, so a too-low min_support fails fast instead of hanging
+MINING_TIME_BUDGET = 60
+
+# Columns invoices can be partitioned on for per-market training (train_partitioned_models).
+# Only these expressions are ever interpolated into SQL.
+PARTITION_COLUMNS = {
+    "country": "COALESCE(c.country, 'Unspecified')",
+    "year": "strftime('%Y', i.invoice_ts, 'unixepoch')",
+}
+# Partitions with fewer invoices than this are not mined: their supports would be noise
+MIN_PARTITION_INVOICES = 200
+
+# Persisted rules model (see get_rules_model): where it lives, what it is mined with, how much it keeps
+RULES_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "association_rules.json")
+RULES_MIN_SUPPORT = 0.01
+MAX_RULES_PER_PRODUCT = 20
+
+def build_basket_matrix(conn, max_products=None, partition=None):
+    """
+    Builds the basket matrix straight from the line items as a sparse boolean CSR matrix:
+    rows are invoices, columns are stock codes, True if the invoice bought the product.
+    Only the (invoice, product) pairs that exist are stored, so memory grows with the number
+    of line items rather than invoices x products and every SKU can be kept.
+    With max_products, only the most frequently bought stock codes are kept as columns.
+    With partition=(column, value), only invoices in that partition (see PARTITION_COLUMNS) are read.
+    Returns (matrix, invoice_ids, stock_codes).
+    """
+    lines = read_basket_lines(conn, partition)
+    rows, invoice_ids = pd.factorize(lines["invoice_id"])
+    cols, stock_codes = pd.factorize(lines["stock_code"])
+    # Duplicate lines of the same product on one invoice collapse into a single True
+    matrix = sparse.csr_matrix((np.ones(len(rows), dtype=bool), (rows, cols)),
+                               shape=(len(invoice_ids), len(stock_codes)))
+    matrix.sum_duplicates()
+
+    if max_products is not None and max_products < len(stock_codes):
+        line_counts = np.bincount(cols, minlength=len(stock_codes))
+        keep = np.sort(np.argsort(-line_counts, kind="stable")[:max_products])
+        matrix = matrix[:, keep]
+        stock_codes = stock_codes[keep]
+    return matrix, np.asarray(invoice_ids), np.asarray(stock_codes)
+
+def read_basket_lines(conn, partition=None):
+    """
+    (invoice_id, stock_code) of every line with a positive quantity. Read from the Parquet snapshot
+    (analytics_snapshot) when it is current, projecting just those columns, else from SQLite.
+    """
+    if partition is not None:
+        column, value = partition
+        expression = partition_expression(column)
+    if analytics_snapshot.snapshot_is_current(conn):
+        predicate = ds.field("quantity") > 0
+        start = end = None
+        if partition is not None and column == "country":
+            country = ds.field("country")
+            predicate &= (country == value) | country.is_null() if value == "Unspecified" else country == value
+        elif partition is not None:
+            start, end = f"{value}-01-01", f"{int(value) + 1}-01-01"
+        table = analytics_snapshot.load_transactions(["invoice_id", "stock_code"], start, end, predicate)
+        return analytics_snapshot.to_pandas(table)
+    where, params = ("", ()) if partition is None else (f"AND {expression} = ?", (value,))
+    return pd.read_sql(f"""
+        SELECT i.invoice_id, p.stock_code
+        FROM invoices i
+        JOIN invoice_items ii ON ii.invoice_key = i.invoice_key
+        JOIN products p ON p.product_key = ii.product_key
+        LEFT JOIN countries c ON c.country_key = i.country_key
+        WHERE ii.quantity > 0 {where}
+    """, conn, params=params)
+
+def partition_expression(column):
+    if column not in PARTITION_COLUMNS:
+        raise ValueError(f"Cannot partition on {column!r}; choose one of {sorted(PARTITION_COLUMNS)}")
+    return PARTITION_COLUMNS[column]
+
+def load_basket(max_products=None):
     """
-    Creates a basket matrix: Rows=Invoices, Cols=Products, Value=1 if present.
-    To save memory/time, we might filter for top products or a decent sample.
+    Returns (matrix, invoice_ids, stock_codes, descriptions) from the database,
+    or None if the tables are missing.
     """
     conn = sqlite3.connect(DB_PATH)
     try:
-        # Get data: Invoice vs Description
-        # We limit to top 200 products by volume to keep Apriori fast for this demo
-        query_top_products = """
-            SELECT description 
-            FROM invoice_items 
-            GROUP BY description 
-            ORDER BY count(*) DESC 
-            LIMIT 200
-        """
-        try:
-            top_products = pd.read_sql(query_top_products, conn)['description'].tolist()
-        except:
-            print("Warning: Could not fetch top products (Table might be missing)")
-            return pd.DataFrame(), []
-            
-        # Proper escaping for SQL IN clause isn't trivial with pandas read_sql params for list,
-        # so we fetch all relevant items and pivot in pandas.
-        
-        # Proper escaping for SQL IN clause isn't trivial with pandas read_sql params for list,
-        # so we fetch all relevant items and pivot in pandas.
-        query = """
-            SELECT i.invoice_id, ii.description, ii.quantity
-            FROM invoice_items ii
-            JOIN invoices i ON ii.invoice_id = i.invoice_id
-            WHERE ii.quantity > 0
-        """
-        df = pd.read_sql(query, conn)
-        
-        # Filter for top products only
-        df = df[df['description'].isin(top_products)]
-        
-        # Pivot: Invoice x Product
-        basket = (df.groupby(['invoice_id', 'description'])['quantity']
-                  .sum().unstack().reset_index().fillna(0)
-                  .set_index('invoice_id'))
-        
-        # Encode: >0 to 1, else 0
-        def encode_units(x):
-            if x <= 0: return 0
-            if x >= 1: return 1
-            
-        basket_encoded = basket.applymap(encode_units)
-        return basket_encoded, top_products
+        matrix, invoice_ids, stock_codes = build_basket_matrix(conn, max_products)
+        descriptions = dict(conn.execute("SELECT stock_code, description FROM products").fetchall())
+        return matrix, invoice_ids, stock_codes, descriptions
+    except Exception:
+        print("Warning: Could not build the basket matrix (Table might be missing)")
+        return None
     finally:
         conn.close()
 
-def generate_recommendations(min_support=0.02, min_lift=1.0):
+def get_transaction_matrix(max_products=None):
     """
-    Runs Market Basket Analysis.
-    Returns: DataFrame rules
+    Creates a basket matrix: Rows=Invoices, Cols=Stock codes, Value=True if present.
+    The frame is backed by the sparse matrix from build_basket_matrix, so it is never densified.
+    Returns the basket and a {stock_code: description} map for labelling the rules.
+    """
+    basket = load_basket(max_products)
+    if basket is None:
+        return pd.DataFrame(), {}
+    matrix, invoice_ids, stock_codes, descriptions = basket
+    return pd.DataFrame.sparse.from_spmatrix(matrix, index=invoice_ids, columns=stock_codes), descriptions
+
+def mine_rules(min_support=0.02, min_lift=1.0, max_len=None, max_seconds=MINING_TIME_BUDGET):
+    """
+    Mines association rules over stock codes.
+    Frequent itemsets are mined with itemset_miner (Eclat over the sparse basket); max_len caps the
+    itemset size and max_seconds the mining time (itemset_miner.MiningBudgetExceeded when exceeded).
+    Returns (rules, descriptions): antecedents/consequents are frozensets of stock codes.
     """
     print("Building transaction matrix...")
-    basket, _ = get_transaction_matrix()
-    
-    if basket.empty:
-        return pd.DataFrame()
+    basket = load_basket()
+    if basket is None or basket[0].shape[0] == 0:
+        return pd.DataFrame(), {}
+    matrix, _, stock_codes, descriptions = basket
 
-    print(f"Matrix shape: {basket.shape}. Running Apriori...")
+    print(f"Matrix shape: {matrix.shape}. Mining frequent itemsets...")
     # 1. Frequent Itemsets
-    frequent_itemsets = apriori(basket, min_support=min_support, use_colnames=True)
-    
+    frequent_itemsets = itemset_miner.frequent_itemsets(matrix, min_support, columns=stock_codes,
+                                                        max_len=max_len, max_seconds=max_seconds)
     if frequent_itemsets.empty:
         print("No frequent itemsets found. Try lowering min_support.")
-        return pd.DataFrame()
+        return pd.DataFrame(), descriptions
 
     # 2. Association Rules
-    rules = association_rules(frequent_itemsets, metric="lift", min_threshold=min_lift)
+    return itemset_miner.association_rules(frequent_itemsets, min_lift=min_lift), descriptions
+
+def generate_recommendations(min_support=0.02, min_lift=1.0, max_len=None, max_seconds=MINING_TIME_BUDGET):
+    """
+    Runs Market Basket Analysis.
+    Returns: DataFrame rules
+    """
+    rules, descriptions = mine_rules(min_support, min_lift, max_len, max_seconds)
+    if rules.empty:
+        return pd.DataFrame()
     
-    # Clean up output
-    rules['antecedents'] = rules['antecedents'].apply(lambda x: list(x)[0])
-    rules['consequents'] = rules['consequents'].apply(lambda x: list(x)[0])
+    # Clean up output: label the rules with product descriptions ("A + B" for multi-item sides)
+    label = lambda items: " + ".join(descriptions.get(code) or code for code in sorted(items))
+    rules['antecedents'] = rules['antecedents'].apply(label)
+    rules['consequents'] = rules['consequents'].apply(label)
     
     # Sort by Confidence (Strength of prediction)
     rules = rules.sort_values('confidence', ascending=False)
     
     return rules[['antecedents', 'consequents', 'support', 'confidence', 'lift']]
 
-if __name__ == "__main__":
-    print("Testing Recommender Engine...")
+# --- Persisted rules model ---
+
+class RulesModel:
+    """
+    Trained association rules, as (antecedent, consequent, confidence, lift, support) tuples with the
+    items of both sides sorted, plus two lookup structures built from them:
+      index: single-item rules by antecedent, {stock_code: [(consequent, confidence, lift, support), ...]},
+             best first, so a product recommendation is one dict lookup and a slice;
+      trie:  every rule stored under its sorted antecedent, so a basket finds all rules whose
+             antecedent it contains by walking only the branches made of its own items.
+    data_version ties the model to the data it was mined from (schema.get_data_version).
+    """
+
+    def __init__(self, rules, descriptions, data_version, params):
+        self.rules = rules
+        self.descriptions = descriptions
+        self.data_version = data_version
+        self.params = params
+        self.index = build_rules_index(rules)
+        self.trie = build_rule_trie(rules)
+
+    def recommend(self, stock_code, k=5):
+        return [
+            {"stock_code": consequent, "description": self.descriptions.get(consequent),
+             "confidence": confidence, "lift": lift, "support": support}
+            for consequent, confidence, lift, support in self.index.get(stock_code, ())[:k]
+        ]
+
+    def recommend_basket(self, cart, k=5):
+        """
+        Ranks the products to suggest for a cart of stock codes, using every rule whose antecedent is
+        contained in the cart (multi-item antecedents included). A product's score is the best confidence
+        (then lift, then the more specific antecedent) among the rules that suggest it;
+        `because` is that rule's antecedent.
+        """
+        items = sorted(set(cart))
+        in_cart = set(items)
+        best = {}  # suggested stock_code -> (confidence, lift, antecedent length, antecedent)
+        stack = [(self.trie, 0)]
+        while stack:
+            node, start = stack.pop()
+            for antecedent, consequent, confidence, lift, _ in node["rules"]:
+                score = (confidence, lift, len(antecedent))
+                for item in consequent:
+                    if item not in in_cart and (item not in best or score > best[item][:3]):
+                        best[item] = score + (antecedent,)
+            # Antecedents are sorted, so only cart items after the current one can continue the path
+            for position in range(start, len(items)):
+                child = node["next"].get(items[position])
+                if child is not None:
+                    stack.append((child, position + 1))
+        ranked = sorted(best.items(), key=lambda entry: (-entry[1][0], -entry[1][1], entry[0]))[:k]
+        return [
+            {"stock_code": code, "description": self.descriptions.get(code),
+             "confidence": confidence, "lift": lift, "because": list(antecedent)}
+            for code, (confidence, lift, _, antecedent) in ranked
+        ]
+
+    def to_dict(self):
+        return {"data_version": self.data_version, "params": self.params,
+                "descriptions": self.descriptions, "rules": self.rules}
+
+    @classmethod
+    def from_dict(cls, data):
+        rules = [(tuple(a), tuple(c), confidence, lift, support) for a, c, confidence, lift, support in data["rules"]]
+        return cls(rules, data["descriptions"], data["data_version"], data["params"])
+
+def rules_to_tuples(rules):
+    """Converts a rules frame (frozensets of stock codes) into the tuples RulesModel keeps."""
+    return [(tuple(sorted(row.antecedents)), tuple(sorted(row.consequents)), row.confidence, row.lift, row.support)
+            for row in rules.itertuples(index=False)]
+
+def build_rules_index(rules, max_per_product=MAX_RULES_PER_PRODUCT):
+    """Groups the single-item rules (A -> B) by antecedent, best confidence (then lift) first."""
+    index = {}
+    for antecedent, consequent, confidence, lift, support in rules:
+        if len(antecedent) == 1 and len(consequent) == 1:
+            index.setdefault(antecedent[0], []).append((consequent[0], confidence, lift, support))
+    for code, entries in index.items():
+        entries.sort(key=lambda entry: (-entry[1], -entry[2]))
+        del entries[max_per_product:]
+    return index
+
+def build_rule_trie(rules):
+    """Prefix trie over the sorted antecedents: {"next": {stock_code: node}, "rules": [rules ending here]}."""
+    root = {"next": {}, "rules": []}
+    for rule in rules:
+        node = root
+        for item in rule[0]:
+            node = node["next"].setdefault(item, {"next": {}, "rules": []})
+        node["rules"].append(rule)
+    return root
+
+def current_data_version():
+    """Data version of the database at DB_PATH, or None if there is no (loaded) database yet."""
+    if not os.path.exists(DB_PATH):
+        return None
+    conn = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True)
+    try:
+        return schema.get_data_version(conn)
+    except sqlite3.Error:
+        return None
+    finally:
+        conn.close()
+
+def train_rules_model(min_support=None, min_lift=1.0):
+    """Mines the rules (at RULES_MIN_SUPPORT unless given) and builds the per-product index."""
+    min_support = min_support or RULES_MIN_SUPPORT
+    data_version = current_data_version()
+    rules, descriptions = mine_rules(min_support, min_lift)
+    rules = rules_to_tuples(rules) if not rules.empty else []
+    used = {item for rule in rules for item in rule[0] + rule[1]}
+    return RulesModel(rules, {code: descriptions.get(code) for code in used}, data_version,
+                      {"min_support": min_support, "min_lift": min_lift})
+
+def save_rules_model(model, path=None):
+    """Writes the model as JSON (via a temp file + rename, so readers never see a partial file)."""
+    path = path or RULES_MODEL_PATH
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(model.to_dict(), f)
+    os.replace(tmp_path, path)
+
+def load_rules_model(path=None):
+    """Reads a saved model, or returns None if there is none (or it is unreadable)."""
+    path = path or RULES_MODEL_PATH
     try:
-        rules = generate_recommendations(min_support=0.01) # Low support for demo data
-        print(f"Success! Found {len(rules)} association rules.")
-        if not rules.empty:
-            print(rules.head(5))
-    except Exception as e:
-        print(f"Error: {e}")
+        with open(path, encoding="utf-8") as f:
+            return RulesModel.from_dict(json.load(f))
+    except (OSError, ValueError, KeyError):
+        return None
+
+def _db_stamp():
+    stamp = []
+    for path in (DB_PATH, DB_PATH + "-wal"):
+        try:
+            st = os.stat(path)
+            stamp.append((st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            stamp.append(None)
+    return tuple(stamp)
+
+_model_lock = threading.Lock()
+_loaded_models = {}  # (DB_PATH, RULES_MODEL_PATH) -> (db stamp, RulesModel)
+
+def get_rules_model():
+    """
+    The saved rules model, shared by every caller in the process, or None if none has been trained yet.
+    Never mines: a model that predates the latest ingest is served until refresh_rules_model() replaces
+    it (after every build, see create_database.main). While the database files are untouched this is a
+    stat() and a dict lookup.
+    """
+    key = (DB_PATH, RULES_MODEL_PATH)
+    stamp = _db_stamp()
+    cached = _loaded_models.get(key)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    with _model_lock:
+        cached = _loaded_models.get(key)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        # Another process (the ingest job, Streamlit) may have saved a newer model
+        model = load_rules_model() or (cached[1] if cached is not None else None)
+        if model is not None:
+            _loaded_models[key] = (stamp, model)
+        return model
+
+def refresh_rules_model(min_support=None, min_lift=1.0):
+    """
+    Retrains (and saves) the rules model unless the saved one was mined from the current data with the
+    same parameters. Mining is bounded by MINING_TIME_BUDGET; itemset_miner.MiningBudgetExceeded leaves
+    the saved model in place.
+    """
+    min_support = min_support or RULES_MIN_SUPPORT
+    params = {"min_support": min_support, "min_lift": min_lift}
+    key = (DB_PATH, RULES_MODEL_PATH)
+    with _model_lock:
+        stamp = _db_stamp()
+        data_version = current_data_version()
+
+        def is_current(model):
+            return model is not None and model.data_version == data_version and model.params == params
+
+        cached = _loaded_models.get(key)
+        model = cached[1] if cached is not None else None
+        if not is_current(model):
+            model = load_rules_model()
+        if not is_current(model):
+            print(f"Training rules model for data version {data_version}...")
+            model = train_rules_model(min_support, min_lift)
+            save_rules_model(model)
+        _loaded_models[key] = (stamp, model)
+        return model
+
+# --- Partitioned training ---
+
+def partition_model_path(column, value):
+    """Where the rules model of one partition is saved: models/association_rules_by_<column>/<value>.json."""
+    slug = re.sub(r"[^A-Za-z0-9_-]+", "_", str(value)).strip("_") or "_"
+    return os.path.join(os.path.dirname(RULES_MODEL_PATH), f"association_rules_by_{column}", slug + ".json")
+
+def list_partitions(conn, column):
+    """[(value, invoice count)] for the partition column, largest first."""
+    return conn.execute(f"""
+        SELECT {partition_expression(column)} AS value, COUNT(*)
+        FROM invoices i
+        LEFT JOIN countries c ON c.country_key = i.country_key
+        GROUP BY value ORDER BY COUNT(*) DESC
+    """).fetchall()
+
+def _mine_partition(db_path, column, value, min_support, min_lift, max_seconds):
+    """Process pool worker: loads its own partition from the database and mines it."""
+    start = time.perf_counter()
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        matrix, _, stock_codes = build_basket_matrix(conn, partition=(column, value))
+    finally:
+        conn.close()
+    itemsets = itemset_miner.frequent_itemsets(matrix, min_support, columns=stock_codes, max_seconds=max_seconds)
+    rules = itemset_miner.association_rules(itemsets, min_lift=min_lift) if not itemsets.empty else pd.DataFrame()
+    return rules_to_tuples(rules) if not rules.empty else [], matrix.shape[0], time.perf_counter() - start
+
+def train_partitioned_models(column="country", min_support=None, min_lift=1.0,
+                             min_invoices=MIN_PARTITION_INVOICES, workers=None, max_seconds=MINING_TIME_BUDGET):
+    """
+    Mines a separate rule set per partition of the invoices (per country by default) in a process pool
+    and saves each one as its own model (partition_model_path). Partitions with fewer than min_invoices
+    invoices are skipped. Each worker reads only its partition, and the largest partitions are submitted
+    first, so the wall time approaches that of the largest partition instead of the sum.
+    Returns {value: {"invoices", "rules", "seconds"}} for the trained partitions and the skipped values.
+    """
+    min_support = min_support or RULES_MIN_SUPPORT
+    conn = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True)
+    try:
+        partitions = list_partitions(conn, column)
+        descriptions = dict(conn.execute("SELECT stock_code, description FROM products").fetchall())
+        data_version = schema.get_data_version(conn)
+    finally:
+        conn.close()
+    selected = [value for value, invoices in partitions if invoices >= min_invoices]
+    skipped = [value for value, invoices in partitions if invoices < min_invoices]
+
+    start = time.perf_counter()
+    summary = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {value: pool.submit(_mine_partition, DB_PATH, column, value, min_support, min_lift, max_seconds)
+                   for value in selected}
+        for value, future in futures.items():
+            rules, invoices, seconds = future.result()
+            used = {item for rule in rules for item in rule[0] + rule[1]}
+            params = {"min_support": min_support, "min_lift": min_lift, "partition": [column, value]}
+            model = RulesModel(rules, {code: descriptions.get(code) for code in used}, data_version, params)
+            save_rules_model(model, partition_model_path(column, value))
+            summary[value] = {"invoices": invoices, "rules": len(rules), "seconds": seconds}
+    elapsed = time.perf_counter() - start
+    print(f"Trained {len(summary)} {column} partitions in {elapsed:.1f}s "
+          f"(largest {max((s['seconds'] for s in summary.values()), default=0):.1f}s, "
+          f"sum {sum(s['seconds'] for s in summary.values()):.1f}s); skipped {len(skipped)} small partitions.")
+    return summary, skipped
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mine association rules from sales_analysis.db.")
+    parser.add_argument("--partition", choices=sorted(PARTITION_COLUMNS),
+                        help="Train one rule set per value of this column in a process pool")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--min-invoices", type=int, default=MIN_PARTITION_INVOICES,
+                        help="Skip partitions with fewer invoices than this")
+    args = parser.parse_args()
+    if args.partition:
+        train_partitioned_models(args.partition, workers=args.workers, min_invoices=args.min_invoices)
+    else:
+        print("Testing Recommender Engine...")
+        try:
+            rules = generate_recommendations(min_support=0.01) # Low support for demo data
+            print(f"Success! Found {len(rules)} association rules.")
+            if not rules.empty:
+                print(rules.head(5))
+        except Exception as e:
+            print(f"Error: {e}")
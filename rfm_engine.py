@@ -0,0 +1,158 @@
+"""
+RFM (recency, frequency, monetary) customer segmentation, computed from the SQLite tables.
+
+Per customer: days since the last purchase (relative to the day after the newest invoice, as in the
+notebook), number of invoices and total spend. The aggregation is one SQL GROUP BY and the scoring is
+vectorized pandas, so there is no Python code per customer. Each metric gets a 1-5 quantile score
+(5 = best: most recent, most frequent, highest spend) and the (R, F) pair maps to a named segment.
+
+Results live in the customer_segments table (created by db_migrations, migration 5). Incremental
+ingests call refresh_segments(conn, since=...), which re-aggregates only the customers with invoices
+on or after `since`; the scores are then recomputed for everyone, because quantiles are relative to
+the whole customer base, but that works on one row per customer rather than on the line items.
+
+    python rfm_engine.py        # full recompute and a per-segment summary
+"""
+import argparse
+import os
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+import schema
+
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sales_analysis.db")
+
+SCORE_BINS = 5
+
+# Segment per (R score, F score): rows are R 1-5, columns F 1-5
+SEGMENT_GRID = np.array([
+    ["Hibernating", "Hibernating", "At Risk", "At Risk", "Can't Lose Them"],
+    ["Hibernating", "Hibernating", "At Risk", "At Risk", "Can't Lose Them"],
+    ["About to Sleep", "About to Sleep", "Need Attention", "Loyal Customers", "Loyal Customers"],
+    ["Promising", "Potential Loyalists", "Potential Loyalists", "Loyal Customers", "Loyal Customers"],
+    ["New Customers", "Potential Loyalists", "Potential Loyalists", "Champions", "Champions"],
+], dtype=object)
+
+SEGMENTS_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS customer_segments (
+        customer_id INTEGER PRIMARY KEY,
+        last_purchase TEXT NOT NULL,
+        recency_days INTEGER NOT NULL,
+        frequency INTEGER NOT NULL,
+        monetary REAL NOT NULL,
+        r_score INTEGER NOT NULL,
+        f_score INTEGER NOT NULL,
+        m_score INTEGER NOT NULL,
+        rfm_score TEXT NOT NULL,
+        segment TEXT NOT NULL,
+        snapshot_date TEXT NOT NULL
+    )
+"""
+
+# Line items are already cleaned at ingest (no cancellations, non-positive quantities/prices or
+# missing customers), so every invoice with a customer counts.
+AGGREGATE_SQL = """
+    SELECT i.customer_id,
+           datetime(MAX(i.invoice_ts), 'unixepoch') as last_purchase,
+           COUNT(DISTINCT i.invoice_key) as frequency,
+           SUM(ii.quantity * ii.price_cents) / 100.0 as monetary
+    FROM invoices i
+    JOIN invoice_items ii ON ii.invoice_key = i.invoice_key
+    WHERE i.customer_id IS NOT NULL {where}
+    GROUP BY i.customer_id
+"""
+
+TOUCHED_CUSTOMERS_SQL = "SELECT DISTINCT customer_id FROM invoices WHERE invoice_ts >= ?"
+
+COLUMNS = ["customer_id", "last_purchase", "recency_days", "frequency", "monetary",
+           "r_score", "f_score", "m_score", "rfm_score", "segment", "snapshot_date"]
+
+def aggregate_customers(conn, since=None):
+    """
+    (customer_id, last_purchase, frequency, monetary) per customer, over each customer's whole history.
+    With `since`, only customers who have an invoice on or after it are aggregated.
+    """
+    if since is None:
+        rows = conn.execute(AGGREGATE_SQL.format(where="")).fetchall()
+    else:
+        rows = conn.execute(AGGREGATE_SQL.format(where=f"AND i.customer_id IN ({TOUCHED_CUSTOMERS_SQL})"),
+                            (schema.to_epoch(since[:10]),)).fetchall()
+    frame = pd.DataFrame(rows, columns=["customer_id", "last_purchase", "frequency", "monetary"])
+    frame["customer_id"] = frame["customer_id"].astype("int64")
+    return frame
+
+def quantile_scores(values, bins=SCORE_BINS):
+    """
+    1..bins by percentile rank (higher value = higher score). Ties share the lowest score of their
+    rank, so e.g. all one-time buyers get the same frequency score.
+    """
+    pct = values.rank(method="min", pct=True)
+    return np.ceil(pct * bins).clip(1, bins).astype("int64")
+
+def score_customers(aggregates):
+    """Adds recency, the R/F/M scores and the segment to a frame from aggregate_customers."""
+    frame = aggregates.copy()
+    last_purchase = pd.to_datetime(frame["last_purchase"])
+    snapshot = last_purchase.max() + pd.Timedelta(days=1)
+    frame["recency_days"] = (snapshot - last_purchase).dt.days.astype("int64")
+    frame["r_score"] = quantile_scores(-frame["recency_days"])
+    frame["f_score"] = quantile_scores(frame["frequency"])
+    frame["m_score"] = quantile_scores(frame["monetary"])
+    frame["rfm_score"] = (frame["r_score"].astype(str) + frame["f_score"].astype(str)
+                          + frame["m_score"].astype(str))
+    frame["segment"] = SEGMENT_GRID[frame["r_score"].to_numpy() - 1, frame["f_score"].to_numpy() - 1]
+    frame["snapshot_date"] = snapshot.strftime("%Y-%m-%d %H:%M:%S") if len(frame) else ""
+    return frame[COLUMNS]
+
+def refresh_segments(conn, since=None):
+    """
+    Recomputes customer_segments. since=None aggregates every customer; incremental ingests pass the
+    oldest invoice_date they added, so only the customers in the new invoices are re-aggregated and
+    the rest keep their stored aggregates. Runs inside the caller's transaction;
+    `conn` may be a connection or a cursor. Returns the number of customers scored.
+    """
+    aggregates = aggregate_customers(conn, since)
+    if since is not None:
+        stored = pd.DataFrame(
+            conn.execute("SELECT customer_id, last_purchase, frequency, monetary FROM customer_segments").fetchall(),
+            columns=aggregates.columns)
+        stored = stored[~stored["customer_id"].isin(aggregates["customer_id"])]
+        aggregates = pd.concat([stored, aggregates], ignore_index=True)
+    scored = score_customers(aggregates)
+    conn.execute("DELETE FROM customer_segments")
+    conn.executemany(f"INSERT INTO customer_segments ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                     scored.itertuples(index=False, name=None))
+    return len(scored)
+
+def create_segments_table(cursor):
+    cursor.execute(SEGMENTS_TABLE_SQL)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_customer_segments_segment ON customer_segments (segment, monetary)")
+    return refresh_segments(cursor)
+
+def segment_summary(conn):
+    """Customers, average recency/frequency/spend and total spend per segment, largest revenue first."""
+    return pd.read_sql("""
+        SELECT segment, COUNT(*) as customers, AVG(recency_days) as avg_recency_days,
+               AVG(frequency) as avg_frequency, AVG(monetary) as avg_monetary, SUM(monetary) as total_monetary
+        FROM customer_segments
+        GROUP BY segment
+        ORDER BY total_monetary DESC
+    """, conn)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute the RFM customer segments.")
+    parser.add_argument("--db-path", default=DB_PATH)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db_path)
+    try:
+        start = time.perf_counter()
+        with conn:
+            n = create_segments_table(conn.cursor())
+        print(f"Scored {n:,} customers in {time.perf_counter() - start:.2f}s")
+        print(segment_summary(conn).round(1).to_string(index=False))
+    finally:
+        conn.close()
@@ -0,0 +1,145 @@
+import schema
+
+# Materialized revenue rollups, maintained at ingest time so dashboards and the forecaster
+# never have to aggregate invoice_items on a request path.
+# Tables are created by db_migrations (migrations 2 and 3); this module only (re)computes their contents.
+
+ROLLUP_TABLES_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS daily_sales (
+        day TEXT NOT NULL,
+        country TEXT NOT NULL,
+        revenue REAL NOT NULL,
+        units INTEGER NOT NULL,
+        line_items INTEGER NOT NULL,
+        invoices INTEGER NOT NULL,
+        customers INTEGER NOT NULL,
+        PRIMARY KEY (day, country)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS monthly_sales (
+        month TEXT PRIMARY KEY,
+        revenue REAL NOT NULL,
+        units INTEGER NOT NULL,
+        line_items INTEGER NOT NULL,
+        invoices INTEGER NOT NULL,
+        customers INTEGER NOT NULL
+    ) WITHOUT ROWID
+    """,
+]
+
+PRODUCT_SALES_SQL = """
+    CREATE TABLE IF NOT EXISTS product_sales (
+        stock_code TEXT PRIMARY KEY,
+        units INTEGER NOT NULL,
+        revenue REAL NOT NULL
+    ) WITHOUT ROWID
+"""
+
+def refresh_rollups(conn, since=None):
+    """
+    Recomputes the rollups for every day (and month) on or after `since`, an invoice_date string.
+    since=None rebuilds them completely. Incremental ingests pass the oldest invoice_date they added,
+    so the work is proportional to the new data. Runs inside the caller's transaction;
+    `conn` may be a connection or a cursor.
+    """
+    since_day = since[:10] if since else ""
+    since_month = since[:7] if since else ""
+
+    # Lines are grouped on the integer day and country key; only the group keys are formatted
+    conn.execute("DELETE FROM daily_sales WHERE day >= ?", (since_day,))
+    conn.execute("""
+        INSERT INTO daily_sales (day, country, revenue, units, line_items, invoices, customers)
+        SELECT date(d.day * 86400, 'unixepoch'),
+               COALESCE(c.country, 'Unspecified'),
+               d.revenue, d.units, d.line_items, d.invoices, d.customers
+        FROM (
+            SELECT i.invoice_ts / 86400 as day,
+                   i.country_key,
+                   SUM(ii.quantity * ii.price_cents) / 100.0 as revenue,
+                   SUM(ii.quantity) as units,
+                   COUNT(*) as line_items,
+                   COUNT(DISTINCT i.invoice_key) as invoices,
+                   COUNT(DISTINCT i.customer_id) as customers
+            FROM invoices i
+            JOIN invoice_items ii ON i.invoice_key = ii.invoice_key
+            WHERE i.invoice_ts >= ?
+            GROUP BY 1, 2
+        ) d
+        LEFT JOIN countries c ON c.country_key = d.country_key
+    """, (_epoch(since_day),))
+
+    # An invoice falls on one day in one country, so the additive totals of a month are sums of the
+    # daily rows. Distinct customers don't add up across days: those are counted over the invoices.
+    conn.execute("DELETE FROM monthly_sales WHERE month >= ?", (since_month,))
+    conn.execute("""
+        INSERT INTO monthly_sales (month, revenue, units, line_items, invoices, customers)
+        SELECT d.month, d.revenue, d.units, d.line_items, d.invoices, c.customers
+        FROM (
+            SELECT substr(day, 1, 7) as month, SUM(revenue) as revenue, SUM(units) as units,
+                   SUM(line_items) as line_items, SUM(invoices) as invoices
+            FROM daily_sales
+            WHERE day >= ?
+            GROUP BY 1
+        ) d
+        JOIN (
+            SELECT strftime('%Y-%m', invoice_ts, 'unixepoch') as month, COUNT(DISTINCT customer_id) as customers
+            FROM invoices
+            WHERE invoice_ts >= ?
+            GROUP BY 1
+        ) c ON c.month = d.month
+    """, (since_month, _epoch(since_month + "-01" if since_month else "")))
+
+    if _table_exists(conn, "product_sales"):
+        refresh_product_sales(conn, since)
+
+def refresh_product_sales(conn, since=None):
+    """
+    All-time units/revenue per product (used to rank search results by sales volume).
+    Totals aren't bucketed by date, so with `since` only products sold on or after it are recomputed.
+    """
+    totals = """
+        SELECT p.stock_code, t.units, t.revenue
+        FROM (
+            SELECT product_key, SUM(quantity) as units, SUM(quantity * price_cents) / 100.0 as revenue
+            FROM invoice_items
+            {where}
+            GROUP BY product_key
+        ) t
+        JOIN products p ON p.product_key = t.product_key
+    """
+    if since is None:
+        conn.execute("DELETE FROM product_sales")
+        conn.execute(f"INSERT INTO product_sales (stock_code, units, revenue) {totals.format(where='')}")
+        return
+
+    touched = """
+        SELECT DISTINCT ii.product_key
+        FROM invoices i
+        JOIN invoice_items ii ON i.invoice_key = ii.invoice_key
+        WHERE i.invoice_ts >= ?
+    """
+    since_ts = _epoch(since[:10])
+    conn.execute(f"""
+        DELETE FROM product_sales
+        WHERE stock_code IN (SELECT stock_code FROM products WHERE product_key IN ({touched}))
+    """, (since_ts,))
+    conn.execute(f"INSERT INTO product_sales (stock_code, units, revenue) "
+                 f"{totals.format(where=f'WHERE product_key IN ({touched})')}", (since_ts,))
+
+def _epoch(day):
+    # invoice_ts bound for a 'YYYY-MM-DD' lower bound; "" means no bound
+    return schema.to_epoch(day) if day else schema.to_epoch("0001-01-01")
+
+def _table_exists(conn, name):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone() is not None
+
+def create_rollup_tables(cursor):
+    for statement in ROLLUP_TABLES_SQL:
+        cursor.execute(statement)
+    refresh_rollups(cursor)
+
+def create_product_sales_table(cursor):
+    cursor.execute(PRODUCT_SALES_SQL)
+    refresh_product_sales(cursor)
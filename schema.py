@@ -0,0 +1,205 @@
+import calendar
+import hashlib
+import sqlite3
+from datetime import datetime, timedelta
+
+# Physical layout of the sales tables (schema version 7, see db_migrations.py):
+# - invoice_items refers to invoices and products by integer surrogate keys (invoice_key, product_key,
+#   aliases of the rowid); invoice numbers and stock codes are stored once, in invoices and products.
+#   customer_id is the source's integer Customer ID.
+# - countries is a dimension table, invoices store its country_key (NULL if the source had none).
+# - Prices are integer cents, so revenue sums are exact: SUM(quantity * price_cents) / 100.0.
+# - Invoice dates are seconds since 1970-01-01 (invoice_ts), the export's wall-clock time read as UTC.
+#   The day number is invoice_ts / 86400; date(invoice_ts, 'unixepoch') formats it.
+# transactions_view keeps the original flat columns (text dates, prices in currency units).
+
+TABLES_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS customers (
+        customer_id INTEGER PRIMARY KEY
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS countries (
+        country_key INTEGER PRIMARY KEY,
+        country TEXT NOT NULL UNIQUE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS products (
+        product_key INTEGER PRIMARY KEY,
+        stock_code TEXT NOT NULL UNIQUE,
+        description TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS invoices (
+        invoice_key INTEGER PRIMARY KEY,
+        invoice_id TEXT NOT NULL UNIQUE,
+        customer_id INTEGER REFERENCES customers (customer_id),
+        invoice_ts INTEGER NOT NULL,
+        country_key INTEGER REFERENCES countries (country_key)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS invoice_items (
+        id INTEGER PRIMARY KEY,
+        invoice_key INTEGER NOT NULL REFERENCES invoices (invoice_key),
+        product_key INTEGER NOT NULL REFERENCES products (product_key),
+        quantity INTEGER NOT NULL,
+        price_cents INTEGER NOT NULL
+    )
+    """,
+]
+
+VIEW_SQL = """
+    CREATE VIEW IF NOT EXISTS transactions_view AS
+    SELECT
+        i.invoice_id,
+        p.stock_code,
+        p.description,
+        ii.quantity,
+        datetime(i.invoice_ts, 'unixepoch') AS invoice_date,
+        ii.price_cents / 100.0 AS price,
+        i.customer_id,
+        c.country
+    FROM invoice_items ii
+    JOIN invoices i ON ii.invoice_key = i.invoice_key
+    JOIN products p ON ii.product_key = p.product_key
+    LEFT JOIN countries c ON i.country_key = c.country_key
+"""
+
+# Covering indexes for the analytics joins (migration 1). Secondary indexes carry the rowid, so the
+# invoice indexes already cover the join back to invoice_items through invoice_key.
+INDEXES_SQL = [
+    # invoice_items -> invoices join, carrying the revenue columns so the index covers the lookup
+    "CREATE INDEX IF NOT EXISTS idx_invoice_items_invoice ON invoice_items (invoice_key, quantity, price_cents)",
+    "CREATE INDEX IF NOT EXISTS idx_invoice_items_product ON invoice_items (product_key, quantity, price_cents)",
+    # invoices filtered by date (and paged by date, invoice number), grouped by country and customer
+    "CREATE INDEX IF NOT EXISTS idx_invoices_date ON invoices (invoice_ts, invoice_id)",
+    "CREATE INDEX IF NOT EXISTS idx_invoices_country ON invoices (country_key)",
+    "CREATE INDEX IF NOT EXISTS idx_invoices_customer ON invoices (customer_id)",
+]
+
+# The layout before schema version 7, which convert_legacy_layout() rewrites
+LEGACY_TABLES_SQL = [
+    "CREATE TABLE IF NOT EXISTS customers (customer_id REAL PRIMARY KEY)",
+    "CREATE TABLE IF NOT EXISTS products (stock_code TEXT PRIMARY KEY, description TEXT)",
+    """
+    CREATE TABLE IF NOT EXISTS invoices (
+        invoice_id TEXT PRIMARY KEY,
+        customer_id REAL,
+        invoice_date TIMESTAMP,
+        country TEXT,
+        FOREIGN KEY (customer_id) REFERENCES customers (customer_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS invoice_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        invoice_id TEXT,
+        stock_code TEXT,
+        quantity INTEGER,
+        price REAL,
+        FOREIGN KEY (invoice_id) REFERENCES invoices (invoice_id),
+        FOREIGN KEY (stock_code) REFERENCES products (stock_code)
+    )
+    """,
+    """
+    CREATE VIEW IF NOT EXISTS transactions_view AS
+    SELECT i.invoice_id, ii.stock_code, p.description, ii.quantity, i.invoice_date, ii.price, i.customer_id, i.country
+    FROM invoice_items ii
+    JOIN invoices i ON ii.invoice_id = i.invoice_id
+    JOIN products p ON ii.stock_code = p.stock_code
+    """,
+]
+
+# Legacy rows are copied keeping their rowids as the new keys, so the tables stay in load order
+CONVERT_SQL = [
+    "INSERT INTO customers (customer_id) SELECT CAST(customer_id AS INTEGER) FROM legacy_customers",
+    """
+    INSERT INTO countries (country)
+    SELECT DISTINCT country FROM legacy_invoices WHERE country IS NOT NULL ORDER BY country
+    """,
+    "INSERT INTO products (product_key, stock_code, description) SELECT rowid, stock_code, description FROM legacy_products",
+    """
+    INSERT INTO invoices (invoice_key, invoice_id, customer_id, invoice_ts, country_key)
+    SELECT li.rowid, li.invoice_id, CAST(li.customer_id AS INTEGER),
+           CAST(strftime('%s', li.invoice_date) AS INTEGER), c.country_key
+    FROM legacy_invoices li
+    LEFT JOIN countries c ON c.country = li.country
+    """,
+    """
+    INSERT INTO invoice_items (id, invoice_key, product_key, quantity, price_cents)
+    SELECT lii.id, i.invoice_key, p.product_key, lii.quantity, CAST(ROUND(lii.price * 100) AS INTEGER)
+    FROM legacy_invoice_items lii
+    JOIN invoices i ON i.invoice_id = lii.invoice_id
+    JOIN products p ON p.stock_code = lii.stock_code
+    ORDER BY lii.id
+    """,
+]
+
+LEGACY_TABLES = ("invoice_items", "invoices", "products", "customers")
+
+EPOCH = datetime(1970, 1, 1)
+
+def to_epoch(value):
+    """'YYYY-MM-DD[ HH:MM:SS]' (or a datetime) -> seconds since 1970-01-01, the invoice_ts encoding."""
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(value)
+    return calendar.timegm(value.timetuple())
+
+def from_epoch(seconds):
+    """invoice_ts -> naive datetime."""
+    return EPOCH + timedelta(seconds=seconds)
+
+def to_cents(price):
+    """Positive price -> integer cents, rounding half up like SQLite's ROUND()."""
+    return int(price * 100 + 0.5)
+
+def get_data_version(conn):
+    """
+    Fingerprint of the loaded data, for caches and trained models derived from it.
+    It changes whenever an ingest or rebuild adds rows (per source file: high-water mark and rows loaded)
+    but not when the same data is rebuilt. Databases without ingest_state fall back to the invoices.
+    """
+    try:
+        state = conn.execute(
+            "SELECT source_file, high_water_mark, rows_loaded FROM ingest_state ORDER BY source_file"
+        ).fetchall()
+    except sqlite3.OperationalError:
+        state = conn.execute("SELECT COUNT(*), MAX(invoice_ts) FROM invoices").fetchall()
+    return hashlib.sha1(repr(state).encode()).hexdigest()[:16]
+
+def create_tables(cursor):
+    for statement in TABLES_SQL:
+        cursor.execute(statement)
+    cursor.execute(VIEW_SQL)
+
+def create_indexes(cursor):
+    for statement in INDEXES_SQL:
+        cursor.execute(statement)
+
+def is_legacy_layout(conn):
+    """True for a database created before schema version 7 (line items carrying text keys and REAL prices)."""
+    return conn.execute("SELECT 1 FROM pragma_table_info('invoice_items') WHERE name = 'price'").fetchone() is not None
+
+def convert_legacy_layout(cursor):
+    """
+    Rewrites the sales tables of a pre-7 database into the current layout, in the caller's transaction.
+    Derived tables (rollups, segments, CLV, forecasts) hold the same values in both layouts and are kept.
+    Prices are rounded to whole cents. Returns False if there was nothing to convert.
+    """
+    if not is_legacy_layout(cursor):
+        return False
+    cursor.execute("DROP VIEW IF EXISTS transactions_view")
+    for table in LEGACY_TABLES:
+        cursor.execute(f"ALTER TABLE {table} RENAME TO legacy_{table}")
+    create_tables(cursor)
+    for statement in CONVERT_SQL:
+        cursor.execute(statement)
+    # Children first; their indexes and triggers go with them
+    for table in LEGACY_TABLES:
+        cursor.execute(f"DROP TABLE legacy_{table}")
+    create_indexes(cursor)
+    return True
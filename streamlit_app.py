@@ -6,6 +6,7 @@ import plotly.graph_objects as go
 import os
 import sys
 import subprocess
+import tempfile
 import re
 
 # --- Custom Modules ---
@@ -14,7 +15,10 @@ import re
 try:
     import forecasting_engine
     import recommender_engine
+    import itemset_miner
     import chat_engine
+    import db_migrations
+    import query_backend
 except ImportError:
     st.error("Modules not found. Please ensure 'forecasting_engine.py', 'recommender_engine.py', and 'chat_engine.py' are present.")
 
@@ -58,6 +62,20 @@ def run_query(query):
     finally:
         conn.close()
 
+@st.cache_data(ttl=3600)
+def run_analytic_query(name, **params):
+    """One of query_backend's heavy aggregations, on the backend selected by ANALYTICS_BACKEND."""
+    try:
+        rows = query_backend.run(name, params, DB_PATH)
+    except Exception:
+        return pd.DataFrame()
+    return pd.DataFrame(rows, columns=query_backend.QUERIES[name]["columns"])
+
+@st.cache_resource
+def upgrade_schema():
+    """Applies pending schema migrations (indexes, rollup tables) once per server process."""
+    return db_migrations.upgrade_database(DB_PATH)
+
 def check_db_integrity():
     """Checks if the main table exists."""
     conn = sqlite3.connect(DB_PATH)
@@ -95,10 +113,23 @@ st.sidebar.markdown("## 🚀 Retail Intelligence")
 st.sidebar.markdown("---")
 st.sidebar.info("Features:\n- 📊 KPI Dashboard\n- 🔮 Sales Forecast\n- 🛍️ Product Recommender\n- 🤖 Data Assistant")
 
+def run_create_database(*args):
+    """Runs create_database.py in a subprocess and returns the CompletedProcess."""
+    script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "create_database.py")
+    return subprocess.run([sys.executable, script_path, *args], capture_output=True, text=True)
+
 if st.sidebar.button("🔄 Rebuild Database (Default Data)"):
     with st.spinner("Rebuilding..."):
-        script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "create_database.py")
-        result = subprocess.run([sys.executable, script_path], capture_output=True, text=True)
+        result = run_create_database()
+        if result.returncode == 0:
+            st.sidebar.success("Done!")
+            st.cache_data.clear()
+        else:
+            st.sidebar.error(f"Error: {result.stderr}")
+
+if st.sidebar.button("➕ Ingest New Invoices (Incremental)"):
+    with st.spinner("Appending new invoices..."):
+        result = run_create_database("--incremental")
         if result.returncode == 0:
             st.sidebar.success("Done!")
             st.cache_data.clear()
@@ -113,42 +144,19 @@ if uploaded_file:
     if st.sidebar.button("Load Data to DB"):
         try:
             with st.spinner("Processing file..."):
-                if uploaded_file.name.endswith('.csv'):
-                    df = pd.read_csv(uploaded_file)
-                else:
-                    df = pd.read_excel(uploaded_file)
-                
-                # Basic validation request to match schema roughly
-                required_cols = {'Invoice', 'StockCode', 'Description', 'Quantity', 'InvoiceDate', 'Price', 'Customer ID', 'Country'}
-                # Mapping typical names to what our DB script expects if needed, or just validate
-                # For this demo, let's assume the user uploads the specific format or we map it.
-                # Actually, simply overwriting the 'invoice_items' table is risky if schema doesn't match.
-                # Let's do a smart ingest:
-                
-                # Standardize columns (simple mapping support)
-                df.columns = [c.strip() for c in df.columns]
-                
-                # Connect and Replace
-                conn = sqlite3.connect(DB_PATH)
-                
-                # We need to reshape to our DB schema (Invoices + Items)
-                # Or just cheat and write to a single table via pandas and view it?
-                # Best approach for app continuity: Re-run the normalization logic from create_database.py
-                # but inline here.
-                
-                # 1. Invoices
-                invoices = df[['Invoice', 'InvoiceDate', 'Customer ID', 'Country']].drop_duplicates().copy()
-                invoices.columns = ['invoice_id', 'invoice_date', 'customer_id', 'country']
-                invoices.to_sql('invoices', conn, if_exists='replace', index=False)
-                
-                # 2. Items
-                items = df[['Invoice', 'StockCode', 'Description', 'Quantity', 'Price']].copy()
-                items.columns = ['invoice_id', 'stock_code', 'description', 'quantity', 'price']
-                items.to_sql('invoice_items', conn, if_exists='replace', index=False) # Note: ID auto-inc/primary key might be lost if we don't handle schema carefully, but for read-only app it's fine.
-                
-                conn.close()
+                # Append the upload through the same streaming loader (cleaning rules, schema, dedupe)
+                # as create_database.py, instead of overwriting tables with whatever columns the file has.
+                # The high-water mark is tracked per file name, so keep the original name.
+                with tempfile.TemporaryDirectory() as tmp_dir:
+                    upload_path = os.path.join(tmp_dir, os.path.basename(uploaded_file.name))
+                    with open(upload_path, "wb") as f:
+                        f.write(uploaded_file.getbuffer())
+                    result = run_create_database(upload_path, "--incremental")
+
+                if result.returncode != 0:
+                    raise RuntimeError(result.stderr or result.stdout)
                 st.cache_data.clear()
-                st.sidebar.success(f"Loaded {len(df)} rows!")
+                st.sidebar.success(result.stdout.strip().splitlines()[-1])
                 st.rerun()
                 
         except Exception as e:
@@ -161,6 +169,7 @@ if not check_db_integrity():
     st.error("⚠️ Database Not Found or Corrupt!")
     st.warning("Please click 'Rebuild Database' in the sidebar to initialize the system.")
     st.stop() # Halt execution here
+upgrade_schema()
 
 # Create 5 Tabs
 tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
@@ -178,18 +187,20 @@ with tab1:
     
     # KPIs
     col1, col2, col3, col4 = st.columns(4)
-    revenue_df = run_query("SELECT SUM(quantity * price) as revenue FROM invoice_items")
-    total_rev = revenue_df['revenue'].iloc[0] or 0
+    # Tiles read the monthly_sales rollup instead of scanning invoice_items
+    kpi_df = run_query("""
+        SELECT SUM(revenue) as revenue, SUM(invoices) as invoices, SUM(revenue) / SUM(line_items) as avg_ticket
+        FROM monthly_sales
+    """)
+    total_rev = kpi_df['revenue'].iloc[0] or 0
     col1.metric("Total Revenue", f"${total_rev:,.0f}")
     
-    tx_df = run_query("SELECT COUNT(*) as cnt FROM invoices")
-    col2.metric("Total Invoices", f"{tx_df['cnt'].iloc[0]:,}")
+    col2.metric("Total Invoices", f"{int(kpi_df['invoices'].iloc[0] or 0):,}")
     
-    cust_df = run_query("SELECT COUNT(DISTINCT customer_id) as cnt FROM invoices WHERE customer_id IS NOT NULL")
+    cust_df = run_query("SELECT COUNT(*) as cnt FROM customers")
     col3.metric("Active Customers", f"{cust_df['cnt'].iloc[0]:,}")
     
-    avg_df = run_query("SELECT AVG(quantity * price) as val FROM invoice_items")
-    col4.metric("Avg Ticket Size", f"${avg_df['val'].iloc[0]:,.2f}")
+    col4.metric("Avg Ticket Size", f"${kpi_df['avg_ticket'].iloc[0] or 0:,.2f}")
     
     st.markdown("---")
     
@@ -197,8 +208,8 @@ with tab1:
     with c1:
         st.subheader("Revenue by Country")
         country_df = run_query("""
-            SELECT country, SUM(ii.quantity * ii.price) as revenue 
-            FROM invoice_items ii JOIN invoices i ON ii.invoice_id = i.invoice_id 
+            SELECT country, SUM(revenue) as revenue 
+            FROM daily_sales 
             GROUP BY country ORDER BY revenue DESC LIMIT 10
         """)
         if country_df is not None and not country_df.empty:
@@ -209,12 +220,9 @@ with tab1:
         
     with c2:
         st.subheader("Top Products")
-        prod_df = run_query("""
-            SELECT description, SUM(quantity * price) as val 
-            FROM invoice_items GROUP BY description ORDER BY val DESC LIMIT 10
-        """)
+        prod_df = run_analytic_query("top_products", limit=10)
         if prod_df is not None and not prod_df.empty:
-            fig_prod = px.pie(prod_df, values='val', names='description', title="Detailed Mix", hole=0.4)
+            fig_prod = px.pie(prod_df, values='revenue', names='description', title="Detailed Mix", hole=0.4)
             st.plotly_chart(fig_prod, use_container_width=True)
         else:
             st.info("Not enough data for Product Mix.")
@@ -264,38 +272,50 @@ with tab3:
     st.title("🛍️ Market Basket Analysis")
     st.markdown("Discover products often bought together (Association Rule Learning).")
     
-    if st.button("Train Recommendation Engine"):
-        with st.spinner("Analyzing transaction patterns (Apriori Algorithm)..."):
-            rules = recommender_engine.generate_recommendations(min_support=0.01)
-            st.session_state['rules'] = rules
-            st.success(f"Found {len(rules)} association rules!")
+    # The rules model is persisted and shared with the API. Rebuilds and ingests retrain it; reruns only
+    # load it, and mining here happens on an explicit click
+    model = recommender_engine.get_rules_model()
+    if model is None or model.data_version != recommender_engine.current_data_version():
+        if model is None:
+            st.info("The recommendation model has not been trained yet. It is trained after every rebuild or ingest.")
+        else:
+            st.caption("The recommendation model predates the latest data.")
+        if st.button("Train recommendation model"):
+            try:
+                with st.spinner("Mining association rules..."):
+                    model = recommender_engine.refresh_rules_model()
+            except itemset_miner.MiningBudgetExceeded as e:
+                st.error(f"Mining stopped: {e}.")
     
-    if 'rules' in st.session_state and not st.session_state['rules'].empty:
-        rules = st.session_state['rules']
+    if model is not None and model.index:
+        st.caption(f"{len(model.index)} products with rules (data version {model.data_version})")
+        label = lambda code: model.descriptions.get(code) or code
         
         # Filter UI
-        target_product = st.selectbox("Select a Product to see recommendations:", rules['antecedents'].unique())
+        target_product = st.selectbox("Select a Product to see recommendations:",
+                                      sorted(model.index, key=label), format_func=label)
         
-        recs = rules[rules['antecedents'] == target_product]
+        recs = model.recommend(target_product, k=5)
         
-        if not recs.empty:
-            st.subheader(f"Customers who buy '{target_product}' also buy:")
-            for _, row in recs.head(5).iterrows():
-                conf = row['confidence'] * 100
-                st.info(f"👉 **{row['consequents']}** (Confidence: {conf:.1f}%)")
+        if recs:
+            st.subheader(f"Customers who buy '{label(target_product)}' also buy:")
+            for rec in recs:
+                conf = rec['confidence'] * 100
+                st.info(f"👉 **{rec['description'] or rec['stock_code']}** (Confidence: {conf:.1f}%)")
         else:
             st.warning("No strong associations found for this product yet.")
-    else:
-        st.info("Click 'Train Recommendation Engine' to start.")
+    elif model is not None:
+        st.info("No association rules found in the current data yet.")
 
 # --- TAB 4: AI CHAT ---
 with tab4:
     st.title("💬 Talk to Your Data")
-    st.markdown("Ask questions in plain English. Example: *'What is total revenue?'* or *'Show top 5 customers'*.")
+    st.markdown("Ask questions in plain English. Example: *'What is total revenue?'*, *'Show top 5 customers'* or *'Best selling products in France last year'*.")
     
     user_query = st.text_input("Ask a question:")
     if user_query:
-        agent = chat_engine.DataChatAgent()
+        # One agent per server process: shared read-only connection and result cache across reruns
+        agent = chat_engine.get_agent(DB_PATH)
         response = agent.ask(user_query)
         
         st.markdown(f"**Interpretation**: {response.get('interpretation', '')}")
@@ -306,6 +326,8 @@ with tab4:
             
         with st.expander("View Generated SQL"):
             st.code(response.get('sql', 'No SQL generated'), language='sql')
+            if response.get('params'):
+                st.caption(f"Parameters: {response['params']}")
 
 # --- TAB 5: MICROSERVICE ---
 with tab5:
@@ -0,0 +1,89 @@
+import json
+import os
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import analytics_snapshot
+import batch_forecasting
+import create_database
+import recommender_engine
+from conftest import write_csv
+
+@pytest.fixture
+def snapshot(tmp_path, sample_db, monkeypatch):
+    path = str(tmp_path / "snapshot")
+    monkeypatch.setattr(analytics_snapshot, "SNAPSHOT_PATH", path)
+    return analytics_snapshot.export_snapshot(sample_db, path)
+
+def test_snapshot_round_trips_the_view(sample_db, snapshot):
+    conn = sqlite3.connect(sample_db)
+    expected = pd.read_sql("SELECT * FROM transactions_view", conn, parse_dates=["invoice_date"])
+    # The snapshot keeps prices in integer cents, like invoice_items
+    expected = expected.assign(price=(expected["price"] * 100).round().astype("int64")).rename(columns={"price": "price_cents"})
+    months = conn.execute("SELECT COUNT(DISTINCT strftime('%Y-%m', invoice_date)) FROM transactions_view").fetchone()[0]
+    assert analytics_snapshot.snapshot_is_current(conn)
+    conn.close()
+
+    assert snapshot["rows"] == len(expected) and snapshot["months"] == months
+    table = analytics_snapshot.load_transactions(list(expected.columns))
+    got = analytics_snapshot.to_pandas(table)
+    assert isinstance(got["stock_code"].dtype, pd.CategoricalDtype)  # dictionary-encoded on disk
+    assert got["customer_id"].dtype == "int64"  # same type as the INTEGER column
+    assert got["price_cents"].dtype == "int64"
+    key = ["invoice_id", "stock_code", "quantity"]
+    got = got.astype({c: object for c in ("invoice_id", "stock_code", "description", "country")})
+    got["invoice_date"] = got["invoice_date"].astype(expected["invoice_date"].dtype)
+    pd.testing.assert_frame_equal(got.sort_values(key, ignore_index=True),
+                                  expected.sort_values(key, ignore_index=True), check_dtype=False)
+
+    # Projection and month/date pushdown
+    march = analytics_snapshot.load_transactions(["price_cents"], start="2010-03-01", end="2010-04-01")
+    assert march.column_names == ["price_cents"]
+    assert march.num_rows == (expected["invoice_date"].dt.strftime("%Y-%m") == "2010-03").sum() > 0
+    assert sum(t.num_rows for t in analytics_snapshot.iter_months(["price_cents"])) == len(expected)
+    print(f"[SUCCESS] Snapshot of {snapshot['rows']} rows in {snapshot['months']} months")
+
+def test_engines_read_the_snapshot(sample_db, snapshot, monkeypatch):
+    conn = sqlite3.connect(sample_db)
+    from_snapshot = recommender_engine.build_basket_matrix(conn, partition=("country", "France"))
+    lines_snapshot = batch_forecasting.read_lines(conn)
+    monkeypatch.setattr(analytics_snapshot, "SNAPSHOT_PATH", os.path.join(os.path.dirname(sample_db), "missing"))
+    from_sqlite = recommender_engine.build_basket_matrix(conn, partition=("country", "France"))
+    lines_sqlite = batch_forecasting.read_lines(conn)
+    conn.close()
+
+    def pairs(basket):
+        matrix, invoice_ids, stock_codes = basket
+        rows, cols = matrix.nonzero()
+        return set(zip(invoice_ids[rows], stock_codes[cols]))
+    assert pairs(from_snapshot) == pairs(from_sqlite) != set()
+
+    key = ["day", "country", "stock_code"]
+    lines_sqlite["day"] = pd.to_datetime(lines_sqlite["day"])
+    lines_snapshot["day"] = lines_snapshot["day"].astype(lines_sqlite["day"].dtype)
+    pd.testing.assert_frame_equal(lines_snapshot.sort_values(key, ignore_index=True),
+                                  lines_sqlite.sort_values(key, ignore_index=True))
+    print("[SUCCESS] Recommender and batch forecaster read the same data from the snapshot")
+
+def test_older_snapshot_format_is_not_used(sample_db, snapshot):
+    metadata_path = os.path.join(analytics_snapshot.SNAPSHOT_PATH, analytics_snapshot.METADATA_FILE)
+    conn = sqlite3.connect(sample_db)
+    assert analytics_snapshot.snapshot_is_current(conn)
+    with open(metadata_path, "w") as f:
+        json.dump({**snapshot, "snapshot_version": analytics_snapshot.SNAPSHOT_VERSION - 1}, f)
+    assert not analytics_snapshot.snapshot_is_current(conn)
+    conn.close()
+    print("[SUCCESS] A snapshot written in an older format is treated as stale")
+
+def test_stale_snapshot_is_not_used(tmp_path, sample_db, snapshot):
+    drop = [["700001", "22423", "REGENCY CAKESTAND 3 TIER", 2, "2011-03-01 10:00:00", 12.75, 12346, "France"]]
+    create_database.build_database(sample_db, write_csv(tmp_path / "drop.csv", drop), incremental=True)
+
+    conn = sqlite3.connect(sample_db)
+    assert not analytics_snapshot.snapshot_is_current(conn)
+    _, invoice_ids, _ = recommender_engine.build_basket_matrix(conn)
+    conn.close()
+    assert "700001" in set(invoice_ids)
+    print("[SUCCESS] A stale snapshot falls back to SQLite")
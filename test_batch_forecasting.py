@@ -0,0 +1,43 @@
+import sqlite3
+
+import numpy as np
+
+import batch_forecasting
+
+def level_sums(conn, day):
+    return {level: total for level, total in conn.execute(
+        "SELECT level, SUM(forecast) FROM forecasts WHERE day = ? GROUP BY level", (day,))}
+
+def test_batch_forecasts_are_coherent(sample_db):
+    stats = batch_forecasting.run_batch(sample_db, horizon=7, top_products=3, workers=1)
+    assert sum(stats["models"].values()) == stats["series"]
+    assert set(stats["models"]) <= set(batch_forecasting.BATCH_MODELS)
+    # total + 4 countries + (3 products + OTHER) + the country x product pairs that have sales
+    conn = sqlite3.connect(sample_db)
+    pairs = conn.execute("""
+        SELECT COUNT(DISTINCT country || '|' || CASE WHEN stock_code IN ('85123A', '71053', '84406B')
+                                             THEN stock_code ELSE 'OTHER' END)
+        FROM transactions_view
+    """).fetchone()[0]
+    assert stats["bottom_series"] == pairs
+    assert stats["series"] == 1 + 4 + 4 + pairs
+    assert conn.execute("SELECT COUNT(*) FROM forecasts").fetchone()[0] == stats["series"] * 7
+
+    # Reconciled forecasts add up at every level, every day
+    for (day,) in conn.execute("SELECT DISTINCT day FROM forecasts").fetchall():
+        sums = level_sums(conn, day)
+        assert np.allclose(list(sums.values()), sums["total"])
+    row = conn.execute("SELECT series, data_version FROM forecasts WHERE level = 'country_product'").fetchone()
+    conn.close()
+    assert "|product=" in row[0] and row[1]
+    print("[SUCCESS] Batch forecasts are written for the whole hierarchy and reconciled")
+
+def test_reconciliation_methods():
+    summing, series = batch_forecasting.build_hierarchy([("UK", "A"), ("UK", "B"), ("FR", "A")])
+    assert [name for name, _ in series][:5] == ["total", "country=FR", "country=UK", "product=A", "product=B"]
+    base = np.array([[10.0], [3.0], [6.0], [5.0], [4.0], [4.0], [2.0], [3.0]])
+    for method in ("ols", "bottom_up"):
+        coherent = batch_forecasting.reconcile(summing, base, method)
+        np.testing.assert_allclose(coherent, summing @ coherent[-3:])
+    np.testing.assert_allclose(batch_forecasting.reconcile(summing, base, "bottom_up")[0], [9.0])
+    print("[SUCCESS] OLS and bottom-up reconciliation produce coherent forecasts")
@@ -0,0 +1,44 @@
+from datetime import datetime
+
+import chat_engine
+import create_database
+import intent_router
+from conftest import PRODUCTS, sample_rows, write_csv
+
+def test_equivalent_questions_share_a_template(sample_db):
+    agent = chat_engine.DataChatAgent(sample_db)
+    uk = agent.ask("sales in uk")
+    same = agent.ask("Revenue in the United Kingdom?")
+    assert uk["params"] == same["params"] and uk["sql"] == same["sql"] and same["cached"]
+    assert agent.ask("Show top 3 customers")["params"]["limit"] == 3
+    assert agent.ask("top 5000 customers")["params"]["limit"] == intent_router.MAX_LIMIT
+    # Quotes in a question are parameters, never SQL
+    assert agent.ask("customer 12346 spend'; DROP TABLE invoices; --")["intent"] == "customer_spend"
+    assert agent.ask("hello")["dataframe"] is None
+    agent.close()
+    print("[SUCCESS] Equivalent questions map to the same template and parameters")
+
+def test_answers_are_cached_per_data_version(sample_db, tmp_path):
+    agent = chat_engine.DataChatAgent(sample_db)
+    first = agent.ask("sales in uk")
+    assert not first["cached"] and ":country" in first["sql"]
+    assert agent.ask("revenue in the united kingdom")["cached"]
+    expected = agent._connection().execute("""
+        SELECT SUM(quantity * price) FROM transactions_view WHERE country = 'United Kingdom'
+    """).fetchone()[0]
+    assert abs(first["dataframe"]["Total_Revenue"].iloc[0] - expected) < 1e-6
+
+    products = agent.ask("best selling products")["dataframe"]
+    assert set(products["description"]) <= {desc for _, desc in PRODUCTS} and len(products) == len(PRODUCTS)
+
+    # New data -> new data version -> the next answer is recomputed
+    drop = sample_rows(n_invoices=10, start=datetime(2011, 1, 3, 9, 0))
+    for row in drop:  # new invoice numbers, so the incremental ingest keeps them
+        row[0] = "7" + row[0][1:]
+    create_database.build_database(sample_db, write_csv(tmp_path / "drop.csv", drop), incremental=True)
+    again = agent.ask("sales in uk")
+    assert not again["cached"] and again["dataframe"]["Total_Revenue"].iloc[0] > first["dataframe"]["Total_Revenue"].iloc[0]
+    assert agent.hits == 1 and agent.misses == 3
+    assert chat_engine.get_agent(sample_db) is chat_engine.get_agent(sample_db)
+    agent.close()
+    print("[SUCCESS] Chat answers are cached per data version on one read-only connection")
@@ -0,0 +1,83 @@
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import clv_engine
+
+# BG/NBD parameters fitted to CDNOW in Fader, Hardie & Lee (2005)
+CDNOW = {"r": 0.243, "alpha": 4.414, "a": 0.793, "b": 2.426}
+
+def simulate_bgnbd(n, r, alpha, a, b, seed=0):
+    """Purchase histories drawn from the BG/NBD model itself: (frequency, recency, T)."""
+    rng = np.random.default_rng(seed)
+    rates, dropout = rng.gamma(r, 1 / alpha, n), rng.beta(a, b, n)
+    T = rng.uniform(100, 400, n)
+    x, t_x = np.zeros(n), np.zeros(n)
+    for i in range(n):
+        t = rng.exponential(1 / rates[i])
+        while t <= T[i]:
+            x[i], t_x[i] = x[i] + 1, t
+            if rng.random() < dropout[i]:
+                break
+            t += rng.exponential(1 / rates[i])
+    return x, t_x, T
+
+def test_bgnbd_matches_paper_and_recovers_parameters():
+    # The paper's worked example: x=2, t_x=30.43, T=38.86 expects 1.226 purchases in the next 39 weeks
+    expected = clv_engine.expected_purchases(CDNOW, 39, np.array([2.0]), np.array([30.43]), np.array([38.86]))
+    assert expected[0] == pytest.approx(1.226, abs=1e-3)
+
+    truth = {"r": 0.5, "alpha": 20.0, "a": 0.8, "b": 2.5}
+    fitted = clv_engine.fit_bgnbd(*simulate_bgnbd(5000, **truth))
+    for name, value in truth.items():
+        assert fitted[name] == pytest.approx(value, rel=0.3), name
+    print(f"[SUCCESS] BG/NBD recovered {fitted}")
+
+def test_summary_matches_lifetimes_definitions(sample_db):
+    conn = sqlite3.connect(sample_db)
+    summary = clv_engine.load_summary(conn)
+    df = pd.read_sql("SELECT * FROM transactions_view", conn, parse_dates=["invoice_date"])
+    conn.close()
+
+    df["day"] = df["invoice_date"].dt.normalize()
+    df["revenue"] = df["quantity"] * df["price"]
+    days = df.groupby(["customer_id", "day"])["revenue"].sum().reset_index()
+    end = days["day"].max() + pd.Timedelta(days=1)
+    for customer_id, group in days.groupby("customer_id"):
+        row = summary.loc[int(customer_id)]
+        assert row["frequency"] == len(group) - 1
+        assert row["recency"] == (group["day"].max() - group["day"].min()).days
+        assert row["T"] == (end - group["day"].min()).days
+        repeat = group["revenue"].iloc[1:]
+        assert row["monetary_value"] == pytest.approx(repeat.mean() if len(repeat) else 0.0)
+    print(f"[SUCCESS] Summary for {len(summary)} customers")
+
+def test_batch_scores_customers_and_caches_fit(tmp_path, sample_db, monkeypatch):
+    params_path = str(tmp_path / "clv_params.json")
+    monkeypatch.setattr(clv_engine, "CHUNK_SIZE", 5)  # several chunks through the process pool
+    stats = clv_engine.run_batch(sample_db, workers=2, params_path=params_path)
+    assert stats["refitted"] and os.path.exists(params_path)
+    assert clv_engine.run_batch(sample_db, workers=1, params_path=params_path)["refitted"] is False
+
+    conn = sqlite3.connect(sample_db)
+    clv = pd.read_sql("SELECT * FROM customer_clv", conn)
+    conn.close()
+    assert len(clv) == stats["customers"] > 0
+    assert (clv["frequency"] > 0).all()
+    assert np.isfinite(clv[["predicted_purchases", "predicted_monetary", "clv"]]).all().all()
+    assert (clv["clv"] >= 0).all()
+    print(f"[SUCCESS] CLV for {len(clv)} customers ({stats['customers_per_sec']:,.0f} customers/sec)")
+
+def test_clv_endpoints(api_client, sample_db, tmp_path):
+    clv_engine.run_batch(sample_db, workers=1, params_path=str(tmp_path / "clv_params.json"))
+
+    top = api_client.get("/customers/top-clv", params={"limit": 3}).json()
+    assert len(top) == 3
+    assert [c["clv"] for c in top] == sorted((c["clv"] for c in top), reverse=True)
+    customer = api_client.get(f"/customers/{top[0]['customer_id']}/clv").json()
+    assert customer["clv"] == top[0]["clv"]
+    assert api_client.get("/customers/1/clv").status_code == 404
+    print(f"[SUCCESS] Top CLV customer {customer['customer_id']}: {customer['clv']:.2f}")
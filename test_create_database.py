@@ -0,0 +1,64 @@
+import sqlite3
+
+import create_database
+from conftest import sample_rows, write_csv
+
+def test_clean_chunk_applies_notebook_rules():
+    rows, rejected = create_database.clean_chunk([tuple(r) for r in sample_rows(n_invoices=4)])
+    assert rejected == 3
+    assert all(not r[0].startswith("C") for r in rows)
+    assert all(r[3] > 0 and r[5] > 0 for r in rows)
+    assert all(isinstance(r[6], int) for r in rows)
+    print(f"[SUCCESS] {len(rows)} rows kept, {rejected} rejected")
+
+def test_clean_chunk_rounds_prices_to_cents():
+    row = ["500001", "85123A", "WHITE HANGING HEART T-LIGHT HOLDER", 2, "2010-01-04 09:00:00", None, 12346, "France"]
+    prices = [2.55, 1.999, 0.01, 0.005, 0.0049, 0.001, 0, -1.5]
+    rows, rejected = create_database.clean_chunk([tuple(row[:5] + [price] + row[6:]) for price in prices])
+    # Prices are stored in whole cents: sub-half-cent prices round to 0 and are dropped, which the notebook's
+    # `Price > 0` kept
+    assert [r[5] for r in rows] == [255, 200, 1, 1]
+    assert rejected == 4
+    print(f"[SUCCESS] Prices kept in cents: {[r[5] for r in rows]}")
+
+def test_streaming_load_matches_source(sample_db):
+    conn = sqlite3.connect(sample_db)
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM invoices").fetchone()[0] == 120
+        assert conn.execute("SELECT COUNT(*) FROM products").fetchone()[0] == 8
+        assert conn.execute("SELECT COUNT(*) FROM customers").fetchone()[0] == 17
+        expected_items = sum(1 for r in sample_rows() if not str(r[0]).startswith("C") and r[6] != "" and r[3] > 0)
+        assert conn.execute("SELECT COUNT(*) FROM invoice_items").fetchone()[0] == expected_items
+        # Chunk boundaries split invoices; the first header row per invoice must still win
+        date = conn.execute("SELECT datetime(invoice_ts, 'unixepoch') FROM invoices WHERE invoice_id = '500000'").fetchone()[0]
+        assert date == "2010-01-04 09:00:00"
+    finally:
+        conn.close()
+    print("[SUCCESS] Streaming load matches the source file")
+
+def test_incremental_ingest_appends_only_new_invoices(tmp_path, sample_db):
+    rows = sample_rows()
+    conn = sqlite3.connect(sample_db)
+    before = conn.execute("SELECT COUNT(*), SUM(quantity * price_cents) / 100.0 FROM invoice_items").fetchone()
+
+    # Same file again: everything is below the high-water mark or already present
+    stats = create_database.load_data_to_db(conn, write_csv(tmp_path / "online_retail_sample.csv", rows),
+                                            chunk_size=50, incremental=True)
+    assert stats["rows_loaded"] == 0
+
+    # A daily drop that overlaps the last loaded invoice and adds two new ones
+    new_rows = [r[:] for r in rows if r[0] == "500119"]
+    for invoice, day in (("600001", "2010-03-10 10:00:00"), ("600002", "2010-03-11 11:00:00")):
+        new_rows.append([invoice, "22423", "REGENCY CAKESTAND 3 TIER", 2, day, 12.75, 99999, "Spain"])
+    stats = create_database.load_data_to_db(conn, write_csv(tmp_path / "daily_drop.csv", new_rows),
+                                            chunk_size=1, incremental=True)
+    assert stats["rows_loaded"] == 2
+
+    after = conn.execute("SELECT COUNT(*), SUM(quantity * price_cents) / 100.0 FROM invoice_items").fetchone()
+    assert after[0] == before[0] + 2
+    assert round(after[1] - before[1], 2) == 51.0
+    assert conn.execute("SELECT COUNT(*) FROM customers WHERE customer_id = 99999").fetchone()[0] == 1
+    hwm = create_database.get_high_water_mark(conn, "daily_drop.csv")
+    assert hwm == "2010-03-11 11:00:00"
+    conn.close()
+    print("[SUCCESS] Incremental ingest appended only the delta")
@@ -0,0 +1,89 @@
+import re
+import sqlite3
+
+import chat_engine
+import create_database
+import db_migrations
+import forecasting_engine
+import query_backend
+import schema
+from backend import main
+
+# The analytics queries behind backend/main.py, forecasting_engine and chat_engine, with representative parameters
+HOT_QUERIES = {
+    "revenue_by_country": (main.REVENUE_BY_COUNTRY_SQL, {}),
+    "monthly_sales": (main.MONTHLY_SALES_SQL, {}),
+    **{name: (query["sqlite"], {"limit": 10}) for name, query in query_backend.QUERIES.items()},
+    "sales_data": (forecasting_engine.SALES_DATA_SQL.format(where=""), {}),
+    "sales_data_in_country": (forecasting_engine.SALES_DATA_SQL.format(where="WHERE country = ?"), ("France",)),
+    **{f"chat_{name}": (sql, {"start": "2010-01-01", "end": "2011-01-01", "start_ts": schema.to_epoch("2010-01-01"),
+                              "end_ts": schema.to_epoch("2011-01-01"), "country": "France", "limit": 10,
+                              "stock_code": "85123A", "customer_id": 12346})
+       for name, sql in chat_engine.QUERY_TEMPLATES.items()},
+}
+
+def test_migrations_bring_db_to_latest_version(sample_db):
+    conn = sqlite3.connect(sample_db)
+    latest = db_migrations.MIGRATIONS[-1][0]
+    assert db_migrations.get_schema_version(conn) == latest
+    # Re-running is a no-op
+    assert db_migrations.apply_migrations(conn) == []
+    conn.close()
+    print(f"[SUCCESS] Schema at version {latest}")
+
+def test_migrations_apply_to_existing_db(tmp_path, sample_csv):
+    # A database built before the migration layer existed
+    db_path = str(tmp_path / "legacy.db")
+    conn = create_database.create_connection(db_path)
+    create_database.create_tables(conn)
+    create_database.load_data_to_db(conn, sample_csv)
+    rows_before = conn.execute("SELECT COUNT(*) FROM invoice_items").fetchone()[0]
+    assert db_migrations.get_schema_version(conn) == 0
+
+    applied = db_migrations.apply_migrations(conn)
+    assert applied == [v for v, _, _ in db_migrations.MIGRATIONS]
+    indexes = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {"idx_invoice_items_invoice", "idx_invoices_date", "idx_invoices_country"} <= indexes
+    assert conn.execute("SELECT COUNT(*) FROM invoice_items").fetchone()[0] == rows_before
+    conn.close()
+    print("[SUCCESS] Migrations applied in place")
+
+def test_legacy_layout_is_converted_in_place(tmp_path, sample_db):
+    # The same rows in the original layout: text keys, REAL prices and customer ids, text dates
+    db_path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(db_path)
+    for statement in schema.LEGACY_TABLES_SQL:
+        conn.execute(statement)
+    conn.execute("ATTACH DATABASE ? AS src", (sample_db,))
+    conn.executescript("""
+        INSERT INTO customers SELECT customer_id FROM src.customers;
+        INSERT INTO products SELECT stock_code, description FROM src.products;
+        INSERT INTO invoices SELECT DISTINCT invoice_id, customer_id, invoice_date, country FROM src.transactions_view;
+        INSERT INTO invoice_items (invoice_id, stock_code, quantity, price)
+            SELECT invoice_id, stock_code, quantity, price FROM src.transactions_view;
+    """)
+    conn.commit()
+    conn.execute("DETACH DATABASE src")
+    view = "SELECT * FROM transactions_view ORDER BY invoice_id, stock_code, quantity"
+    before = conn.execute(view).fetchall()
+    assert schema.is_legacy_layout(conn)
+
+    db_migrations.apply_migrations(conn)
+    assert not schema.is_legacy_layout(conn)
+    assert conn.execute(view).fetchall() == before
+    assert conn.execute("SELECT typeof(price_cents), typeof(invoice_ts) FROM invoice_items, invoices LIMIT 1").fetchone() \
+        == ("integer", "integer")
+    assert conn.execute("SELECT COUNT(*) FROM countries").fetchone()[0] == 4
+    assert conn.execute("SELECT COUNT(*) FROM daily_sales").fetchone()[0] > 0
+    conn.close()
+    print(f"[SUCCESS] {len(before)} line items converted to the compact layout, view unchanged")
+
+def test_hot_queries_do_not_full_scan(sample_db):
+    conn = sqlite3.connect(sample_db)
+    for name, (query, params) in HOT_QUERIES.items():
+        plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + query, params)]
+        # Any scan of the line items, including a full scan of one of their indexes
+        full_scans = [step for step in plan if re.match(r"SCAN (invoice_items|ii)\b", step)]
+        assert not full_scans, f"{name} falls back to a full scan: {plan}"
+        print(f"[SUCCESS] {name}: {plan}")
+    conn.close()
@@ -0,0 +1,113 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import httpx
+
+import numpy as np
+
+import create_database
+import forecast_backtest
+import forecasting_engine
+from conftest import sample_rows, write_csv
+
+def test_forecast_fit_cached_persisted_and_warm_started(sample_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(forecasting_engine, "DB_PATH", sample_db)
+    monkeypatch.setattr(forecasting_engine, "FORECAST_MODEL_DIR", str(tmp_path / "models"))
+    monkeypatch.setattr(forecasting_engine, "_fit_cache", forecasting_engine.OrderedDict())
+    monkeypatch.setattr(forecasting_engine, "FORECAST_CANDIDATES", ["hw_additive"])
+    fits = []
+    fit_model = forecasting_engine.fit_model
+
+    def recording_fit_model(*args):
+        result = fit_model(*args)
+        fits.append(result[2])
+        return result
+    monkeypatch.setattr(forecasting_engine, "fit_model", recording_fit_model)
+
+    first = forecasting_engine.generate_forecast(30)
+    longer = forecasting_engine.generate_forecast(45)
+    assert fits == ["full"]
+    assert len(longer) == len(first) + 15
+    np.testing.assert_allclose(longer["Forecast"].dropna().values[:30], first["Forecast"].dropna().values)
+
+    # A restart rebuilds the fit from the saved parameters without optimizing
+    forecasting_engine._fit_cache.clear()
+    reloaded = forecasting_engine.generate_forecast(30)
+    assert fits[-1] == "loaded"
+    np.testing.assert_allclose(reloaded["Forecast"].dropna().values, first["Forecast"].dropna().values)
+
+    # New days appended -> warm start from the previous parameters
+    last_day = first["revenue"].dropna().index[-1].to_pydatetime()
+    drop = sample_rows(n_invoices=14, start=last_day + timedelta(days=1, hours=9))
+    for row in drop:  # new invoice numbers, so the incremental ingest keeps them
+        row[0] = "7" + row[0][1:]
+    create_database.build_database(sample_db, write_csv(tmp_path / "drop.csv", drop), incremental=True)
+    assert len(forecasting_engine.generate_forecast(30)) == len(first) + 7
+    assert fits[-1] == "warm"
+    print("[SUCCESS] Forecast fits are cached, persisted and warm-started")
+
+def test_forecast_model_selected_by_backtest(sample_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(forecasting_engine, "DB_PATH", sample_db)
+    monkeypatch.setattr(forecasting_engine, "FORECAST_MODEL_DIR", str(tmp_path / "models"))
+    monkeypatch.setattr(forecasting_engine, "_fit_cache", forecasting_engine.OrderedDict())
+    backtests = []
+    backtest = forecast_backtest.backtest
+    monkeypatch.setattr(forecast_backtest, "backtest", lambda *a, **k: backtests.append(1) or backtest(*a, **k))
+
+    df, model, name = forecasting_engine.get_fitted_model()
+    summary, scores = backtest(df["revenue"].values, forecast_backtest.CANDIDATES, horizon=14)
+    assert name == forecast_backtest.select_models(scores)[0]
+    assert len(forecasting_engine.generate_forecast(10)["Forecast"].dropna()) == 10
+
+    # The selection is kept per data version, so a restart does not backtest again
+    forecasting_engine._fit_cache.clear()
+    assert forecasting_engine.get_fitted_model()[2] == name and len(backtests) == 1
+    print("[SUCCESS] The forecast model is selected by backtest and the choice is persisted")
+
+def test_forecast_endpoint_coalesces_identical_requests(api_client, sample_db, tmp_path, monkeypatch):
+    from backend import main
+    monkeypatch.setattr(forecasting_engine, "DB_PATH", sample_db)
+    monkeypatch.setattr(forecasting_engine, "FORECAST_MODEL_DIR", str(tmp_path / "models"))
+    monkeypatch.setattr(forecasting_engine, "_fit_cache", forecasting_engine.OrderedDict())
+    monkeypatch.setattr(forecasting_engine, "FORECAST_CANDIDATES", ["hw_additive"])
+    monkeypatch.setattr(main, "forecast_coalescer", main.RequestCoalescer())
+    fits = []
+    fit_model = forecasting_engine.fit_model
+    monkeypatch.setattr(forecasting_engine, "fit_model", lambda *a: fits.append(1) or fit_model(*a))
+
+    async def burst():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*[client.get("/analytics/forecast", params={"days": 14}) for _ in range(100)])
+    responses = asyncio.run(burst())
+    assert {r.status_code for r in responses} == {200} and len({r.content for r in responses}) == 1
+    assert len(fits) == 1 and main.forecast_coalescer.executions == 1 and main.forecast_coalescer.coalesced > 0
+
+    body = responses[0].json()
+    assert body["model"] == "hw_additive" and len(body["forecast"]) == 14
+    assert all(0 <= day["lower"] <= day["forecast"] <= day["upper"] for day in body["forecast"])
+    assert len(api_client.get("/analytics/forecast", params={"series": "country=France", "days": 7}).json()["forecast"]) == 7
+    assert api_client.get("/analytics/forecast", params={"series": "product=85123A"}).status_code == 400
+    print("[SUCCESS] /analytics/forecast runs one fit for a burst of identical requests")
+
+def test_different_series_fit_in_parallel(sample_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(forecasting_engine, "DB_PATH", sample_db)
+    monkeypatch.setattr(forecasting_engine, "FORECAST_MODEL_DIR", str(tmp_path / "models"))
+    monkeypatch.setattr(forecasting_engine, "_fit_cache", forecasting_engine.OrderedDict())
+    monkeypatch.setattr(forecasting_engine, "FORECAST_CANDIDATES", ["hw_additive"])
+    # Both fits must be in progress at once to pass the barrier; serialized fits would time out
+    barrier = threading.Barrier(2, timeout=10)
+    get_sales_data = forecasting_engine.get_sales_data
+
+    def meeting_get_sales_data(country):
+        barrier.wait()
+        return get_sales_data(country)
+    monkeypatch.setattr(forecasting_engine, "get_sales_data", meeting_get_sales_data)
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        fitted = list(pool.map(forecasting_engine.get_fitted_model, ["total", "country=United Kingdom"]))
+    assert [model for _, _, model in fitted] == ["hw_additive", "hw_additive"]
+    assert len(forecasting_engine._fit_cache) == 2
+    print("[SUCCESS] Different series are fitted concurrently")
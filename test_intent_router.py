@@ -0,0 +1,49 @@
+import json
+import os
+import sqlite3
+from datetime import date
+
+import intent_router
+from conftest import PRODUCTS
+
+FIXTURE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks", "chat_questions.json")
+
+def test_labeled_questions_are_routed_correctly():
+    with open(FIXTURE_PATH, encoding="utf-8") as f:
+        fixture = json.load(f)
+    entities = fixture["entities"]
+    router = intent_router.IntentRouter(entities["countries"], [tuple(p) for p in entities["products"]],
+                                        entities["customers"], date.fromisoformat(entities["latest_date"]))
+    wrong = []
+    for q in fixture["questions"]:
+        routed = router.route(q["question"])
+        got = (routed["intent"], routed["slots"]) if routed else (None, {})
+        if got != (q["intent"], q["slots"]):
+            wrong.append((q["question"], got))
+    assert not wrong, wrong
+    print(f"[SUCCESS] All {len(fixture['questions'])} labeled questions routed to the right intent and slots")
+
+def test_date_ranges_and_entities():
+    router = intent_router.IntentRouter(["United Kingdom"], PRODUCTS, [12346], date(2011, 3, 31))
+    slots = router.route("sales last 1 month")["slots"]
+    assert (slots["start"], slots["end"]) == ("2011-03-01", "2011-04-01")
+    slots = router.route("sales in may")["slots"]  # the latest May on or before the latest invoice
+    assert (slots["start"], slots["end"]) == ("2010-05-01", "2010-06-01")
+    assert intent_router.months_before(date(2011, 3, 31), 1) == date(2011, 2, 28)
+    # The longest entity phrase wins, and stock codes are recognised
+    trie = intent_router.EntityTrie()
+    trie.add("jumbo bag", "short")
+    trie.add("jumbo bag pink polkadot", "long")
+    assert trie.scan(intent_router.tokenize("a Jumbo Bag Pink Polkadot please")) == [("long", 1, 5)]
+    assert router.route("84029g sales")["slots"]["product"] == "84029G"
+    print("[SUCCESS] Date slots resolve against the latest invoice date; entities match longest-first")
+
+def test_router_loads_entities_from_database(sample_db):
+    conn = sqlite3.connect(sample_db)
+    router = intent_router.IntentRouter.from_connection(conn)
+    conn.close()
+    routed = router.route("how many white metal lantern sold in germany")
+    assert routed["intent"] == "product_sales"
+    assert routed["slots"]["product"] == "71053" and routed["slots"]["country"] == "Germany"
+    assert router.latest_date.year == 2010
+    print("[SUCCESS] Router dictionaries are loaded from the database")
@@ -0,0 +1,69 @@
+import itertools
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+from mlxtend.frequent_patterns import apriori, association_rules
+from scipy import sparse
+
+import itemset_miner
+
+def random_baskets(n_rows=400, n_items=14, seed=7):
+    """Baskets with a few correlated item groups, so there are itemsets of length 3-4."""
+    rng = np.random.default_rng(seed)
+    dense = rng.random((n_rows, n_items)) < 0.15
+    for group in ([0, 1, 2], [3, 4, 5, 6], [7, 8]):
+        buyers = rng.random(n_rows) < 0.3
+        dense[np.ix_(buyers, group)] |= rng.random((buyers.sum(), len(group))) < 0.8
+    return sparse.csr_matrix(dense)
+
+def as_dict(frame, key_cols, value_cols):
+    return {tuple(row[c] for c in key_cols): tuple(row[c] for c in value_cols) for _, row in frame.iterrows()}
+
+def test_same_itemsets_and_rules_as_mlxtend():
+    matrix = random_baskets()
+    labels = [f"P{j}" for j in range(matrix.shape[1])]
+    frame = pd.DataFrame(matrix.toarray(), columns=labels)
+
+    for min_support in (0.05, 0.1, 0.2):
+        ours = itemset_miner.frequent_itemsets(matrix, min_support, columns=labels)
+        theirs = apriori(frame, min_support=min_support, use_colnames=True)
+        assert len(ours) == len(theirs)
+        expected = dict(zip(theirs["itemsets"], theirs["support"]))
+        for itemset, support in zip(ours["itemsets"], ours["support"]):
+            assert support == pytest.approx(expected[itemset])
+
+        our_rules = itemset_miner.association_rules(ours, min_lift=1.0)
+        their_rules = association_rules(theirs, metric="lift", min_threshold=1.0)
+        keys, values = ["antecedents", "consequents"], ["support", "confidence", "lift"]
+        ours_by_key, theirs_by_key = as_dict(our_rules, keys, values), as_dict(their_rules, keys, values)
+        assert ours_by_key.keys() == theirs_by_key.keys()
+        for key, value in ours_by_key.items():
+            assert value == pytest.approx(theirs_by_key[key])
+    print("[SUCCESS] Eclat finds the same itemsets and rules as mlxtend apriori")
+
+def test_max_len_and_budget():
+    matrix = random_baskets()
+    capped = itemset_miner.frequent_itemsets(matrix, 0.05, max_len=2)
+    assert capped["itemsets"].map(len).max() == 2
+    with pytest.raises(itemset_miner.MiningBudgetExceeded):
+        itemset_miner.frequent_itemsets(matrix, 0.01, max_itemsets=10)
+    with pytest.raises(itemset_miner.MiningBudgetExceeded):
+        itemset_miner.frequent_itemsets(matrix, 0.001, max_seconds=0)
+    print("[SUCCESS] max_len and the mining budget are enforced")
+
+def test_time_budget_is_checked_while_nothing_is_found(monkeypatch):
+    # Dense baskets where every pair of items is frequent but no triple is: nearly all of the work is
+    # intersections that find nothing, between few frequent itemsets
+    rng = np.random.default_rng(3)
+    matrix = sparse.csr_matrix(rng.random((2000, 30)) < 0.5)
+    assert len(itemset_miner.frequent_itemsets(matrix, 0.2)) == 30 + 30 * 29 // 2
+
+    # A clock that advances one second each time it is read: the budget outlasts one reading per
+    # itemset found, but not one per intersection
+    ticks = itertools.count()
+    monkeypatch.setattr(itemset_miner, "time", SimpleNamespace(perf_counter=lambda: next(ticks)))
+    with pytest.raises(itemset_miner.MiningBudgetExceeded):
+        itemset_miner.frequent_itemsets(matrix, 0.2, max_seconds=1000)
+    print("[SUCCESS] The mining time budget is enforced between candidate intersections")
@@ -0,0 +1,80 @@
+import sqlite3
+import sys
+
+import create_database
+from backend import database, main
+from backend.jobs import JobConflict, JobManager
+from conftest import sample_rows, write_csv
+
+def test_rebuild_keeps_open_readers_consistent(sample_db, tmp_path):
+    reader = sqlite3.connect(sample_db, isolation_level=None)
+    reader.execute("BEGIN")
+    before = reader.execute("SELECT COUNT(*) FROM invoices").fetchone()[0]
+
+    phases = []
+    smaller = write_csv(tmp_path / "smaller.csv", sample_rows(n_invoices=30))
+    create_database.rebuild_database(sample_db, smaller, chunk_size=50,
+                                     progress=lambda phase, rows: phases.append(phase))
+
+    # A reader that was mid-transaction keeps its snapshot; new readers see the new data
+    assert reader.execute("SELECT COUNT(*) FROM invoices").fetchone()[0] == before
+    reader.execute("COMMIT")
+    assert reader.execute("SELECT COUNT(*) FROM invoices").fetchone()[0] == 30
+    reader.close()
+    assert phases[0] == "loading" and phases[-2:] == ["publishing", "done"]
+    assert not (tmp_path / "sales_analysis.db.building").exists()
+    print("[SUCCESS] Rebuild published atomically under an open reader")
+
+def test_one_job_at_a_time():
+    manager = JobManager()
+    job = manager.submit("rebuild", [sys.executable, "-c", "import time; time.sleep(1)"])
+    try:
+        manager.submit("rebuild", [sys.executable, "-c", "pass"])
+        assert False, "expected JobConflict"
+    except JobConflict:
+        pass
+    assert manager.wait(job["id"], timeout=30)["status"] == "succeeded"
+
+    failed = manager.submit("rebuild", [sys.executable, "-c", "raise SystemExit('boom')"])
+    failed = manager.wait(failed["id"], timeout=30)
+    assert failed["status"] == "failed" and failed["error"] == "boom"
+    print("[SUCCESS] Job manager runs one job at a time and reports failures")
+
+def test_failed_job_stops_its_process(tmp_path):
+    # A malformed progress line fails the job; the child must be gone before the next job can start
+    marker = tmp_path / "still_running"
+    script = (f"import time; print('PROGRESS not-json', flush=True); time.sleep(2); "
+              f"open({str(marker)!r}, 'w').close()")
+    manager = JobManager()
+    job = manager.wait(manager.submit("rebuild", [sys.executable, "-c", script])["id"], timeout=30)
+    assert job["status"] == "failed"
+    manager.wait(manager.submit("rebuild", [sys.executable, "-c", "import time; time.sleep(3)"])["id"], timeout=30)
+    assert not marker.exists()
+    print("[SUCCESS] A failed job kills its process before releasing the slot")
+
+def test_rebuild_fails_cleanly_without_a_database(tmp_path, sample_csv, monkeypatch):
+    monkeypatch.setattr(create_database, "create_connection", lambda path: None)
+    try:
+        create_database.rebuild_database(str(tmp_path / "live.db"), sample_csv)
+        assert False, "expected RuntimeError"
+    except RuntimeError:
+        pass
+    assert not (tmp_path / "live.db").exists()
+    print("[SUCCESS] A build that cannot open its database fails without publishing")
+
+def test_rebuild_endpoint_reports_progress(api_client, sample_db, sample_csv, monkeypatch):
+    monkeypatch.setattr(database, "DB_PATH", sample_db)
+    monkeypatch.setattr(main, "REBUILD_SOURCE_PATH", sample_csv)
+
+    response = api_client.post("/system/rebuild-database")
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+    assert api_client.post("/system/rebuild-database").status_code == 409
+
+    main.job_manager.wait(job_id, timeout=60)
+    job = api_client.get(f"/system/jobs/{job_id}").json()
+    assert job["status"] == "succeeded", job
+    assert job["phase"] == "done" and job["rows_processed"] == len(sample_rows())
+    assert api_client.get("/stats/revenue/by-country").status_code == 200
+    assert api_client.get("/system/jobs/unknown").status_code == 404
+    print("[SUCCESS] Rebuild endpoint returns a job id and reports progress")
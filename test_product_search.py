@@ -0,0 +1,36 @@
+import sqlite3
+
+import create_database
+import product_search
+from conftest import write_csv
+
+def test_prefix_search_ranked_by_units_sold(sample_db):
+    conn = sqlite3.connect(sample_db)
+    results = product_search.search_products(conn, "whit hang")
+    assert [r["stock_code"] for r in results] == ["85123A"]
+
+    bags = product_search.search_products(conn, "bag")
+    assert {r["stock_code"] for r in bags} == {"20725", "22386"}
+    assert bags[0]["units_sold"] >= bags[1]["units_sold"]
+
+    assert product_search.search_products(conn, "84406")[0]["description"] == "CREAM CUPID HEARTS COAT HANGER"
+    assert product_search.search_products(conn, "  -- ") == []
+    conn.close()
+    print(f"[SUCCESS] {bags}")
+
+def test_search_index_follows_ingest(tmp_path, sample_db):
+    drop = [["600001", "90001", "VINTAGE GLASS TEA LIGHT", 5, "2010-03-01 10:00:00", 1.95, 12346, "France"]]
+    create_database.build_database(sample_db, write_csv(tmp_path / "drop.csv", drop), incremental=True)
+
+    conn = sqlite3.connect(sample_db)
+    results = product_search.search_products(conn, "vint tea")
+    assert results == [{"stock_code": "90001", "description": "VINTAGE GLASS TEA LIGHT", "units_sold": 5}]
+    conn.close()
+    print("[SUCCESS] New products are searchable after an incremental ingest")
+
+def test_search_endpoint_paginates(api_client):
+    first = api_client.get("/search/products/h?limit=2").json()
+    second = api_client.get("/search/products/h?limit=2&offset=2").json()
+    assert len(first) == 2 and second
+    assert not {r["stock_code"] for r in first} & {r["stock_code"] for r in second}
+    print(f"[SUCCESS] {first}")
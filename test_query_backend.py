@@ -0,0 +1,82 @@
+import sqlite3
+
+import pytest
+
+import analytics_snapshot
+import create_database
+import query_backend
+from conftest import write_csv
+
+duckdb = pytest.importorskip("duckdb")
+
+@pytest.fixture
+def snapshot(tmp_path, sample_db, monkeypatch):
+    path = str(tmp_path / "snapshot")
+    monkeypatch.setattr(analytics_snapshot, "SNAPSHOT_PATH", path)
+    return analytics_snapshot.export_snapshot(sample_db, path)
+
+def typed(row):
+    # 12346.0 == 12346, so compare the Python types too
+    return [(type(value), value) for value in row]
+
+def assert_same_rows(got, expected):
+    # Both backends sum integer cents, so totals match exactly, not just up to float summation order
+    assert [typed(row) for row in got] == [typed(row) for row in expected]
+
+@pytest.mark.parametrize("name", sorted(query_backend.QUERIES))
+@pytest.mark.parametrize("limit", [1, 5, 1000])
+def test_backends_return_identical_results(sample_db, snapshot, name, limit):
+    conn = sqlite3.connect(sample_db)
+    assert query_backend.resolve_backend(conn, "duckdb") == "duckdb"
+    conn.close()
+
+    expected = query_backend.run(name, {"limit": limit}, sample_db, "sqlite")
+    got = query_backend.run(name, {"limit": limit}, sample_db, "duckdb")
+    assert expected and len(expected) <= limit
+    assert_same_rows(got, expected)
+    print(f"[SUCCESS] {name} (limit {limit}) matches across SQLite and DuckDB")
+
+def test_backends_agree_to_the_cent(tmp_path, sample_db, monkeypatch):
+    # Prices that are not exact in binary floating point, so summing quantity * price in float64 drifts
+    drop = [[f"70{k:04d}", "22423", "REGENCY CAKESTAND 3 TIER", 3, "2011-03-01 10:00:00", [0.1, 0.7, 1.15][k % 3],
+             12346 + k % 2, "France"] for k in range(300)]
+    create_database.build_database(sample_db, write_csv(tmp_path / "drop.csv", drop), incremental=True)
+    path = str(tmp_path / "snapshot")
+    monkeypatch.setattr(analytics_snapshot, "SNAPSHOT_PATH", path)
+    analytics_snapshot.export_snapshot(sample_db, path)
+
+    for name in sorted(query_backend.QUERIES):
+        expected = query_backend.run(name, {"limit": 1000}, sample_db, "sqlite")
+        assert_same_rows(query_backend.run(name, {"limit": 1000}, sample_db, "duckdb"), expected)
+    print("[SUCCESS] SQLite and DuckDB totals are exactly equal")
+
+def test_stale_snapshot_falls_back_to_sqlite(tmp_path, sample_db, snapshot):
+    drop = [["700001", "22423", "REGENCY CAKESTAND 3 TIER", 500, "2011-03-01 10:00:00", 12.75, 12346, "France"]]
+    create_database.build_database(sample_db, write_csv(tmp_path / "drop.csv", drop), incremental=True)
+
+    conn = sqlite3.connect(sample_db)
+    assert query_backend.resolve_backend(conn, "duckdb") == "sqlite"
+    with pytest.raises(ValueError):
+        query_backend.resolve_backend(conn, "postgres")
+    conn.close()
+    # The new order is reflected although the snapshot predates it
+    top = query_backend.run("top_customers", {"limit": 1}, sample_db, "duckdb")
+    assert top[0][0] == 12346 and top[0][1] >= 500 * 12.75
+    print("[SUCCESS] A stale snapshot routes analytic queries back to SQLite")
+
+def test_endpoints_use_the_configured_backend(api_client, sample_db, snapshot, monkeypatch):
+    from backend import database, main
+
+    expected = {path: api_client.get(path).json() for path in ("/analytics/top-customers", "/analytics/top-products?limit=5")}
+    calls, run_duckdb = [], query_backend._run_duckdb
+    monkeypatch.setattr(query_backend, "BACKEND", "duckdb")
+    monkeypatch.setattr(database, "DB_PATH", sample_db)
+    monkeypatch.setattr(query_backend, "_run_duckdb", lambda *args: calls.append(args) or run_duckdb(*args))
+    main.response_cache.clear()
+
+    for path, rows in expected.items():
+        got = api_client.get(path).json()
+        assert_same_rows([tuple(row.values()) for row in got], [tuple(row.values()) for row in rows])
+    assert len(calls) == 2
+    assert set(expected["/analytics/top-products?limit=5"][0]) == {"stock_code", "description", "revenue"}
+    print("[SUCCESS] Top customers/products endpoints run on DuckDB when configured")
@@ -0,0 +1,142 @@
+import sqlite3
+from datetime import datetime
+
+import create_database
+import recommender_engine
+from conftest import PRODUCTS, sample_rows, write_csv
+
+def test_sparse_basket_matches_line_items(sample_db):
+    conn = sqlite3.connect(sample_db)
+    matrix, invoice_ids, stock_codes = recommender_engine.build_basket_matrix(conn)
+    pairs = set(conn.execute("SELECT invoice_id, stock_code FROM transactions_view WHERE quantity > 0").fetchall())
+    rows, cols = matrix.nonzero()
+    assert {(invoice_ids[r], stock_codes[c]) for r, c in zip(rows, cols)} == pairs
+    assert matrix.dtype == bool and matrix.shape == (120, len(PRODUCTS))
+
+    # max_products keeps the most frequently bought codes
+    top, _, top_codes = recommender_engine.build_basket_matrix(conn, max_products=6)
+    conn.close()
+    assert top.shape == (120, 6)
+    assert set(top_codes) == {code for code, _ in PRODUCTS[:6]}
+    print("[SUCCESS] Sparse basket matrix matches the line items")
+
+def test_rules_from_sparse_basket(sample_db, monkeypatch):
+    monkeypatch.setattr(recommender_engine, "DB_PATH", sample_db)
+    basket, descriptions = recommender_engine.get_transaction_matrix()
+    assert hasattr(basket, "sparse")
+
+    rules = recommender_engine.generate_recommendations(min_support=0.1)
+    assert list(rules.columns) == ["antecedents", "consequents", "support", "confidence", "lift"]
+    # Products bought together on every even invoice predict each other
+    pair = rules[(rules.antecedents == PRODUCTS[0][1]) & (rules.consequents == PRODUCTS[1][1])]
+    assert len(pair) and pair.confidence.iloc[0] == 1.0
+    print("[SUCCESS] Rules are mined from the sparse basket and labelled with descriptions")
+
+def test_rules_model_persisted_and_retrained_on_new_data(sample_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(recommender_engine, "DB_PATH", sample_db)
+    monkeypatch.setattr(recommender_engine, "RULES_MODEL_PATH", str(tmp_path / "models" / "rules.json"))
+    trainings = []
+    train = recommender_engine.train_rules_model
+    monkeypatch.setattr(recommender_engine, "train_rules_model", lambda *a: trainings.append(1) or train(*a))
+
+    # Serving never mines
+    assert recommender_engine.get_rules_model() is None and not trainings
+    model = recommender_engine.refresh_rules_model(min_support=0.1)
+    assert recommender_engine.get_rules_model() is model
+    assert recommender_engine.refresh_rules_model(min_support=0.1) is model
+    recs = model.recommend(PRODUCTS[0][0], k=2)
+    assert len(recs) == 2 and recs[0]["confidence"] == 1.0
+    assert {r["stock_code"] for r in recs} == {PRODUCTS[1][0], PRODUCTS[2][0]}
+
+    # A fresh process loads the saved model instead of retraining
+    recommender_engine._loaded_models.clear()
+    assert recommender_engine.get_rules_model().data_version == model.data_version
+    assert len(trainings) == 1
+
+    # New data -> the old model is served until the refresh, which retrains once
+    create_database.build_database(sample_db, write_csv(tmp_path / "drop.csv", sample_rows(n_invoices=10,
+                                   start=datetime(2011, 1, 3, 9, 0))), incremental=True)
+    assert recommender_engine.get_rules_model().data_version == model.data_version
+    retrained = recommender_engine.refresh_rules_model(min_support=0.1)
+    assert retrained.data_version != model.data_version and len(trainings) == 2
+    assert recommender_engine.get_rules_model() is retrained
+    print("[SUCCESS] Rules model is persisted, served without mining and retrained on refresh")
+
+def test_ingest_job_trains_the_rules_model(sample_csv, tmp_path, monkeypatch):
+    db_path = str(tmp_path / "live.db")
+    monkeypatch.setattr(recommender_engine, "DB_PATH", db_path)
+    monkeypatch.setattr(recommender_engine, "RULES_MODEL_PATH", str(tmp_path / "models" / "rules.json"))
+    monkeypatch.setattr(recommender_engine, "RULES_MIN_SUPPORT", 0.1)
+    phases = []
+
+    create_database.main(sample_csv, chunk_size=50, db_path=db_path, progress=lambda phase, rows: phases.append(phase))
+    model = recommender_engine.load_rules_model()
+    assert model is not None and model.data_version == recommender_engine.current_data_version()
+    assert phases[-2:] == ["training", "done"]
+
+    # A build of another file leaves the model alone
+    create_database.main(sample_csv, chunk_size=50, db_path=str(tmp_path / "other.db"))
+    assert recommender_engine.load_rules_model().data_version == model.data_version
+    print("[SUCCESS] Rebuilds train the rules model the API serves")
+
+def test_recommendations_endpoint(api_client, sample_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(recommender_engine, "DB_PATH", sample_db)
+    monkeypatch.setattr(recommender_engine, "RULES_MODEL_PATH", str(tmp_path / "rules.json"))
+    monkeypatch.setattr(recommender_engine, "RULES_MIN_SUPPORT", 0.1)
+
+    # No model yet: not ready, rather than mining inside the request
+    assert api_client.get(f"/recommendations/{PRODUCTS[3][0]}").status_code == 503
+    assert api_client.post("/recommendations/basket", json={"items": [PRODUCTS[3][0]]}).status_code == 503
+    recommender_engine.refresh_rules_model()
+
+    body = api_client.get(f"/recommendations/{PRODUCTS[3][0]}", params={"k": 1}).json()
+    assert body["description"] == PRODUCTS[3][1]
+    assert len(body["recommendations"]) == 1 and body["recommendations"][0]["confidence"] == 1.0
+    assert api_client.get("/recommendations/NOPE").json()["recommendations"] == []
+
+    cart = [PRODUCTS[3][0], PRODUCTS[4][0]]
+    body = api_client.post("/recommendations/basket", json={"items": cart, "k": 3}).json()
+    assert body["recommendations"][0]["stock_code"] == PRODUCTS[5][0]
+    assert body["recommendations"][0]["because"] == sorted(cart)
+    print("[SUCCESS] /recommendations/{stock_code} and /recommendations/basket serve suggestions")
+
+def test_basket_scoring_uses_multi_item_rules():
+    rules = [
+        (("A",), ("C",), 0.4, 1.1, 0.1),
+        (("A", "B"), ("C",), 0.9, 2.0, 0.05),
+        (("A", "B"), ("D", "E"), 0.5, 3.0, 0.05),
+        (("B", "Z"), ("F",), 0.99, 5.0, 0.01),
+        (("A",), ("B",), 0.8, 1.5, 0.1),
+    ]
+    model = recommender_engine.RulesModel(rules, {"C": "Cup"}, "v1", {})
+    recs = model.recommend_basket(["B", "A", "X"], k=3)
+    # The two-item antecedent beats the single-item one; B is already in the cart; Z is not, so no F
+    assert [r["stock_code"] for r in recs] == ["C", "D", "E"]
+    assert recs[0]["because"] == ["A", "B"] and recs[0]["confidence"] == 0.9
+    assert model.recommend("A", k=5)[0]["stock_code"] == "B"
+    assert recommender_engine.RulesModel.from_dict(model.to_dict()).recommend_basket(["A", "B"]) == \
+        model.recommend_basket(["A", "B"])
+    print("[SUCCESS] Basket scoring walks the antecedent trie")
+
+def test_partitioned_training(sample_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(recommender_engine, "DB_PATH", sample_db)
+    monkeypatch.setattr(recommender_engine, "RULES_MODEL_PATH", str(tmp_path / "models" / "rules.json"))
+
+    summary, skipped = recommender_engine.train_partitioned_models("country", min_support=0.1,
+                                                                   min_invoices=25, workers=2)
+    conn = sqlite3.connect(sample_db)
+    counts = dict(conn.execute("SELECT country, COUNT(DISTINCT invoice_id) FROM transactions_view GROUP BY country").fetchall())
+    conn.close()
+    assert set(summary) == {c for c, n in counts.items() if n >= 25}
+    assert set(skipped) == {c for c, n in counts.items() if n < 25}
+
+    # Each partition is mined on its own invoices only and saved as its own model
+    model = recommender_engine.load_rules_model(recommender_engine.partition_model_path("country", "United Kingdom"))
+    assert summary["United Kingdom"]["invoices"] == counts["United Kingdom"]
+    assert model.params["partition"] == ["country", "United Kingdom"] and model.rules
+    try:
+        recommender_engine.train_partitioned_models("description")
+        assert False, "expected ValueError"
+    except ValueError:
+        pass
+    print("[SUCCESS] Per-country rule sets are mined in a process pool")
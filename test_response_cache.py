@@ -0,0 +1,72 @@
+from starlette.requests import Request
+
+from backend.cache import ResponseCache
+
+def make_request(path, query="", headers=None):
+    raw_headers = [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]
+    return Request({"type": "http", "method": "GET", "path": path, "query_string": query.encode(),
+                    "headers": raw_headers})
+
+def test_cache_lru_ttl_and_stamp():
+    now = [0.0]
+    stamp = ["v1"]
+    cache = ResponseCache(max_entries=2, ttl=10, stamp=lambda: stamp[0], clock=lambda: now[0])
+
+    assert cache.lookup(make_request("/a")) is None
+    cache.store(make_request("/a"), [1])
+    cache.store(make_request("/b", "limit=5"), [2])
+    assert cache.lookup(make_request("/a")).body == b"[1]"
+    # Query params are part of the key (order-insensitive)
+    assert cache.lookup(make_request("/b", "limit=6")) is None
+
+    # /a was used more recently than /b, so /b is evicted
+    cache.store(make_request("/c"), [3])
+    assert cache.lookup(make_request("/b", "limit=5")) is None
+    assert cache.lookup(make_request("/a")) is not None
+
+    # Data changes and TTL expiry both invalidate
+    stamp[0] = "v2"
+    assert cache.lookup(make_request("/a")) is None
+    cache.store(make_request("/a"), [1])
+    now[0] = 11
+    assert cache.lookup(make_request("/a")) is None
+    print(f"[SUCCESS] {cache.stats()}")
+
+def test_write_during_query_is_not_cached_as_current():
+    stamp = ["v1"]
+    cache = ResponseCache(stamp=lambda: stamp[0])
+
+    request = make_request("/a")
+    assert cache.lookup(request) is None
+    # An ingest commits after the lookup but before the handler stores its (now stale) result
+    stamp[0] = "v2"
+    cache.store(request, ["stale"])
+    assert cache.lookup(make_request("/a")) is None
+
+    request = make_request("/a")
+    assert cache.lookup(request) is None
+    cache.store(request, ["fresh"])
+    assert cache.lookup(make_request("/a")).body == b'["fresh"]'
+    print("[SUCCESS] Results of a query that raced a write are not served")
+
+def test_analytics_responses_are_cached_with_etags(api_client):
+    before = api_client.get("/system/cache-stats").json()
+    first = api_client.get("/analytics/monthly-sales")
+    assert first.status_code == 200
+    assert first.headers["X-Cache"] == "MISS"
+
+    second = api_client.get("/analytics/monthly-sales")
+    assert second.headers["X-Cache"] == "HIT"
+    assert second.json() == first.json()
+
+    revalidated = api_client.get("/analytics/monthly-sales", headers={"If-None-Match": first.headers["ETag"]})
+    assert revalidated.status_code == 304
+
+    other = api_client.get("/analytics/top-customers?limit=3")
+    assert other.headers["X-Cache"] == "MISS" and len(other.json()) == 3
+
+    stats = api_client.get("/system/cache-stats").json()
+    assert stats["hits"] - before["hits"] == 2
+    assert stats["misses"] - before["misses"] == 2
+    assert stats["not_modified"] - before["not_modified"] == 1
+    print(f"[SUCCESS] Cache stats: {stats}")
@@ -0,0 +1,77 @@
+import sqlite3
+
+import pandas as pd
+
+import create_database
+import rfm_engine
+from conftest import write_csv
+
+SEGMENTS = "SELECT * FROM customer_segments ORDER BY customer_id"
+
+def notebook_rfm(conn):
+    """The notebook's per-customer lambdas, as the reference."""
+    df = pd.read_sql("SELECT * FROM transactions_view", conn, parse_dates=["invoice_date"])
+    df["TotalPrice"] = df["quantity"] * df["price"]
+    snapshot_date = df["invoice_date"].max() + pd.Timedelta(days=1)
+    rfm = df.groupby("customer_id").agg({
+        "invoice_date": lambda x: (snapshot_date - x.max()).days,
+        "invoice_id": "nunique",
+        "TotalPrice": "sum",
+    })
+    rfm.columns = ["recency_days", "frequency", "monetary"]
+    rfm.index = rfm.index.astype("int64")
+    return rfm
+
+def test_segments_match_notebook_rfm(sample_db):
+    conn = sqlite3.connect(sample_db)
+    segments = pd.read_sql(SEGMENTS, conn).set_index("customer_id")
+    expected = notebook_rfm(conn)
+    conn.close()
+
+    pd.testing.assert_frame_equal(segments[expected.columns], expected, check_dtype=False, check_names=False)
+    for column in ("r_score", "f_score", "m_score"):
+        assert segments[column].between(1, rfm_engine.SCORE_BINS).all()
+    # Higher spend never gets a lower monetary score
+    ranked = segments.sort_values("monetary")
+    assert ranked["m_score"].is_monotonic_increasing
+    assert set(segments["segment"]) <= set(rfm_engine.SEGMENT_GRID.ravel())
+    print(f"[SUCCESS] RFM for {len(segments)} customers matches the notebook")
+
+def test_segments_refresh_on_incremental_ingest(tmp_path, sample_db):
+    drop = [
+        ["700001", "22423", "REGENCY CAKESTAND 3 TIER", 2, "2011-03-01 10:00:00", 12.75, 12346, "France"],
+        ["700001", "71053", "WHITE METAL LANTERN", 4, "2011-03-01 10:00:00", 3.39, 12346, "France"],
+        ["700002", "71053", "WHITE METAL LANTERN", 1, "2011-03-02 09:30:00", 3.39, 99999, "Spain"],
+    ]
+    create_database.build_database(sample_db, write_csv(tmp_path / "drop.csv", drop), incremental=True)
+
+    conn = sqlite3.connect(sample_db)
+    incremental = pd.read_sql(SEGMENTS, conn)
+    with conn:
+        rfm_engine.refresh_segments(conn)
+    full = pd.read_sql(SEGMENTS, conn)
+    conn.close()
+
+    pd.testing.assert_frame_equal(incremental, full)
+    new_customer = full.set_index("customer_id").loc[99999]
+    # The snapshot is the day after the newest invoice, so the latest buyer has recency 1
+    assert new_customer["recency_days"] == 1 and new_customer["frequency"] == 1
+    assert new_customer["r_score"] == rfm_engine.SCORE_BINS
+    print("[SUCCESS] Segments refreshed incrementally")
+
+def test_segment_endpoints(api_client, sample_db):
+    conn = sqlite3.connect(sample_db)
+    customers = conn.execute("SELECT COUNT(*) FROM customer_segments").fetchone()[0]
+    customer_id, segment = conn.execute("SELECT customer_id, segment FROM customer_segments LIMIT 1").fetchone()
+    conn.close()
+
+    summary = api_client.get("/customers/segments").json()
+    assert sum(s["customers"] for s in summary) == customers
+    members = api_client.get("/customers/segments", params={"segment": segment}).json()
+    assert customer_id in [m["customer_id"] for m in members]
+
+    response = api_client.get(f"/customers/{customer_id}/segment")
+    assert response.status_code == 200
+    assert response.json()["segment"] == segment
+    assert api_client.get("/customers/1/segment").status_code == 404
+    print(f"[SUCCESS] {len(summary)} segments served")
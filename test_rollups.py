@@ -0,0 +1,52 @@
+import sqlite3
+
+import create_database
+from conftest import write_csv
+
+BASE_MONTHLY = """
+    SELECT strftime('%Y-%m', invoice_date), ROUND(SUM(quantity * price), 6), SUM(quantity),
+           COUNT(*), COUNT(DISTINCT invoice_id), COUNT(DISTINCT customer_id)
+    FROM transactions_view
+    GROUP BY 1 ORDER BY 1
+"""
+ROLLUP_MONTHLY = """
+    SELECT month, ROUND(revenue, 6), units, line_items, invoices, customers FROM monthly_sales ORDER BY month
+"""
+BASE_DAILY = """
+    SELECT DATE(invoice_date), country, ROUND(SUM(quantity * price), 6)
+    FROM transactions_view
+    GROUP BY 1, 2 ORDER BY 1, 2
+"""
+ROLLUP_DAILY = "SELECT day, country, ROUND(revenue, 6) FROM daily_sales ORDER BY day, country"
+
+def test_rollups_match_base_tables(sample_db):
+    conn = sqlite3.connect(sample_db)
+    assert conn.execute(ROLLUP_MONTHLY).fetchall() == conn.execute(BASE_MONTHLY).fetchall()
+    assert conn.execute(ROLLUP_DAILY).fetchall() == conn.execute(BASE_DAILY).fetchall()
+    conn.close()
+    print("[SUCCESS] Rollups match the base tables")
+
+def test_rollups_refresh_on_incremental_ingest(tmp_path, sample_db):
+    drop = [
+        ["600001", "22423", "REGENCY CAKESTAND 3 TIER", 2, "2010-03-01 10:00:00", 12.75, 12346, "France"],
+        ["600002", "71053", "WHITE METAL LANTERN", 4, "2010-04-02 09:30:00", 3.39, 99999, "Spain"],
+    ]
+    create_database.build_database(sample_db, write_csv(tmp_path / "drop.csv", drop), incremental=True)
+
+    conn = sqlite3.connect(sample_db)
+    assert conn.execute(ROLLUP_MONTHLY).fetchall() == conn.execute(BASE_MONTHLY).fetchall()
+    assert conn.execute(ROLLUP_DAILY).fetchall() == conn.execute(BASE_DAILY).fetchall()
+    assert conn.execute("SELECT revenue FROM daily_sales WHERE day = '2010-04-02'").fetchone()[0] == 13.56
+    conn.close()
+    print("[SUCCESS] Rollups refreshed incrementally")
+
+def test_analytics_endpoints_read_rollups(api_client, sample_db):
+    conn = sqlite3.connect(sample_db)
+    expected_months = [row[0] for row in conn.execute(BASE_MONTHLY)]
+    conn.close()
+
+    data = api_client.get("/analytics/monthly-sales").json()
+    assert [d["month"] for d in data] == expected_months
+    countries = api_client.get("/stats/revenue/by-country").json()
+    assert countries[0]["country"] == "United Kingdom"
+    print(f"[SUCCESS] {len(data)} months served from monthly_sales")
@@ -0,0 +1,32 @@
+from sqlalchemy import event
+
+def test_keyset_pagination_walks_every_invoice_once(api_client):
+    statements = []
+    event.listen(api_client.db_engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    seen = []
+    cursor = None
+    pages = 0
+    while True:
+        params = {"limit": 7} if cursor is None else {"limit": 7, "cursor": cursor}
+        response = api_client.get("/transactions/page", params=params)
+        assert response.status_code == 200
+        page = response.json()
+        seen.extend((inv["invoice_date"], inv["invoice_id"]) for inv in page["items"])
+        pages += 1
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert len(seen) == 120 and len(set(seen)) == 120
+    assert seen == sorted(seen)
+    # One query for the invoices and one for their items + products, however deep the page
+    assert len(statements) == 2 * pages
+    print(f"[SUCCESS] {pages} pages, {len(statements)} statements")
+
+def test_transaction_items_include_product_description(api_client):
+    page = api_client.get("/transactions/page?limit=1").json()
+    items = page["items"][0]["items"]
+    assert items and all(item["description"] for item in items)
+    assert api_client.get("/transactions/page?cursor=not-a-cursor").status_code == 400
+    print(f"[SUCCESS] Items enriched: {items[0]}")
@@ -19,7 +19,7 @@ def verify_db():
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
         tables = cursor.fetchall()
         table_names = [t[0] for t in tables]
-        expected_tables = ['customers', 'products', 'invoices', 'invoice_items']
+        expected_tables = ['customers', 'countries', 'products', 'invoices', 'invoice_items']
         
         print(f"Tables found: {table_names}")
         